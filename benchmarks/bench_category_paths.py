@@ -0,0 +1,127 @@
+"""
+Сравнение построения путей категорий товаров green-dostavka.by:
+    recursive - как раньше: для каждой категории каждого товара рекурсивный подъём по родителям (get_parents)
+    table     - Product.set_categories: поиск в готовой таблице Categories.paths (parsers.green_dostavka_by.schemas.CategoryPaths)
+Дерево категорий берётся из аргумента (html страницы /catalog/ или .gz тело ответа), иначе - из дискового кеша паука
+(green_dostavka_by/http_cache в каталоге данных parsers.data_dir), а если там его нет - сгенерированное дерево той же структуры.
+    python -m benchmarks.bench_category_paths [path] [--products 5000] [--repeat 5]
+"""
+from parsers.green_dostavka_by.schemas import Categories, Product
+from parsers.next_data import extract_next_data
+from parsers.data_dir import data_path
+from pathlib import Path
+import argparse
+import gzip
+import json
+import pickle
+import random
+import timeit
+
+
+CACHE_DIR = data_path("green_dostavka_by", "http_cache")
+CATALOG_URL = "https://green-dostavka.by/catalog/"
+
+
+def read_document(path: Path) -> bytes:
+    if path.suffix == '.gz':
+        with gzip.open(path, 'rb') as f:
+            return f.read()
+    return path.read_bytes()
+
+
+def recorded_catalog() -> bytes | None:
+    for meta_path in CACHE_DIR.glob("*/*.json"):
+        try:
+            meta = json.loads(meta_path.read_text(encoding='utf-8'))
+            if meta.get('url') == CATALOG_URL:
+                return read_document(meta_path.with_suffix('.gz'))
+        except (OSError, ValueError, EOFError):
+            continue
+    return None
+
+
+def generated_catalog(roots: int = 20, children: int = 8, depth: int = 3) -> dict:
+    # данные __NEXT_DATA__ в том же формате, что и на сайте: дерево сериализовано как {__iterable: Map/List, data}
+    ids = iter(range(1, 10 ** 6))
+
+    def level(parent_id, current_depth, count):
+        items = []
+        for _ in range(count):
+            category_id = next(ids)
+            items.append({'id': category_id, 'parentId': parent_id, 'title': f'Категория {category_id}',
+                          'slug': f'c{category_id}', 'path': f'/catalog/c{category_id}', 'productsViewType': 'NORMAL',
+                          'children': {'__iterable': 'List', 'data': level(category_id, current_depth + 1, children)
+                                       if current_depth < depth else []}})
+        return items
+
+    tree = {'__iterable': 'List', 'data': level(None, 1, roots)}
+    return {'props': {'initialState': {'categories': {'data': [['catalog', tree]]}}}}
+
+
+def recursive_paths(categories: Categories, categories_ids: list[int]) -> list[list[str]]:
+    # прежний Product.set_categories: рекурсивный подъём по родителям для каждой категории товара
+    def get_parents(parent_id, parents_list):
+        parent = categories.categories[categories.cash_id[parent_id]]
+        parents_list.append(parent.name)
+        if parent.parentId:
+            return get_parents(parent.parentId, parents_list)
+        return parents_list
+
+    result = []
+    for category_id in categories_ids:
+        try:
+            category_item = categories.categories[categories.cash_id[category_id]]
+            product_categories = [category_item.name] + get_parents(category_item.parentId, [])
+            product_categories.reverse()
+            result.append(product_categories)
+        except KeyError:
+            continue
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('path', nargs='?')
+    parser.add_argument('--products', type=int, default=5000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    document = read_document(Path(args.path)) if args.path else recorded_catalog()
+    origin = 'recorded' if document else 'generated'
+    data = extract_next_data(document) if document else generated_catalog()
+
+    build_time = timeit.timeit(lambda: Categories(**data), number=args.repeat) / args.repeat
+    categories = Categories(**data)
+    dumped = pickle.dumps(categories)
+    assert dict(pickle.loads(dumped).paths) == dict(categories.paths)
+
+    # товар green-dostavka.by ссылается на все уровни своей категории: от корня до листа
+    random.seed(0)
+    products = []
+    for _ in range(args.products):
+        categories_ids = []
+        category = random.choice(categories.categories)
+        while category is not None:
+            categories_ids.insert(0, category.id)
+            index = categories.cash_id.get(category.parentId)
+            category = categories.categories[index] if index is not None else None
+        products.append(Product.model_construct(categoriesIds=categories_ids))
+
+    recursive = [recursive_paths(categories, product.categoriesIds) for product in products]
+    table = [[list(path) for path in product.set_categories(categories).categories_] for product in products]
+    # прежний путь пропускал корневые категории (get_parents(None) -> KeyError), таблица содержит и их
+    if recursive != [[path for path in paths if len(path) > 1] for paths in table]:
+        print("results differ!")
+
+    recursive_time = timeit.timeit(lambda: [recursive_paths(categories, product.categoriesIds) for product in products],
+                                   number=args.repeat) / args.repeat
+    table_time = timeit.timeit(lambda: [product.set_categories(categories) for product in products],
+                               number=args.repeat) / args.repeat
+    print(f"category tree: {len(categories.categories)} categories, {len(categories.paths)} paths ({origin})")
+    print(f"table build: {build_time * 1000:.1f} ms (with Categories validation), pickle {len(dumped) / 1024:.0f} KB")
+    print(f"{args.products} products: recursive {recursive_time * 1000:.1f} ms, table {table_time * 1000:.1f} ms, "
+          f"speedup {recursive_time / table_time:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+"""
+Сравнение извлечения __NEXT_DATA__: срез по байтам (parsers.next_data.extract_next_data) против полного разбора
+BeautifulSoup (parsers.next_data.parse_next_data).
+Страницы берутся из аргументов: html файлы, .gz тела ответов или каталоги. Без аргументов - страницы, записанные
+через --record, и страницы Next.js из дискового кеша пауков (<source>/http_cache в каталоге данных parsers.data_dir).
+Листинги edostavka.by с ценами паук не кеширует (HTTP_CACHE_RULES), поэтому реальные листинги нужно записать:
+    python -m benchmarks.bench_next_data --record https://edostavka.by/category/5010 [url ...]
+страницы сохраняются в benchmarks/next_data каталога данных (с заголовками и cookies, сохранёнными пауком, если они
+есть) и используются следующими запусками. Если страниц нет совсем - сгенерированная страница (об этом выводится
+предупреждение: результат на ней не заменяет замер на реальных листингах).
+    python -m benchmarks.bench_next_data [path ...] [--repeat 20] [--record url ...]
+"""
+from parsers.next_data import extract_next_data, parse_next_data
+from parsers.data_dir import data_dir, data_path
+from parsers.session_store import SessionStore
+from pathlib import Path
+from urllib.parse import urlparse
+import argparse
+import gzip
+import hashlib
+import json
+import requests
+import timeit
+
+
+RECORDED_DIR = data_path("benchmarks", "next_data")
+
+
+def read_document(path: Path) -> bytes:
+    if path.suffix == '.gz':
+        with gzip.open(path, 'rb') as f:
+            return f.read()
+    return path.read_bytes()
+
+
+def load_pages(paths: list[str]) -> list[tuple[str, bytes]]:
+    files = []
+    for path in map(Path, paths or [RECORDED_DIR, *data_dir().glob("*/http_cache")]):
+        if path.is_dir():
+            files.extend(sorted(path.rglob("*.gz")) + sorted(path.rglob("*.html")))
+        elif path.exists():
+            files.append(path)
+    pages = []
+    for path in files:
+        document = read_document(path)
+        if b'__NEXT_DATA__' in document:
+            pages.append((str(path), document))
+    return pages
+
+
+def record_pages(urls: list[str]) -> list[Path]:
+    # запись реальных страниц для замера. Заголовки и cookies - сохранённые пауком (parsers.session_store), если есть
+    RECORDED_DIR.mkdir(parents=True, exist_ok=True)
+    store = SessionStore()
+    recorded = []
+    for url in urls:
+        parsed = urlparse(url)
+        session = requests.Session()
+        bootstrap = store.load(f"{parsed.scheme}://{parsed.netloc}")
+        if bootstrap:
+            session.headers.update(bootstrap['headers'])
+            session.cookies.update({cookie['name']: cookie['value'] for cookie in bootstrap['cookies']})
+        try:
+            response = session.get(url, timeout=30)
+        except requests.RequestException as _ex:
+            print(f"record {url} -> error! {_ex}")
+            continue
+        if response.status_code != 200 or b'__NEXT_DATA__' not in response.content:
+            print(f"record {url} -> skipped (status {response.status_code}, no __NEXT_DATA__ or blocked)")
+            continue
+        key = hashlib.sha256(url.encode('utf-8')).hexdigest()[:16]
+        path = RECORDED_DIR / f"{parsed.netloc.replace(':', '_')}-{key}.html"
+        path.write_bytes(response.content)
+        print(f"record {url} -> {path} ({len(response.content) / 1024:.0f} KB)")
+        recorded.append(path)
+    return recorded
+
+
+def generated_page(products: int = 2000) -> bytes:
+    # страница, похожая на листинг Next.js: большая разметка и json с товарами в конце документа
+    data = {'props': {'pageProps': {'listing': {'products': [
+        {'productId': i, 'productName': f'Товар {i} <b>', 'price': {'discountedPrice': i / 10}}
+        for i in range(products)]}}}, 'page': '/category/[id]'}
+    markup = ''.join(f'<div class="card"><a href="/product/{i}">Товар {i}</a><span>{i / 10}</span></div>'
+                     for i in range(products))
+    payload = json.dumps(data, ensure_ascii=False).replace('<', '\\u003c')
+    return (f'<!DOCTYPE html><html><head><title>page</title></head><body><div id="__next">{markup}</div>'
+            f'<script id="__NEXT_DATA__" type="application/json">{payload}</script></body></html>').encode('utf-8')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('paths', nargs='*')
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--record', nargs='+', default=[], metavar='URL',
+                        help='загрузить и сохранить страницы для замера (например, листинги edostavka.by)')
+    args = parser.parse_args()
+
+    if args.record:
+        record_pages(args.record)
+    pages = load_pages(args.paths)
+    if pages:
+        print(f"source: {len(pages)} recorded pages")
+    else:
+        pages = [('generated page', generated_page())]
+        print("source: GENERATED page - no recorded pages found (add real listings with --record URL)")
+    total_fast = total_soup = 0.0
+    print(f"{'page':<60} {'size, KB':>9} {'slice, ms':>10} {'soup, ms':>10} {'speedup':>8}")
+    for name, document in pages:
+        if extract_next_data(document) != parse_next_data(document):
+            print(f"{name}: results differ!")
+            continue
+        fast = timeit.timeit(lambda: extract_next_data(document), number=args.repeat) / args.repeat
+        soup = timeit.timeit(lambda: parse_next_data(document), number=args.repeat) / args.repeat
+        total_fast += fast
+        total_soup += soup
+        print(f"{name[-60:]:<60} {len(document) / 1024:>9.0f} {fast * 1000:>10.2f} {soup * 1000:>10.2f} "
+              f"{soup / fast:>7.1f}x")
+    if total_fast:
+        print(f"total: {len(pages)} pages, slice {total_fast * 1000:.1f} ms, soup {total_soup * 1000:.1f} ms, "
+              f"speedup {total_soup / total_fast:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,301 @@
+"""
+Сравнение валидации ответа с деталями товара по каждому источнику:
+    before - как раньше: response.json() -> Model(**data) на прежних моделях с валидаторами mode="before"
+             (их копии ниже: extract_categories, transform_properties, preparing_data)
+    bytes  - parsers.validation.validate_json(Model, response.content) на текущих моделях
+             (pydantic-core разбирает json сам)
+Ответы берутся из дискового кеша пауков (<source>/http_cache в каталоге данных parsers.data_dir), если там есть
+записанные детали товаров, иначе - сгенерированные ответы той же структуры. Результаты обоих путей сравниваются
+(model_dump).
+    python -m benchmarks.bench_validation [--repeat 2000]
+"""
+from parsers.edostavka_by import schemas as edostavka_schemas
+from parsers.gippo_market_by import schemas as gippo_schemas
+from parsers.green_dostavka_by import schemas as green_schemas
+from parsers.validation import validate_json
+from parsers.data_dir import data_dir
+from pydantic import BaseModel, Field, model_validator
+from typing import List, Optional, Union
+import argparse
+import gzip
+import json
+import re
+import timeit
+
+
+# Прежние модели ответов (до перехода на валидацию из байтов). Вложенные модели, которые не менялись, берутся из
+# текущих схем. root_validator(pre=True) у edostavka заменён на равнозначный model_validator(mode="before")
+
+class LegacyEdostavkaProduct(BaseModel):
+    productId: int
+    productName: str
+    images: List[str]
+    price: edostavka_schemas.Price
+    legalInfo: edostavka_schemas.Manufacturer
+    previewProperties: List[edostavka_schemas.PropertyProduct]
+
+    # Details fields
+    categories: List[str] = []
+    quantityInfo: edostavka_schemas.QuantityInfo
+    description: edostavka_schemas.ProductDescription
+    additionalProperties: List[edostavka_schemas.GroupProperty]
+    customPropertyGroup: List[edostavka_schemas.PropertyProduct]
+
+    @model_validator(mode="before")
+    @classmethod
+    def extract_categories(cls, values: dict) -> dict:
+        breadcrumbs = values.get('breadCrumbs')
+        if not breadcrumbs:
+            return values
+
+        def recursive_extract(categories: list) -> List[str]:
+            names = []
+            for item in categories:
+                if 'categoryListName' in item:
+                    names.append(item['categoryListName'])
+                if 'categories' in item and item['categories']:
+                    names.extend(recursive_extract(item['categories']))
+            return names
+
+        values['categories'] = recursive_extract(breadcrumbs)
+        return values
+
+
+class LegacyEdostavkaProductData(BaseModel):
+    product: LegacyEdostavkaProduct
+
+
+class LegacyGippoProperty(BaseModel):
+    code: str
+    value: Union[str, int, float, None]
+    name: str | None = Field(default=None, alias="name")
+    group: Optional[str] = None
+
+    @model_validator(mode="after")
+    def set_group(self):
+        if self.group is None:
+            if self.code in ["fats", "proteins", "energy", "energyJ", "carbohydrates"]:
+                self.group = "Пищевая ценность"
+            else:
+                self.group = "Основные характеристики"
+        return self
+
+
+class LegacyGippoProduct(BaseModel):
+    id: str
+    slug: str
+    name: str = Field(..., alias="title")
+    barcode: str | None
+    description: str | None
+    storage_info: str | None
+    unit: str | None = Field(..., alias="short_name_uom")
+    images: List[str] | None
+    properties: List[LegacyGippoProperty]
+    manufacturer: Optional[gippo_schemas.Manufacturer]
+    categories: List[gippo_schemas.Breadcrumb] = Field(None, alias="breadcrumbs")
+    price: str | float | None
+
+    @model_validator(mode="before")
+    @classmethod
+    def transform_properties(cls, values: dict):
+        props = values.get("properties")
+        if not isinstance(props, dict):
+            return values
+
+        properties_list = []
+        manufacturer = {'trademark': None, 'country': None, 'name': None}
+        values['storage_info'] = None
+        for prop in props.values():
+            if prop.get("code") == 'short_name_uom':
+                continue
+            if prop.get("code") == 'brandText':
+                manufacturer['trademark'] = prop.get("value")
+                continue
+            if prop.get("code") == 'nameCountry':
+                manufacturer['country'] = prop.get("value")
+                continue
+            if prop.get("code") == 'nameManufacturer':
+                manufacturer['name'] = prop.get("value")
+                continue
+            if prop.get("code") == "containsGMO":
+                continue
+            if prop.get("code") == "conditionsText":
+                values['storage_info'] = f"{prop.get('name') or ''}: {prop.get('value') or ''}"
+                if not values['storage_info']:
+                    values['storage_info'] = None
+                continue
+            if prop.get("code") == 'nameImporter':
+                continue
+
+            properties_list.append({
+                "code": prop.get("code"),
+                "type": prop.get("type"),
+                "name": prop.get("name") or prop.get(prop.get("code")),
+                "value": str(prop.get("value")),
+            })
+
+        values["properties"] = properties_list
+        values['manufacturer'] = manufacturer
+        values['price'] = None
+        for market in values.get('markets', []):
+            proposal = market.get('proposal', None)
+            if proposal:
+                values['price'] = proposal.get('price', None)
+                break
+        return values
+
+
+class LegacyGreenProduct(BaseModel):
+    id: int | str = Field(default=None, alias="id")
+    article: str = Field(default=None, alias="vendorCode")
+    slug: str
+    name: str | None = Field(default=None, alias="title")
+    unit: str | None = Field(..., alias="quantityLabel")
+    barcode: str | None = Field(default=None, alias="gtin")
+    storage_info: str | None = Field(default=None, alias="storageConditions")
+    composition: str | None
+    manufacturer_name: str | None = Field(default=None, alias="producer")
+    manufacturer_country: str | None = Field(default=None, alias="producingCountry")
+    manufacturer_trademark: str | None = Field(..., alias="brand")
+    prices: green_schemas.StoreProduct | None = Field(alias="storeProduct")
+    images: List
+    properties: List[green_schemas.Property]
+    categoriesIds: List[int]
+    categories_: None | List = Field(default=[], exclude=True)
+
+    @model_validator(mode="before")
+    @classmethod
+    def preparing_data(cls, incoming_data: dict):
+        incoming_data['properties'] = []
+        volume = incoming_data.get('volume', None)
+        if volume:
+            incoming_data['properties'].append({'name': 'Количество', 'value': volume,
+                                                'group': 'Основные характеристики'})
+        energy_cost = incoming_data.get('energyCost', None)
+        if energy_cost:
+            incoming_data['properties'].append({'name': "Пищевая ценность", "value": energy_cost,
+                                                "group": "Пищевая ценность"})
+        files = incoming_data.get('files')
+        incoming_data['images'] = []
+        if files:
+            file_storage_host = "https://io.activecloud.com/static-green-market"
+            for filename in files:
+                filename = filename.get('filename')
+                if filename:
+                    incoming_data['images'].append(f"{file_storage_host}/{'1400x1400-'}{filename}")
+        if incoming_data.get('brand'):
+            incoming_data['brand'] = incoming_data['brand'].get('title')
+        incoming_data['composition'] = incoming_data.get('description', None)
+        return incoming_data
+
+
+def edostavka_sample() -> dict:
+    return {'product': {
+        'productId': 1, 'productName': 'Молоко 3,2%', 'images': ['https://img/1.jpg', 'https://img/2.jpg'],
+        'price': {'basePrice': 3.5, 'discountedPrice': 3.1, 'measurePrice': '3.10 р/л'},
+        'legalInfo': {'title': 'ОАО', 'manufacturerName': 'Молочный комбинат', 'trademarkName': 'ТМ',
+                      'countryOfManufacture': 'Беларусь'},
+        'previewProperties': [{'propertyName': 'Жирность', 'propertyValue': ['3.2%']}],
+        'breadCrumbs': [{'categoryListName': 'Молочные продукты', 'categories': [
+            {'categoryListName': 'Молоко', 'categories': [{'categoryListName': 'Пастеризованное'}]}]}],
+        'quantityInfo': {'quantityInBasket': 0, 'quantitySample': 1, 'quantityInOrder': 0,
+                         'quantityInOrderGroupEdit': 0, 'startOrderFrom': 1, 'division': 1, 'measure': 'шт'},
+        'description': {'composition': 'молоко нормализованное', 'productDescription': 'описание ' * 20,
+                        'storagePeriod': '5 суток'},
+        'additionalProperties': [{'groupName': 'Общие', 'groupProperty': [
+            {'propertyName': f'Свойство {i}', 'propertyValue': [f'значение {i}']} for i in range(15)]}],
+        'customPropertyGroup': [{'propertyName': name, 'propertyValue': ['1.0']}
+                                for name in ('Белки', 'Жиры', 'Углеводы', 'Энергетическая ценность')],
+        'stock': {'warehouses': [{'id': i, 'amount': i * 3} for i in range(30)]},
+    }}
+
+
+def gippo_sample() -> dict:
+    properties = {f'p{i}': {'code': f'code{i}', 'type': 'string', 'name': f'Свойство {i}', 'value': f'значение {i}'}
+                  for i in range(25)}
+    properties.update({
+        'brand': {'code': 'brandText', 'type': 'string', 'name': 'Бренд', 'value': 'Бренд'},
+        'country': {'code': 'nameCountry', 'type': 'string', 'name': 'Страна', 'value': 'Беларусь'},
+        'manufacturer': {'code': 'nameManufacturer', 'type': 'string', 'name': 'Производитель', 'value': 'Завод'},
+        'conditions': {'code': 'conditionsText', 'type': 'string', 'name': 'Условия хранения', 'value': '+2..+6'},
+        'uom': {'code': 'short_name_uom', 'type': 'string', 'name': 'Ед. изм.', 'value': 'шт'},
+        'fats': {'code': 'fats', 'type': 'number', 'name': 'Жиры', 'value': 3.2},
+    })
+    return {'id': '1', 'slug': 'moloko', 'title': 'Молоко 3,2%', 'barcode': '4810000000000', 'description': 'описание',
+            'short_name_uom': 'шт', 'images': [f'https://img/{i}.jpg' for i in range(4)], 'properties': properties,
+            'breadcrumbs': [{'title': 'Молочные продукты', 'slug': 'molochnye'}, {'title': 'Молоко', 'slug': 'moloko'}],
+            'markets': [{'id': i, 'proposal': {'price': 2.49 + i}} for i in range(5)]}
+
+
+def green_sample() -> dict:
+    return {'id': 1, 'vendorCode': 'A1', 'slug': 'moloko', 'title': 'Молоко 3,2%', 'quantityLabel': '1 л',
+            'gtin': '4810000000000', 'storageConditions': '+2..+6', 'description': 'молоко нормализованное',
+            'producer': 'Завод', 'producingCountry': 'Беларусь', 'brand': {'id': 5, 'title': 'Бренд', 'slug': 'brand'},
+            'storeProduct': {'price': 250, 'priceWithSale': 199, 'stock': 12},
+            'files': [{'filename': f'{i}.png', 'type': 'image'} for i in range(4)], 'volume': '1 л',
+            'energyCost': '60 ккал', 'categoriesIds': [1, 2, 3],
+            'attributes': [{'name': f'Атрибут {i}', 'value': i} for i in range(30)]}
+
+
+# источник: (прежняя модель ответа, текущая модель ответа, url деталей товара в кеше, сгенерированный ответ)
+STORES = {
+    'edostavka.by': (LegacyEdostavkaProductData, edostavka_schemas.ProductData, r'/api/v2/product/\d+$',
+                     edostavka_sample),
+    'gippo-market.by': (LegacyGippoProduct, gippo_schemas.Product, r'/api/guest/shop/products/[^/?]+\?',
+                        gippo_sample),
+    'green-dostavka.by': (LegacyGreenProduct, green_schemas.Product, r'/api/v1/products/[^/?]+\?storeId=',
+                          green_sample),
+}
+
+
+def recorded_documents(url_pattern: str, limit: int = 200) -> list[bytes]:
+    documents = []
+    pattern = re.compile(url_pattern)
+    for meta_path in data_dir().glob("*/http_cache/*/*.json"):
+        try:
+            meta = json.loads(meta_path.read_text(encoding='utf-8'))
+            if not pattern.search(meta.get('url', '')):
+                continue
+            with gzip.open(meta_path.with_suffix('.gz'), 'rb') as f:
+                documents.append(f.read())
+        except (OSError, ValueError, EOFError):
+            continue
+        if len(documents) >= limit:
+            break
+    return documents
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeat', type=int, default=2000)
+    args = parser.parse_args()
+
+    print(f"{'source':<20} {'documents':>9} {'before, us':>10} {'bytes, us':>10} {'speedup':>8}")
+    for source, (legacy_model, model, url_pattern, sample) in STORES.items():
+        documents = recorded_documents(url_pattern)
+        origin = 'recorded'
+        if not documents:
+            documents = [json.dumps(sample(), ensure_ascii=False).encode('utf-8')]
+            origin = 'generated'
+        number = max(1, args.repeat // len(documents))
+        if any(legacy_model(**json.loads(document)).model_dump() != validate_json(model, document).model_dump()
+               for document in documents):
+            print(f"{source}: results differ!")
+
+        def before_path():
+            for document in documents:
+                legacy_model(**json.loads(document))
+
+        def bytes_path():
+            for document in documents:
+                validate_json(model, document)
+
+        calls = number * len(documents)
+        before_time = timeit.timeit(before_path, number=number) / calls
+        bytes_time = timeit.timeit(bytes_path, number=number) / calls
+        print(f"{source:<20} {len(documents):>9} {before_time * 1e6:>10.1f} {bytes_time * 1e6:>10.1f} "
+              f"{before_time / bytes_time:>7.1f}x  ({origin})")
+
+
+if __name__ == "__main__":
+    main()
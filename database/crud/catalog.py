@@ -1,14 +1,24 @@
 from sqlalchemy.orm import Session
+from sqlalchemy import func, literal_column, select, update
 from database.models.catalog import Category, Manufactory, Source, Product, Property, ProductPropertyValue, \
     ProductCategory, ProductImage, ProductPrice
-from typing import Union
+from typing import Iterator
 from sqlalchemy.dialects.postgresql import insert
 
 
 class CatalogCRUD:
 
-    def __init__(self, session: Session):
+    def __init__(self, session: Session, autocommit: bool = True):
         self.session = session
+        # autocommit=False - режим unit of work: методы только отправляют изменения в базу (flush), новые id приходят
+        # через INSERT ... RETURNING, а коммит делает владелец сессии
+        self.autocommit = autocommit
+
+    def _commit(self):
+        if self.autocommit:
+            self.session.commit()
+        else:
+            self.session.flush()
 
     def get_all_sources(self) -> list:
         return self.session.query(Source).all()
@@ -16,152 +26,204 @@ class CatalogCRUD:
     def save_new_source(self, source_name) -> int:
         new_row = Source(name=source_name)
         self.session.add(new_row)
-        self.session.commit()
+        self._commit()
 
         return new_row.id
 
-    def get_all_categories(self, source_id: int | None = None) -> list:
-        if source_id:
-            return self.session.query(Category).filter(Category.source_id == source_id).all()
-        return self.session.query(Category).all()
-
-    def save_new_category(self, name: str,
-                          source_id: int,
-                          parent_id: Union[int, None] = None,
-                          parent_name: Union[str, None] = None,
-                          ) -> Category.id:
-        # если передан parent_name -> искать его id
-        if parent_name:
-            parent_id = self.session.query(Category.id).filter(Category.name == parent_name).first().get('id', None)
-            if not parent_id:
-                raise ValueError('No <parent_id> found for the provided <parent_name>')
-
-        new_row = Category(
-                name=name,
-                parent_id=parent_id,
-                source_id=source_id
-        )
-
-        self.session.add(new_row)
-        self.session.commit()
-
-        return new_row.id
-
-    def get_all_manufacturers(self, source_id: int | None = None) -> list:
-        if source_id:
-            return self.session.query(Manufactory).filter(Manufactory.source_id == source_id).all()
-        return self.session.query(Manufactory).all()
-
-    def save_new_manufactory(self,
-                             full_name: str,
-                             source_id: int,
-                             trademark: Union[str, None] = None,
-                             country: Union[str, None] = None
-                             ) -> Manufactory.id:
-
-        new_row = Manufactory(
-                trademark=trademark,
-                full_name=full_name,
-                country=country,
-                source_id=source_id
-                    )
-        self.session.add(new_row)
-        self.session.commit()
-
-        return new_row.id
-
-    def save_new_product(self,
-                         manufacturer_id: int,
-                         name: str,
-                         source_id: int,
-                         barcode: Union[str, None] = None,
-                         description: Union[str, None] = None,
-                         composition: Union[str, None] = None,
-                         storage_info: Union[str, None] = None,
-                         unit: Union[str, None] = None,
-                         source_article:  Union[str, None] = None
-                         ) -> int:
-
-        new_row = Product(
-            manufacturer_id=manufacturer_id,
-            name=name,
-            source_id=source_id,
-            barcode=barcode,
-            description=description,
-            composition=composition,
-            storage_info=storage_info,
-            unit=unit,
-            source_article=source_article
-        )
-        self.session.add(new_row)
-        self.session.commit()
-
-        return new_row.id
-
-    def get_articles_and_ids_by_source(self, source_id: str) -> list:
-        return self.session.query(Product.id, Product.source_article).filter(Product.source_id == source_id).all()
-
-    def get_all_properties(self) -> list:
-        return self.session.query(Property).all()
-
-    def save_new_property(self, name: str, group: Union[str, None] = None):
-        new_row = Property(name=name, group=group)
-        self.session.add(new_row)
-        self.session.commit()
-        return new_row.id
+    # Методы iter_* выбирают только нужные колонки (без ORM объектов и связей) и читают результат порциями
+    # через серверный курсор (yield_per), поэтому память не растёт вместе с размером таблицы.
+    # Результат нужно прочитать, пока открыта сессия.
+
+    def iter_category_nodes(self, source_id: int, yield_per: int = 5000) -> Iterator:
+        # -> (id, name, parent_id), ... - плоский список узлов дерева категорий (см. parsers.cache.CategoryTree)
+        stmt = select(Category.id, Category.name, Category.parent_id).where(Category.source_id == source_id)
+        return self.session.execute(stmt.execution_options(yield_per=yield_per))
+
+    def iter_manufacturer_hashes(self, source_id: int, yield_per: int = 5000) -> Iterator:
+        # -> (name_hash, id), ...
+        stmt = select(Manufactory.name_hash, Manufactory.id).where(Manufactory.source_id == source_id,
+                                                                    Manufactory.name_hash.is_not(None))
+        return self.session.execute(stmt.execution_options(yield_per=yield_per))
+
+    def get_manufacturers_without_hash(self, source_id: int) -> list:
+        # -> [(id, trademark, full_name), ...] - записи, сделанные до появления колонки name_hash
+        stmt = select(Manufactory.id, Manufactory.trademark, Manufactory.full_name).where(
+            Manufactory.source_id == source_id, Manufactory.name_hash.is_(None))
+        return self.session.execute(stmt).all()
+
+    def save_manufacturer_hashes(self, rows: list[dict]):
+        # rows = [{'id': int, 'name_hash': str}, ...] - массовый update по первичному ключу
+        if not rows:
+            return
+        self.session.execute(update(Manufactory), rows)
+        self._commit()
+
+    def iter_article_keys(self, source_id: int, yield_per: int = 5000) -> Iterator:
+        # -> (source_article, id), ...
+        stmt = select(Product.source_article, Product.id).where(Product.source_id == source_id)
+        return self.session.execute(stmt.execution_options(yield_per=yield_per))
+
+    def iter_property_keys(self, yield_per: int = 5000) -> Iterator:
+        # -> (name, id), ...
+        stmt = select(Property.name, Property.id)
+        return self.session.execute(stmt.execution_options(yield_per=yield_per))
+
+    # Методы upsert_* пишут строки через INSERT ... ON CONFLICT (естественный ключ) DO UPDATE ... RETURNING id.
+    # Если строка уже есть в базе (например, её записал другой процесс), дубликат не создаётся, а возвращается id
+    # существующей строки. DO UPDATE (а не DO NOTHING) нужен, чтобы RETURNING отдал id и для существующих строк.
+
+    def upsert_products(self, rows: list[dict]) -> dict:
+        """
+        rows = [{'source_id': int, 'source_article': str, 'manufacturer_id': int, 'name': str, ...}, ...]
+        return {source_article: product_id, ...}
+        """
+        if not rows:
+            return {}
+        rows = list({(row['source_id'], row['source_article']): row for row in rows}.values())
+        stmt = insert(Product).values(rows)
+        stmt = stmt.on_conflict_do_update(index_elements=[Product.source_id, Product.source_article],
+                                          set_={'source_article': stmt.excluded.source_article})
+        result = self.session.execute(stmt.returning(Product.id, Product.source_article))
+        ids = {source_article: product_id for product_id, source_article in result}
+        self._commit()
+        return ids
+
+    def upsert_manufacturers(self, rows: list[dict]) -> dict:
+        """
+        rows = [{'source_id': int, 'name_hash': str, 'trademark': str, 'full_name': str, 'country': str}, ...]
+        return {name_hash: manufactory_id, ...}
+        """
+        if not rows:
+            return {}
+        rows = list({(row['source_id'], row['name_hash']): row for row in rows}.values())
+        stmt = insert(Manufactory).values(rows)
+        stmt = stmt.on_conflict_do_update(index_elements=[Manufactory.source_id, Manufactory.name_hash],
+                                          set_={'name_hash': stmt.excluded.name_hash})
+        result = self.session.execute(stmt.returning(Manufactory.id, Manufactory.name_hash))
+        ids = {name_hash: manufactory_id for manufactory_id, name_hash in result}
+        self._commit()
+        return ids
+
+    def upsert_categories(self, rows: list[dict]) -> dict:
+        """
+        rows = [{'source_id': int, 'name': str, 'parent_id': int | None}, ...]
+        return {(name, parent_id): category_id, ...}
+        """
+        if not rows:
+            return {}
+        rows = list({(row['source_id'], row['name'], row.get('parent_id')): row for row in rows}.values())
+        stmt = insert(Category).values(rows)
+        # выражение цели ON CONFLICT должно совпадать с выражением индекса буквально: с параметром вместо 0
+        # (coalesce(parent_id, $1)) generic план подготовленного запроса не находит индекс
+        stmt = stmt.on_conflict_do_update(index_elements=[Category.source_id,
+                                                          Category.name,
+                                                          func.coalesce(Category.parent_id, literal_column("0"))],
+                                          set_={'name': stmt.excluded.name})
+        result = self.session.execute(stmt.returning(Category.id, Category.name, Category.parent_id))
+        ids = {(name, parent_id): category_id for category_id, name, parent_id in result}
+        self._commit()
+        return ids
+
+    def upsert_properties(self, rows: list[dict]) -> dict:
+        """
+        rows = [{'name': str, 'group': str | None}, ...]
+        return {name: property_id, ...}
+        """
+        if not rows:
+            return {}
+        rows = list({row['name']: row for row in rows}.values())
+        stmt = insert(Property).values(rows)
+        stmt = stmt.on_conflict_do_update(index_elements=[Property.name], set_={'name': stmt.excluded.name})
+        result = self.session.execute(stmt.returning(Property.id, Property.name))
+        ids = {name: property_id for property_id, name in result}
+        self._commit()
+        return ids
 
     def save_product_category_relations(self, product_id: int, categories_id: list[int]):
         if not categories_id:
             return
 
-        new_rows = [
-            ProductCategory(product_id=product_id,
-                            category_id=category_id,
-                            )
+        # Создаем список словарей для массовой вставки
+        values = [
+            {"product_id": product_id, "category_id": category_id}
             for category_id in categories_id
         ]
-        self.session.add_all(new_rows)
-        self.session.commit()
-        #
-        # # Создаем список словарей для массовой вставки
-        # values = [
-        #     {"product_id": product_id, "category_id": category_id}
-        #     for category_id in categories_id
-        # ]
-        #
-        # # Создаем insert statement для пропуска дублирующих строк
-        # stmt = insert(ProductCategory).values(values)
-        #
-        # # Добавляем обработку конфликтов - пропускаем дубликаты
-        # stmt = stmt.on_conflict_do_nothing(
-        #     index_elements=['product_id', 'category_id']  # предполагая, что это уникальная пара
-        # )
-        #
-        # # Выполняем запрос
-        # self.session.execute(stmt)
-        # self.session.commit()
+
+        # Создаем insert statement для пропуска дублирующих строк (уникальный индекс idx_unique_product_category)
+        stmt = insert(ProductCategory).values(values)
+        stmt = stmt.on_conflict_do_nothing(
+            index_elements=[ProductCategory.product_id, ProductCategory.category_id]
+        )
+        self.session.execute(stmt)
+        self._commit()
 
     def save_product_property_values_relations(self, product_id: int, property_id: int, values: list = None):
-        new_rows = [
-            ProductPropertyValue(product_id=product_id,
-                                 property_id=property_id,
-                                 value=value)
+        if not values:
+            return
+        stmt = insert(ProductPropertyValue).values([
+            {"product_id": product_id, "property_id": property_id, "value": value}
             for value in values
-        ]
-        self.session.add_all(new_rows)
-        self.session.commit()
+        ])
+        # литерал '' вместо параметра - см. upsert_categories
+        stmt = stmt.on_conflict_do_nothing(
+            index_elements=[ProductPropertyValue.product_id,
+                            ProductPropertyValue.property_id,
+                            func.md5(func.coalesce(ProductPropertyValue.value, literal_column("''")))]
+        )
+        self.session.execute(stmt)
+        self._commit()
 
     def save_product_images_relations(self, product_id: int, images: list = None):
-        new_rows = [
-            ProductImage(product_id=product_id,
-                         image_url=image)
-
+        if not images:
+            return
+        stmt = insert(ProductImage).values([
+            {"product_id": product_id, "image_url": image}
             for image in images
-        ]
-        self.session.add_all(new_rows)
-        self.session.commit()
+        ])
+        stmt = stmt.on_conflict_do_nothing(index_elements=[ProductImage.product_id, ProductImage.image_url])
+        self.session.execute(stmt)
+        self._commit()
 
-    def save_product_price_datetime_relations(self, product_id: int, price: float, date_time: str):
-        new_row = ProductPrice(product_id=product_id, price=price, date_time=date_time)
+    def save_product_price_datetime_relations(self, product_id: int, price: float, date_time: str) -> int:
+        new_row = ProductPrice(product_id=product_id, price=price, date_time=date_time, last_seen=date_time)
         self.session.add(new_row)
-        self.session.commit()
+        self._commit()
+        return new_row.id
+
+    def save_product_prices(self, rows: list[dict], returning: bool = False) -> list | None:
+        """
+        Массовая запись цен одним запросом (multi-row insert).
+        rows = [{'product_id': int, 'price': float, 'date_time': str, 'last_seen': str}, ...]
+        returning=True -> [(id, date_time), ...] новых строк в порядке rows
+        """
+        if not rows:
+            return [] if returning else None
+        inserted = None
+        if returning:
+            stmt = insert(ProductPrice).returning(ProductPrice.id, ProductPrice.date_time, sort_by_parameter_order=True)
+            inserted = self.session.execute(stmt, rows).all()
+        else:
+            self.session.execute(insert(ProductPrice), rows)
+        self._commit()
+        return inserted
+
+    def touch_product_prices(self, rows: list[dict]):
+        """
+        Цена не изменилась - обновляем только время последнего наблюдения.
+        rows = [{'id': int, 'date_time': datetime, 'last_seen': str}, ...] - массовый update по первичному ключу
+        """
+        if not rows:
+            return
+        self.session.execute(update(ProductPrice), rows)
+        self._commit()
+
+    def iter_last_prices(self, source_id: int, yield_per: int = 5000) -> Iterator:
+        # -> (product_id, price, id, date_time), ... - последняя записанная цена каждого товара источника
+        stmt = (
+            select(ProductPrice.product_id, ProductPrice.price, ProductPrice.id, ProductPrice.date_time)
+            .join(Product, Product.id == ProductPrice.product_id)
+            .where(Product.source_id == source_id)
+            .distinct(ProductPrice.product_id)
+            .order_by(ProductPrice.product_id, ProductPrice.date_time.desc())
+        )
+        return self.session.execute(stmt.execution_options(yield_per=yield_per))
@@ -0,0 +1,86 @@
+from sqlalchemy.orm import Session
+from sqlalchemy import and_, case, delete, func, select, update
+from sqlalchemy.dialects.postgresql import insert
+from database.models.work_queue import WorkQueueShard
+from typing import Iterable
+
+
+class WorkQueueCRUD:
+    """
+    Запросы к таблице work_queue. Время аренды считается по часам сервера базы (now()), поэтому часы
+    воркеров на разных машинах не обязаны совпадать. Коммит делает владелец сессии.
+    UPDATE выполняются без синхронизации сессии (synchronize_session=False): ORM объекты очереди не загружаются,
+    а синхронизация добавляет к RETURNING свои колонки.
+    """
+
+    def __init__(self, session: Session):
+        self.session = session
+
+    @staticmethod
+    def _lease_until(lease_time: float):
+        return func.now() + func.make_interval(0, 0, 0, 0, 0, 0, lease_time)
+
+    def _update(self, stmt):
+        return self.session.execute(stmt.execution_options(synchronize_session=False))
+
+    def put(self, queue: str, shards: Iterable[str]) -> int:
+        rows = [{'queue': queue, 'shard': shard, 'status': 'pending', 'attempts': 0} for shard in shards]
+        if not rows:
+            return 0
+        stmt = insert(WorkQueueShard).values(rows).on_conflict_do_nothing(index_elements=['queue', 'shard'])
+        # rowcount многострочного INSERT драйвер не возвращает - считаем добавленные строки по RETURNING
+        return len(self.session.execute(stmt.returning(WorkQueueShard.id)).all())
+
+    def clear(self, queue: str):
+        self.session.execute(delete(WorkQueueShard).where(WorkQueueShard.queue == queue))
+
+    def expire_exhausted(self, queue: str, max_attempts: int):
+        # аренда истекла, а попытки закончились - шард больше не выдаётся
+        self._update(update(WorkQueueShard)
+                     .where(WorkQueueShard.queue == queue, WorkQueueShard.status == 'leased',
+                            WorkQueueShard.leased_until < func.now(),
+                            WorkQueueShard.attempts >= max_attempts)
+                     .values(status='failed', worker=None, error='lease expired'))
+
+    def lease(self, queue: str, worker: str, lease_time: float, max_attempts: int) -> tuple | None:
+        """
+        -> (shard, attempts) | None. Строка выбирается с FOR UPDATE SKIP LOCKED: воркеры, которые арендуют
+        одновременно, не ждут друг друга и не получают один и тот же шард
+        """
+        candidate = (select(WorkQueueShard.id)
+                     .where(WorkQueueShard.queue == queue, WorkQueueShard.attempts < max_attempts,
+                            (WorkQueueShard.status == 'pending') |
+                            ((WorkQueueShard.status == 'leased') & (WorkQueueShard.leased_until < func.now())))
+                     .order_by(WorkQueueShard.id)
+                     .limit(1)
+                     .with_for_update(skip_locked=True)
+                     .scalar_subquery())
+        stmt = (update(WorkQueueShard)
+                .where(WorkQueueShard.id == candidate)
+                .values(status='leased', worker=worker, leased_until=self._lease_until(lease_time),
+                        attempts=WorkQueueShard.attempts + 1)
+                .returning(WorkQueueShard.shard, WorkQueueShard.attempts))
+        return self._update(stmt).first()
+
+    def extend(self, queue: str, shard: str, worker: str, lease_time: float) -> bool:
+        result = self._update(update(WorkQueueShard)
+                              .where(WorkQueueShard.queue == queue, WorkQueueShard.shard == shard,
+                                     WorkQueueShard.worker == worker, WorkQueueShard.status == 'leased')
+                              .values(leased_until=self._lease_until(lease_time)))
+        return result.rowcount > 0
+
+    def finish(self, queue: str, shard: str, worker: str, status: str, error: str | None = None) -> bool:
+        # только пока аренда принадлежит <worker>: истёкший и переданный другому воркеру шард не трогаем
+        result = self._update(update(WorkQueueShard)
+                              .where(WorkQueueShard.queue == queue, WorkQueueShard.shard == shard,
+                                     WorkQueueShard.worker == worker, WorkQueueShard.status == 'leased')
+                              .values(status=status, leased_until=None, error=error,
+                                      worker=worker if status == 'done' else None))
+        return result.rowcount > 0
+
+    def count_by_status(self, queue: str) -> dict:
+        # активные аренды (leased) и истёкшие (expired) считаются отдельно
+        status = case((and_(WorkQueueShard.status == 'leased', WorkQueueShard.leased_until < func.now()), 'expired'),
+                      else_=WorkQueueShard.status)
+        stmt = select(status, func.count()).where(WorkQueueShard.queue == queue).group_by(status)
+        return {row[0]: row[1] for row in self.session.execute(stmt)}
@@ -1,12 +1,46 @@
 from sqlalchemy import create_engine
 from dotenv import load_dotenv
+from functools import cache
 import os
 
 
+"""
+Драйвер по умолчанию - psycopg (3). psycopg2 можно выбрать явно через DB_DRIVER=postgresql+psycopg2.
+Настройки пула и драйвера читаются из переменных окружения (.env):
+    DB_POOL_SIZE                   - постоянные соединения в пуле
+    DB_MAX_OVERFLOW                - сколько соединений можно открыть сверх DB_POOL_SIZE при пиковой нагрузке
+    DB_POOL_TIMEOUT                - сколько секунд ждать свободное соединение
+    DB_POOL_RECYCLE                - через сколько секунд пересоздавать соединение (защита от обрыва по таймауту сервера)
+    DB_POOL_PRE_PING               - проверять соединение перед выдачей из пула
+    DB_INSERTMANYVALUES_PAGE_SIZE  - сколько строк отправлять в одном multi-row insert (session.execute(insert(), rows))
+    DB_PREPARE_THRESHOLD           - psycopg 3: после скольких выполнений запрос становится prepared statement на сервере
+                                     (пустое значение - отключить)
+"""
+DEFAULT_DRIVER = "postgresql+psycopg"
+
+
+def _env_int(name: str, default: int | None, empty_is_none: bool = False) -> int | None:
+    # пустое значение - как отсутствующая переменная (default). empty_is_none=True - пустое значение означает None
+    # (например, DB_PREPARE_THRESHOLD= отключает prepared statements)
+    value = os.getenv(name, None)
+    if value is None:
+        return default
+    if value.strip() == "":
+        return None if empty_is_none else default
+    return int(value)
+
+
+def _env_bool(name: str, default: bool) -> bool:
+    value = os.getenv(name, None)
+    if value is None:
+        return default
+    return value.lower() == "true"
+
+
 def get_database_url():
     load_dotenv()
     database_url = (
-        f"{os.getenv('DB_DRIVER')}:"
+        f"{os.getenv('DB_DRIVER') or DEFAULT_DRIVER}:"
         f"//{os.getenv('DB_USER')}:"
         f"{os.getenv('DB_PASSWORD')}@"
         f"{os.getenv('DB_HOST')}:"
@@ -16,9 +50,40 @@ def get_database_url():
     return database_url
 
 
-def create_db_engine():
+def get_engine_options(driver: str, schema_name: str | None = None) -> dict:
+    connect_args = {}
+    if schema_name:
+        # search_path задаётся при открытии соединения, отдельный запрос SET на каждое соединение не нужен
+        connect_args['options'] = f'-c search_path="{schema_name}"'
+
+    options = {
+        'echo': _env_bool("DB_ECHO", False),
+        'future': True,
+        'pool_size': _env_int("DB_POOL_SIZE", 5),
+        'max_overflow': _env_int("DB_MAX_OVERFLOW", 10),
+        'pool_timeout': _env_int("DB_POOL_TIMEOUT", 30),
+        'pool_recycle': _env_int("DB_POOL_RECYCLE", 1800),
+        'pool_pre_ping': _env_bool("DB_POOL_PRE_PING", True),
+        'insertmanyvalues_page_size': _env_int("DB_INSERTMANYVALUES_PAGE_SIZE", 1000),
+    }
+    if driver.endswith('+psycopg2'):
+        # execute_batch для executemany UPDATE/DELETE, INSERT идёт через insertmanyvalues
+        options['executemany_mode'] = 'values_plus_batch'
+    elif driver.endswith('+psycopg'):
+        connect_args['prepare_threshold'] = _env_int("DB_PREPARE_THRESHOLD", 2, empty_is_none=True)
+
+    options['connect_args'] = connect_args
+    return options
+
+
+@cache
+def create_db_engine(schema_name: str | None = None):
+    """
+    Возвращает движок (и его пул соединений), общий для всего процесса: повторный вызов с теми же аргументами
+    отдаёт уже созданный движок. В дочерних процессах движок создаётся заново (пул нельзя передавать между процессами).
+    """
     url = get_database_url()
-    echo = os.getenv("DB_ECHO", "False").lower() == "true"
+    driver = url.split(':', 1)[0]
 
-    engine = create_engine(url, echo=echo, future=True)
+    engine = create_engine(url, **get_engine_options(driver, schema_name))
     return engine
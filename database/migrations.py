@@ -0,0 +1,169 @@
+from sqlalchemy import text
+from sqlalchemy.engine import Connection
+from sqlalchemy.schema import CreateIndex
+from database.models.base import Base
+from database.partitions import ensure_price_partitions, is_partitioned
+from typing import Callable
+
+
+"""
+Версионные миграции схемы базы данных.
+Текущая версия схемы хранится в таблице schema_version (одна строка на каждую применённую миграцию).
+При старте (database.session.get_session_factory) вызывается migrate():
+    - версия совпадает с последней  -> ничего не делаем (одна проверка вместо create_all с отражением всех таблиц)
+    - пустая схема                  -> create_all по моделям и отметка последней версии
+    - схема старой версии           -> create_all (только отсутствующие таблицы) и по порядку все недостающие миграции
+Миграции не удаляют данные и написаны так, чтобы повторный запуск был безопасен (IF NOT EXISTS).
+Новая миграция - функция (conn) -> None, добавленная в конец списка MIGRATIONS.
+"""
+SCHEMA_VERSION_TABLE = "schema_version"
+MIGRATIONS_LOCK_KEY = 'database.migrations'
+
+
+def _create_model_indexes(conn: Connection, table_names: list[str], unique: bool):
+    # индексы описаны в моделях (database.models.catalog), здесь создаём недостающие на существующих таблицах
+    for table in Base.metadata.sorted_tables:
+        if table.name not in table_names:
+            continue
+        for index in table.indexes:
+            if bool(index.unique) == unique:
+                conn.execute(CreateIndex(index, if_not_exists=True))
+
+
+def _merge_duplicates(conn: Connection, table: str, key: str, references: list[tuple[str, str]]) -> int:
+    """
+    Сливает строки <table> с одинаковым ключом <key> в строку с минимальным id: ссылки из <references>
+    [(таблица, колонка), ...] переводятся на оставшуюся строку, дубликаты удаляются.
+    """
+    # карта дубликатов (id -> keep_id) фиксируется до изменения ссылок: для categories обновление parent_id меняет
+    # сам ключ, по которому ищутся дубликаты
+    conn.execute(text("DROP TABLE IF EXISTS pg_temp.merge_duplicates"))
+    conn.execute(text(
+        f"CREATE TEMP TABLE merge_duplicates AS SELECT id, keep_id FROM "
+        f"(SELECT id, min(id) OVER (PARTITION BY {key}) AS keep_id FROM {table}) d WHERE id <> keep_id"
+    ))
+    for ref_table, ref_column in references:
+        conn.execute(text(
+            f"UPDATE {ref_table} r SET {ref_column} = d.keep_id FROM merge_duplicates d WHERE r.{ref_column} = d.id"
+        ))
+    result = conn.execute(text(f"DELETE FROM {table} t USING merge_duplicates d WHERE t.id = d.id"))
+    return result.rowcount
+
+
+def migration_001_lookup_indexes(conn: Connection):
+    """Индексы на колонках поиска и внешних ключах"""
+    _create_model_indexes(conn, ['categories', 'products', 'relations_product_category', 'relations_product_property'],
+                          unique=False)
+
+
+def migration_002_natural_keys(conn: Connection):
+    """Колонки name_hash / last_seen, удаление дубликатов и уникальные индексы по естественным ключам"""
+    conn.execute(text("ALTER TABLE manufacturers ADD COLUMN IF NOT EXISTS name_hash VARCHAR(64)"))
+    conn.execute(text("ALTER TABLE prices ADD COLUMN IF NOT EXISTS last_seen TIMESTAMP WITHOUT TIME ZONE"))
+
+    _merge_duplicates(conn, 'properties', 'name', [('relations_product_property', 'property_id')])
+    _merge_duplicates(conn, 'products', 'source_id, source_article', [('relations_product_category', 'product_id'),
+                                                                     ('relations_product_property', 'product_id'),
+                                                                     ('relations_product_image', 'product_id'),
+                                                                     ('prices', 'product_id')])
+    # после слияния родителей могут появиться новые дубликаты среди дочерних категорий
+    while _merge_duplicates(conn, 'categories', 'source_id, name, coalesce(parent_id, 0)',
+                            [('relations_product_category', 'category_id'), ('categories', 'parent_id')]):
+        pass
+    _merge_duplicates(conn, 'relations_product_category', 'product_id, category_id', [])
+    _merge_duplicates(conn, 'relations_product_property', "product_id, property_id, md5(coalesce(value, ''))", [])
+    _merge_duplicates(conn, 'relations_product_image', 'product_id, image_url', [])
+
+    _create_model_indexes(conn, ['properties', 'categories', 'manufacturers', 'products',
+                                 'relations_product_category', 'relations_product_property',
+                                 'relations_product_image'], unique=True)
+
+
+def migration_003_partition_prices(conn: Connection):
+    """Перенос таблицы prices в секционированную по месяцам таблицу (см. database.partitions)"""
+    if is_partitioned(conn, 'prices'):
+        return
+    # старая таблица переименовывается вместе с именами, которые понадобятся новой таблице
+    conn.execute(text("ALTER TABLE prices RENAME TO prices_legacy"))
+    conn.execute(text("ALTER TABLE prices_legacy RENAME CONSTRAINT prices_pkey TO prices_legacy_pkey"))
+    conn.execute(text("ALTER SEQUENCE IF EXISTS prices_id_seq RENAME TO prices_legacy_id_seq"))
+
+    Base.metadata.tables['prices'].create(bind=conn)
+    first_date = conn.execute(text("SELECT min(date_time) FROM prices_legacy")).scalar()
+    ensure_price_partitions(conn, start=first_date.date() if first_date else None)
+
+    conn.execute(text(
+        "INSERT INTO prices (id, product_id, price, date_time, last_seen) "
+        "SELECT id, product_id, price, date_time, coalesce(last_seen, date_time) FROM prices_legacy"
+    ))
+    conn.execute(text(
+        "SELECT setval(pg_get_serial_sequence('prices', 'id'), coalesce((SELECT max(id) FROM prices), 0) + 1, false)"
+    ))
+    conn.execute(text("DROP TABLE prices_legacy"))
+
+
+def migration_004_work_queue(conn: Connection):
+    """Таблица work_queue для распределённого обхода (см. parsers.work_queue)"""
+    Base.metadata.tables['work_queue'].create(bind=conn, checkfirst=True)
+
+
+MIGRATIONS: list[tuple[int, Callable[[Connection], None]]] = [
+    (1, migration_001_lookup_indexes),
+    (2, migration_002_natural_keys),
+    (3, migration_003_partition_prices),
+    (4, migration_004_work_queue),
+]
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+def get_schema_version(conn: Connection) -> int:
+    # to_regclass ищет таблицу в search_path соединения и не падает, если таблицы (или схемы) нет
+    if conn.execute(text(f"SELECT to_regclass('{SCHEMA_VERSION_TABLE}')")).scalar() is None:
+        return 0
+    return conn.execute(text(f"SELECT coalesce(max(version), 0) FROM {SCHEMA_VERSION_TABLE}")).scalar()
+
+
+def _set_schema_version(conn: Connection, version: int, description: str):
+    conn.execute(text(f"INSERT INTO {SCHEMA_VERSION_TABLE} (version, description) VALUES (:version, :description)"),
+                 {'version': version, 'description': description})
+
+
+def migrate(conn: Connection, schema_name: str) -> int:
+    """
+    Приводит схему <schema_name> к последней версии. Выполняется внутри транзакции <conn>:
+    при ошибке откатываются все миграции этого запуска. Возвращает версию схемы.
+    """
+    if get_schema_version(conn) == LATEST_VERSION:
+        return LATEST_VERSION
+
+    # несколько процессов могут стартовать одновременно - миграции выполняет только один из них
+    conn.execute(text("SELECT pg_advisory_xact_lock(hashtext(:key))"), {'key': MIGRATIONS_LOCK_KEY})
+    version = get_schema_version(conn)
+    if version == LATEST_VERSION:
+        return version
+
+    conn.execute(text(f'CREATE SCHEMA IF NOT EXISTS "{schema_name}"'))
+    conn.execute(text(f'SET search_path TO "{schema_name}"'))
+    fresh_schema = conn.execute(text("SELECT to_regclass('products')")).scalar() is None
+
+    # Импортируем модели, чтобы таблицы попали в Base.metadata
+    import database.models.catalog
+    import database.models.work_queue
+    Base.metadata.create_all(bind=conn)
+    conn.execute(text(
+        f"CREATE TABLE IF NOT EXISTS {SCHEMA_VERSION_TABLE} ("
+        "version INTEGER PRIMARY KEY, "
+        "description TEXT, "
+        "applied_at TIMESTAMP WITHOUT TIME ZONE NOT NULL DEFAULT now())"
+    ))
+
+    for migration_version, migration in MIGRATIONS:
+        if migration_version <= version:
+            continue
+        description = migration.__doc__.strip()
+        # в пустой схеме create_all уже создал всё по текущим моделям - миграции только отмечаем
+        if not fresh_schema:
+            print(f"Schema migration {migration_version} ({description}) -> start")
+            migration(conn)
+        _set_schema_version(conn, migration_version, description)
+    return LATEST_VERSION
@@ -1,15 +1,14 @@
-from sqlalchemy import Integer, String, Column, DateTime, ForeignKey, Numeric, Text
+from sqlalchemy import Integer, String, Column, DateTime, ForeignKey, Numeric, Text, Index, func
 from sqlalchemy.orm import relationship
 from .base import Base
-# from sqlalchemy import Index
 
 
 class Category(Base):
     __tablename__ = "categories"
 
     id = Column(Integer, primary_key=True, autoincrement=True)
-    name = Column(String(80), nullable=False)
-    parent_id = Column(Integer, ForeignKey("categories.id"), nullable=True)
+    name = Column(String(80), nullable=False, index=True)
+    parent_id = Column(Integer, ForeignKey("categories.id"), nullable=True, index=True)
     source_id = Column(Integer, ForeignKey("sources.id"), nullable=False)
 
     # relationships
@@ -17,6 +16,12 @@ class Category(Base):
     source = relationship("Source", back_populates="categories")
     product_category = relationship("ProductCategory", back_populates="category")  # исправлено на category
 
+    # Уникальный индекс по естественному ключу. parent_id у корневых категорий NULL, а NULL в уникальном индексе не
+    # равен NULL, поэтому индекс строится по coalesce(parent_id, 0)
+    __table_args__ = (
+        Index('uq_categories_source_name_parent', source_id, name, func.coalesce(parent_id, 0), unique=True),
+    )
+
 
 class Manufactory(Base):
     __tablename__ = "manufacturers"
@@ -26,17 +31,23 @@ class Manufactory(Base):
     full_name = Column(String(300), nullable=True)
     country = Column(String(52), nullable=True)
     source_id = Column(Integer, ForeignKey("sources.id"), nullable=False)
+    # CategoryService.string_hash(trademark + full_name). Хранится в базе, чтобы не пересчитывать при каждом старте
+    name_hash = Column(String(64), nullable=True)
 
     # relationships
     source = relationship("Source", back_populates="manufacturers")
     product = relationship("Product", back_populates="manufacturer")
 
+    __table_args__ = (
+        Index('uq_manufacturers_source_name_hash', 'source_id', 'name_hash', unique=True),
+    )
+
 
 class Product(Base):
     __tablename__ = "products"
 
     id = Column(Integer, primary_key=True, autoincrement=True)
-    manufacturer_id = Column(Integer, ForeignKey("manufacturers.id"), nullable=False)
+    manufacturer_id = Column(Integer, ForeignKey("manufacturers.id"), nullable=False, index=True)
     source_id = Column(Integer, ForeignKey("sources.id"), nullable=False)
     name = Column(String(255), nullable=False)
     barcode = Column(String(14), nullable=True)
@@ -44,7 +55,7 @@ class Product(Base):
     composition = Column(Text, nullable=True)
     storage_info = Column(Text, nullable=True)
     unit = Column(String(15), nullable=True)
-    source_article = Column(String(60), nullable=True)
+    source_article = Column(String(60), nullable=True, index=True)
 
     # relationships
     source = relationship("Source", back_populates="product")
@@ -54,6 +65,10 @@ class Product(Base):
     image = relationship("ProductImage", back_populates="product")  # исправлено на product
     price = relationship("ProductPrice", back_populates="product")  # исправлено на product
 
+    __table_args__ = (
+        Index('uq_products_source_article', 'source_id', 'source_article', unique=True),
+    )
+
 
 class Source(Base):
     __tablename__ = "sources"
@@ -77,22 +92,26 @@ class Property(Base):
     # relationships
     property_value = relationship("ProductPropertyValue", back_populates="property")  # исправлено на property
 
+    __table_args__ = (
+        Index('uq_properties_name', 'name', unique=True),
+    )
+
 
 class ProductCategory(Base):
     __tablename__ = "relations_product_category"
 
     id = Column(Integer, primary_key=True, autoincrement=True)
     product_id = Column(Integer, ForeignKey("products.id"), nullable=False)
-    category_id = Column(Integer, ForeignKey("categories.id"), nullable=False)
+    category_id = Column(Integer, ForeignKey("categories.id"), nullable=False, index=True)
 
     # relationships
     product = relationship("Product", back_populates="product_category")  # исправлено на product
     category = relationship("Category", back_populates="product_category")  # исправлено на category
 
-    # # Составной уникальный индекс. По нему будем избегать записи дубликатов
-    # __table_args__ = (
-    #     Index('idx_unique_product_category', 'product_id', 'category_id', unique=True),
-    # )
+    # Составной уникальный индекс. По нему будем избегать записи дубликатов
+    __table_args__ = (
+        Index('idx_unique_product_category', 'product_id', 'category_id', unique=True),
+    )
 
 
 class ProductPropertyValue(Base):
@@ -100,13 +119,18 @@ class ProductPropertyValue(Base):
 
     id = Column(Integer, primary_key=True, autoincrement=True)
     product_id = Column(Integer, ForeignKey("products.id"), nullable=False)
-    property_id = Column(Integer, ForeignKey("properties.id"), nullable=False)
+    property_id = Column(Integer, ForeignKey("properties.id"), nullable=False, index=True)
     value = Column(Text, nullable=True)
 
     # relationships
     product = relationship("Product", back_populates="property_value")  # исправлено на product
     property = relationship("Property", back_populates="property_value")  # исправлено на property
 
+    # value - текст произвольной длины, а размер ключа btree ограничен, поэтому в индекс идёт md5 от значения
+    __table_args__ = (
+        Index('uq_product_property_value', product_id, property_id, func.md5(func.coalesce(value, '')), unique=True),
+    )
+
 
 class ProductImage(Base):
     __tablename__ = "relations_product_image"
@@ -118,6 +142,10 @@ class ProductImage(Base):
     # relationships
     product = relationship("Product", back_populates="image")
 
+    __table_args__ = (
+        Index('uq_product_image', 'product_id', 'image_url', unique=True),
+    )
+
 
 class ProductPrice(Base):
     __tablename__ = "prices"
@@ -125,7 +153,20 @@ class ProductPrice(Base):
     id = Column(Integer, primary_key=True, autoincrement=True)
     product_id = Column(Integer, ForeignKey("products.id"), nullable=False)
     price = Column(Numeric(10, 2))
-    date_time = Column(DateTime, nullable=False)
+    # таблица секционирована по date_time, а ключ секционирования обязан входить в первичный ключ
+    date_time = Column(DateTime, primary_key=True, nullable=False)
+    # время последнего наблюдения этой цены (режим записи только изменений цены, см. parsers.price_buffer)
+    last_seen = Column(DateTime, nullable=True)
 
     # relationships
-    product = relationship("Product", back_populates="price")  # исправлено на product
\ No newline at end of file
+    product = relationship("Product", back_populates="price")  # исправлено на product
+
+    # Таблица секционирована по месяцам (PARTITION BY RANGE). Секции prices_YYYY_MM создаются заранее
+    # в database.partitions.ensure_price_partitions. Запросы по диапазону времени читают только нужные секции,
+    # а старые секции можно отсоединить (DETACH) и архивировать без удаления строк из общей таблицы.
+    # BRIN индекс по date_time - компактный индекс для данных, которые пишутся в порядке времени
+    __table_args__ = (
+        Index('ix_prices_date_time_brin', 'date_time', postgresql_using='brin'),
+        Index('ix_prices_product_id_date_time', 'product_id', 'date_time'),
+        {'postgresql_partition_by': 'RANGE (date_time)'},
+    )
@@ -0,0 +1,21 @@
+from sqlalchemy import Integer, String, Column, DateTime, Text, Index, UniqueConstraint
+from .base import Base
+
+
+class WorkQueueShard(Base):
+    """Единица работы распределённого обхода (см. parsers.work_queue.PostgresWorkQueue)"""
+    __tablename__ = "work_queue"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    queue = Column(String(60), nullable=False)      # имя очереди - источник парсинга
+    shard = Column(String(300), nullable=False)     # категория источника (url / slug / id)
+    status = Column(String(10), nullable=False, default='pending')  # pending / leased / done / failed
+    worker = Column(String(100), nullable=True)
+    leased_until = Column(DateTime, nullable=True)
+    attempts = Column(Integer, nullable=False, default=0)
+    error = Column(Text, nullable=True)
+
+    __table_args__ = (
+        UniqueConstraint('queue', 'shard', name='uq_work_queue_shard'),
+        Index('ix_work_queue_queue_status', 'queue', 'status'),
+    )
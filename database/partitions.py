@@ -0,0 +1,85 @@
+from sqlalchemy import text
+from sqlalchemy.engine import Connection
+from datetime import date
+
+
+"""
+Управление месячными секциями таблицы prices (см. database.models.catalog.ProductPrice).
+Секция за месяц называется prices_YYYY_MM и содержит строки с date_time в диапазоне [1 число месяца, 1 число следующего).
+Функции работают в схеме из search_path соединения.
+"""
+PRICES_TABLE = "prices"
+PARTITIONS_AHEAD = 2  # сколько месяцев вперёд создавать секции
+
+
+def _month_start(day: date, shift: int = 0) -> date:
+    month_index = day.year * 12 + day.month - 1 + shift
+    return date(month_index // 12, month_index % 12 + 1, 1)
+
+
+def partition_name(month: date) -> str:
+    return f"{PRICES_TABLE}_{month:%Y_%m}"
+
+
+def is_partitioned(conn: Connection, table_name: str = PRICES_TABLE) -> bool:
+    relkind = conn.execute(text(
+        "SELECT c.relkind FROM pg_class c JOIN pg_namespace n ON n.oid = c.relnamespace "
+        "WHERE n.nspname = current_schema() AND c.relname = :table_name"
+    ), {'table_name': table_name}).scalar()
+    return relkind == 'p'
+
+
+def get_partitions(conn: Connection, table_name: str = PRICES_TABLE) -> list[str]:
+    return conn.execute(text(
+        "SELECT c.relname FROM pg_inherits i "
+        "JOIN pg_class c ON c.oid = i.inhrelid "
+        "JOIN pg_class p ON p.oid = i.inhparent "
+        "JOIN pg_namespace n ON n.oid = p.relnamespace "
+        "WHERE n.nspname = current_schema() AND p.relname = :table_name ORDER BY c.relname"
+    ), {'table_name': table_name}).scalars().all()
+
+
+def ensure_price_partitions(conn: Connection, months_ahead: int = PARTITIONS_AHEAD,
+                            start: date | None = None) -> list[str]:
+    """
+    Создаёт недостающие секции от месяца <start> (по умолчанию текущий) до текущего месяца + <months_ahead>.
+    Возвращает имена созданных секций. Если таблица prices не секционирована - ничего не делает.
+    """
+    if not is_partitioned(conn):
+        return []
+
+    today = date.today()
+    month = _month_start(start or today)
+    last_month = _month_start(today, months_ahead)
+    existing = set(get_partitions(conn))
+
+    created = []
+    while month <= last_month:
+        name = partition_name(month)
+        if name not in existing:
+            conn.execute(text(
+                f'CREATE TABLE IF NOT EXISTS "{name}" PARTITION OF "{PRICES_TABLE}" '
+                f"FOR VALUES FROM ('{month.isoformat()}') TO ('{_month_start(month, 1).isoformat()}')"
+            ))
+            created.append(name)
+        month = _month_start(month, 1)
+    return created
+
+
+def detach_price_partitions(conn: Connection, older_than: date) -> list[str]:
+    """
+    Отсоединяет секции, которые целиком старше месяца <older_than>. Отсоединённая секция остаётся обычной таблицей
+    prices_YYYY_MM (её можно выгрузить в архив и удалить), но больше не участвует в запросах к prices.
+    """
+    border = _month_start(older_than)
+    detached = []
+    for name in get_partitions(conn):
+        try:
+            year, month = name[len(PRICES_TABLE) + 1:].split('_')
+            partition_month = date(int(year), int(month), 1)
+        except ValueError:
+            continue
+        if _month_start(partition_month, 1) <= border:
+            conn.execute(text(f'ALTER TABLE "{PRICES_TABLE}" DETACH PARTITION "{name}"'))
+            detached.append(name)
+    return detached
@@ -1,7 +1,40 @@
+class CategoryTree(dict):
+    """
+    Индекс дерева категорий одного источника: ключ - полный путь от корня до категории (кортеж названий),
+    значение - database_id. Одноимённые категории с разными родителями хранятся под разными ключами.
+        {('Молочные продукты',): 1, ('Молочные продукты', 'Сыры'): 2, ('Сыры',): 3, ...}
+    """
+
+    @classmethod
+    def from_rows(cls, rows) -> 'CategoryTree':
+        """rows = [(id, name, parent_id), ...] - плоский список категорий из базы"""
+        nodes = {category_id: (name, parent_id) for category_id, name, parent_id in rows}
+        tree = cls()
+        paths = {}  # id: path
+        for category_id in nodes:
+            # поднимаемся вверх до корня (или до уже известного пути) без рекурсии
+            chain = []
+            node_id = category_id
+            while node_id in nodes and node_id not in paths:
+                chain.append(node_id)
+                node_id = nodes[node_id][1]
+            path = paths.get(node_id, ())
+            for node_id in reversed(chain):
+                path = path + (nodes[node_id][0],)
+                paths[node_id] = path
+                tree.setdefault(path, node_id)
+        return tree
+
+    @staticmethod
+    def prefixes(path: tuple) -> list[tuple]:
+        # ('a', 'b', 'c') -> [('a',), ('a', 'b'), ('a', 'b', 'c')]
+        return [tuple(path[:level]) for level in range(1, len(path) + 1)]
+
+
 class Cache:
     def __init__(self):
-        self.sources = {}           # source_name: database_id
-        self.categories = {}        # category_name: database_id
-        self.manufacturers = {}     # manufactory_name: database_id
-        self.articles = {}          # article: product_id
-        self.properties = {}        # property_name: database_id
\ No newline at end of file
+        self.sources = {}               # source_name: database_id
+        self.categories = CategoryTree()  # (root_name, ..., category_name): database_id
+        self.manufacturers = {}         # manufactory_name: database_id
+        self.articles = {}              # article: product_id
+        self.properties = {}            # property_name: database_id
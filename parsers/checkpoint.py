@@ -0,0 +1,105 @@
+from datetime import datetime as dt
+from pathlib import Path
+from threading import Lock
+from typing import Iterable
+import os
+import sqlite3
+
+
+def _max_age_from_env(default: float) -> float | None:
+    # CHECKPOINT_MAX_AGE - секунды; пустое значение или 0 - без ограничения
+    value = os.getenv("CHECKPOINT_MAX_AGE")
+    if value is None:
+        return default
+    return float(value or 0) or None
+
+
+# сколько секунд незавершённый обход можно продолжать. Значение должно быть больше самого долгого запуска источника
+# с перезапусками (run.py: SOURCE_TIMEOUT x (1 + MAX_RESTARTS) = 18 ч, плюс SHUTDOWN_GRACE на каждый запуск) и меньше
+# интервала между ежедневными запусками (24 ч), чтобы завтрашний запуск не продолжил вчерашний обход. 20 ч - с запасом
+# в обе стороны
+CHECKPOINT_MAX_AGE = _max_age_from_env(20 * 3600)
+
+
+class CrawlCheckpoint:
+    """
+    Журнал обхода источника (SQLite файл <path>). Хранит ключи товаров (артикулы источника), которые уже записаны
+    в базу в текущем обходе. Строки только добавляются, поэтому падение процесса в любой момент не портит журнал.
+        - при старте незавершённый обход (процесс упал / был остановлен) продолжается автоматически:
+          паук пропускает товары из журнала и начинает с первого необработанного
+        - незавершённый обход старше <max_age> секунд не продолжается (брошен: источник остановлен по таймауту или
+          исчерпал перезапуски), начинается новый - иначе товары из старого журнала остались бы без сегодняшней цены.
+          max_age=None - продолжать обход любой давности
+        - контроллер отмечает товар (mark_done) только после записи его данных в базу
+        - finish() в конце успешного обхода: следующий запуск начнёт новый обход
+    Методы можно вызывать из разных потоков.
+    """
+
+    def __init__(self, path: Path | str, max_age: float | None = CHECKPOINT_MAX_AGE):
+        self.path = Path(path)
+        self.max_age = max_age
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS runs ("
+                           "id INTEGER PRIMARY KEY AUTOINCREMENT, started_at TEXT NOT NULL, finished_at TEXT)")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS done ("
+                           "run_id INTEGER NOT NULL, product_key TEXT NOT NULL, "
+                           "PRIMARY KEY (run_id, product_key)) WITHOUT ROWID")
+
+        row = self._conn.execute("SELECT id, started_at FROM runs WHERE finished_at IS NULL "
+                                 "ORDER BY id DESC LIMIT 1").fetchone()
+        if row and self._expired(row[1]):
+            print(f"Checkpoint -> run {row[0]} started at {row[1]} is older than {self.max_age:.0f}s, start a new run")
+            self._conn.execute("UPDATE runs SET finished_at = ? WHERE finished_at IS NULL",
+                               (str(dt.now().replace(microsecond=0)),))
+            row = None
+        if row:
+            self.run_id = row[0]
+            self._done = {key for (key,) in self._conn.execute("SELECT product_key FROM done WHERE run_id = ?",
+                                                              (self.run_id,))}
+            print(f"Checkpoint -> resume run {self.run_id} ({len(self._done)} products already done) from {self.path}")
+        else:
+            # журнал завершённых обходов больше не нужен
+            self._conn.execute("DELETE FROM done")
+            self.run_id = self._conn.execute("INSERT INTO runs (started_at) VALUES (?)",
+                                             (str(dt.now().replace(microsecond=0)),)).lastrowid
+            self._done = set()
+
+    def _expired(self, started_at: str) -> bool:
+        if self.max_age is None:
+            return False
+        return (dt.now() - dt.fromisoformat(started_at)).total_seconds() > self.max_age
+
+    @property
+    def resumed(self) -> bool:
+        return bool(self._done)
+
+    def __len__(self):
+        return len(self._done)
+
+    def is_done(self, product_key) -> bool:
+        return product_key is not None and str(product_key) in self._done
+
+    def mark_done(self, product_keys: Iterable):
+        keys = [str(key) for key in product_keys if key is not None]
+        if not keys:
+            return
+        with self._lock:
+            # пачка ключей - одна транзакция
+            self._conn.execute("BEGIN")
+            self._conn.executemany("INSERT OR IGNORE INTO done (run_id, product_key) VALUES (?, ?)",
+                                   [(self.run_id, key) for key in keys])
+            self._conn.execute("COMMIT")
+            self._done.update(keys)
+
+    def finish(self):
+        """Обход завершён полностью"""
+        with self._lock:
+            self._conn.execute("UPDATE runs SET finished_at = ? WHERE id = ?",
+                               (str(dt.now().replace(microsecond=0)), self.run_id))
+
+    def close(self):
+        self._conn.close()
@@ -0,0 +1,60 @@
+from concurrent.futures import ThreadPoolExecutor
+from collections import deque
+from typing import Callable, Iterable, Iterator
+
+
+def ordered_map(func: Callable, iterable: Iterable, max_workers: int = 8, window: int | None = None,
+                return_exceptions: bool = False) -> Iterator:
+    """
+    Аналог map(func, iterable), но вызовы func выполняются параллельно в пуле из <max_workers> потоков.
+    Результаты отдаются строго в порядке входных элементов. Из <iterable> берётся не больше <window>
+    (по умолчанию 2 * max_workers) элементов вперёд, поэтому вход может быть ленивым генератором любой длины.
+    return_exceptions=True - исключение из func отдаётся вместо результата (обход не прерывается),
+    иначе оно пробрасывается при выдаче соответствующего элемента.
+    Ошибка чтения <iterable> пробрасывается после выдачи результатов всех уже запущенных вызовов.
+    max_workers <= 1 - обычный последовательный обход без пула.
+    """
+    if max_workers <= 1:
+        for item in iterable:
+            try:
+                yield func(item)
+            except Exception as _ex:
+                if not return_exceptions:
+                    raise
+                yield _ex
+        return
+
+    window = window or max_workers * 2
+    items = iter(iterable)
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = deque()
+        try:
+            while True:
+                try:
+                    item = next(items)
+                except StopIteration:
+                    break
+                except Exception:
+                    # ошибка входа (например, запроса очередной страницы листинга): результаты уже запущенных
+                    # вызовов не теряются - отдаём их, затем пробрасываем ошибку
+                    while futures:
+                        yield _result(futures.popleft(), return_exceptions)
+                    raise
+                futures.append(executor.submit(func, item))
+                if len(futures) >= window:
+                    yield _result(futures.popleft(), return_exceptions)
+            while futures:
+                yield _result(futures.popleft(), return_exceptions)
+        finally:
+            # потребитель прекратил обход (или ошибка) - не запускаем оставшиеся в очереди вызовы
+            for future in futures:
+                future.cancel()
+
+
+def _result(future, return_exceptions: bool):
+    try:
+        return future.result()
+    except Exception as _ex:
+        if not return_exceptions:
+            raise
+        return _ex
@@ -0,0 +1,131 @@
+from database.session import get_session_factory
+from parsers.service import CategoryService
+from parsers.pipeline import IngestionPipeline
+from parsers.checkpoint import CrawlCheckpoint
+from parsers.work_queue import WorkQueue, ShardDone, crawl_leased_shards, open_work_queue
+from parsers.price_record import PriceRecord
+from datetime import datetime as dt
+from functools import partial
+from pathlib import Path
+from typing import Callable
+
+
+"""
+Общий для всех источников запуск обхода: конвейер паук -> запись в базу (parsers.pipeline), журнал обхода
+(parsers.checkpoint), режим воркера распределённого обхода (parsers.work_queue: аренда шардов и их подтверждение),
+запись цен из листингов (PriceRecord), итоги обхода и закрытие буфера цен.
+Контроллер источника передаёт сюда паука и свою функцию записи товара:
+    save_product(service_data, product) - запись одного товара (схема источника) в базу
+Интерфейс паука:
+    list_shards() - единицы работы обхода (категории)
+    crawl_shard(shard, known_articles=None, checkpoint=None) - товары одной категории:
+        known_articles - артикулы товаров, которые уже есть в базе (режим обновления цен). Для них цена берётся
+        из листинга и отдаётся как PriceRecord, детали запрашиваются только для новых товаров
+        checkpoint - журнал обхода (parsers.checkpoint.CrawlCheckpoint): товары, записанные в базу до падения
+        предыдущего запуска, пропускаются
+    crawl(known_articles=None, checkpoint=None) - обход всех категорий по очереди
+    product_key(product) - ключ товара в журнале обхода (артикул источника)
+    listing_prices - сколько цен взято из листингов, transport - parsers.transport.HttpTransport (для итогов)
+"""
+
+
+def save_products(service_data: CategoryService, products: list, save_product: Callable,
+                  product_key: Callable, checkpoint: CrawlCheckpoint | None = None,
+                  work_queue: WorkQueue | None = None):
+    # обработчик пачки товаров, которую конвейер забрал из очереди
+    keys = []
+    for product in products:
+        if isinstance(product, ShardDone):
+            # режим воркера: шард подтверждается после записи в базу цен всех его товаров
+            service_data.price_buffer.call_after_flush(partial(work_queue.ack, product.lease))
+            continue
+        if isinstance(product, PriceRecord):
+            save_price_record(service_data, product)
+            keys.append(product.article)
+            continue
+        save_product(service_data, product)
+        keys.append(product_key(product))
+    if checkpoint is not None:
+        # цены пишутся в базу пачками (PriceBuffer): товары отмечаются в журнале после записи их цен
+        service_data.price_buffer.call_after_flush(partial(checkpoint.mark_done, keys))
+
+
+def save_price_record(service_data: CategoryService, record: PriceRecord):
+    # режим обновления цен: паук отдал только цену уже известного товара
+    product_id = service_data.articles.get(record.article, None)
+    if product_id:
+        service_data.save_product_price(product_id=product_id, price=record.price,
+                                        date_time=str(dt.now().replace(microsecond=0)))
+
+
+def print_report(spider, price_refresh: bool = False):
+    # итоги обхода: сколько цен взято из листингов и статистика HTTP (кеш, ограничитель скорости)
+    if price_refresh:
+        print(f"Price refresh -> {spider.listing_prices} prices taken from listings")
+    print(f"HTTP -> {spider.transport.report()}")
+
+
+def enqueue_shards(source_name: str, spider, work_queue: str, reset: bool = True) -> int:
+    # координатор распределённого обхода: категории источника кладутся в очередь (см. parsers.work_queue)
+    # reset=True - новый обход, False - дополнить очередь незавершённого обхода
+    queue = open_work_queue(work_queue)
+    try:
+        count = queue.put(source_name, spider.list_shards(), reset=reset)
+        print(f"Work queue {source_name} -> {count} shards added")
+    finally:
+        queue.close()
+    return count
+
+
+def run_crawl(source_name: str, spider, save_product: Callable, checkpoint_path: Path | str,
+              price_change_only: bool = False, price_refresh: bool = False, work_queue: str | None = None):
+    """
+    Обход источника <source_name> пауком <spider> с записью товаров через save_product.
+    price_change_only=True - новая строка в таблице цен пишется только при изменении цены
+    price_refresh=True - для товаров, которые уже есть в базе, цена берётся из листинга без запроса деталей
+    work_queue - режим воркера распределённого обхода (строка настройки parsers.work_queue.open_work_queue):
+    категории арендуются из очереди, журнал обхода не ведётся (незавершённый шард вернётся в очередь), артикулы
+    источника при старте не загружаются (кроме режима price_refresh).
+    Иначе ведётся журнал обхода <checkpoint_path>: после падения следующий запуск продолжит с первого
+    незаписанного товара
+    """
+    session_factory = get_session_factory('catalog')
+    # воркер не загружает все артикулы источника: товары пишутся через upsert по уникальным индексам.
+    # Артикулы нужны только режиму обновления цен (known_articles)
+    service_data = CategoryService(session_factory=session_factory, source_name=source_name,
+                                   preload_articles=not work_queue or price_refresh,
+                                   price_change_only=price_change_only)
+
+    """
+    Мы имеем класс CatalogCRUD, который требует сессию для создания. Это нормальная практика, 
+    так называемый паттерн "Unit of Work". Управление жизненным циклом сессии (создание, коммит, закрытие) должно быть 
+    отделено от класса CRUD. Поэтому создаём сессию в менеджере контекста и для каждой сессии создаём объект CatalogCRUD
+    """
+
+    known_articles = service_data.articles if price_refresh else None
+    if work_queue:
+        queue = open_work_queue(work_queue)
+        checkpoint = None
+        products = crawl_leased_shards(queue, source_name, partial(spider.crawl_shard, known_articles=known_articles))
+    else:
+        queue = None
+        checkpoint = CrawlCheckpoint(checkpoint_path)
+        products = spider.crawl(known_articles=known_articles, checkpoint=checkpoint)
+    completed = False
+    try:
+        # паук и запись в базу работают параллельно: паук в отдельном потоке, запись - в текущем
+        pipeline = IngestionPipeline(products, handler=partial(save_products, service_data, save_product=save_product,
+                                                               product_key=spider.product_key,
+                                                               checkpoint=checkpoint, work_queue=queue))
+        pipeline.run()
+        completed = True
+        print_report(spider, price_refresh=price_refresh)
+    finally:
+        service_data.close()
+        if checkpoint is not None:
+            if completed:
+                # обход завершён и все цены записаны: следующий запуск начнёт новый обход
+                checkpoint.finish()
+            checkpoint.close()
+        if queue is not None:
+            queue.close()
@@ -0,0 +1,23 @@
+from pathlib import Path
+import os
+
+
+"""
+Каталог рабочих данных парсеров вне дерева исходников: перехваченные cookies и токены (parsers.session_store),
+дисковый кеш ответов (parsers.http_cache), журналы обхода (parsers.checkpoint) и очередь SQLite (parsers.work_queue).
+Задаётся переменной окружения PARSERS_DATA_DIR, по умолчанию ~/.retail_price_analytics
+    sessions/                       - json с заголовками и cookies на каждый хост
+    <source>/http_cache/            - кеш ответов паука источника
+    <source>/checkpoint.sqlite      - журнал обхода источника
+    work_queue.sqlite               - очередь распределённого обхода (backend 'sqlite')
+    unsaved_prices/                 - цены, которые не удалось записать в базу (parsers.price_buffer)
+"""
+
+
+def data_dir() -> Path:
+    return Path(os.getenv("PARSERS_DATA_DIR") or Path.home() / ".retail_price_analytics")
+
+
+def data_path(*parts: str) -> Path:
+    # путь внутри каталога данных; каталоги создают сами хранилища при записи
+    return data_dir().joinpath(*parts)
@@ -1,5 +1,5 @@
 from typing import List, Optional
-from pydantic import BaseModel, root_validator
+from pydantic import BaseModel, Field, model_validator
 
 
 class Price(BaseModel):
@@ -41,6 +41,11 @@ class GroupProperty(BaseModel):
     groupProperty: List[PropertyProduct] | None
 
 
+class BreadCrumb(BaseModel):
+    categoryListName: Optional[str] = None
+    categories: Optional[List['BreadCrumb']] = None
+
+
 class Product(BaseModel):
     productId: int
     productName: str
@@ -51,41 +56,36 @@ class Product(BaseModel):
 
     # Details fields
     categories: List[str] = []
+    breadCrumbs: Optional[List[BreadCrumb]] = Field(default=None, exclude=True)
     quantityInfo: QuantityInfo
     description: ProductDescription
     additionalProperties: List[GroupProperty]
     customPropertyGroup: List[PropertyProduct]
 
-    @root_validator(pre=True)
-    def extract_categories(cls, values: dict) -> dict:
-        """Извлекает все названия категорий из структуры breadCrumbs"""
-
+    @model_validator(mode="after")
+    def extract_categories(self):
         """
-        @root_validator(pre=True) указывает, что метод должен выполниться:
-        До основной валидации полей (pre=True)
-        На уровне всей модели (не для конкретного поля)
-        Получает "сырые" входные данные в виде словаря values
-        Должен вернуть модифицированный словарь значений
+        Извлекает все названия категорий из структуры breadCrumbs.
+        Валидатор выполняется после валидации полей (mode="after"): breadCrumbs уже разобраны в модели BreadCrumb,
+        поэтому модель можно валидировать прямо из байтов ответа (model_validate_json) без промежуточного dict
         """
         # https://docs.pydantic.dev/latest/concepts/validators/#model-validators
+        if not self.breadCrumbs:
+            return self
 
-        breadcrumbs = values.get('breadCrumbs')
-        if not breadcrumbs:
-            return values
-
-        def recursive_extract(categories: list) -> List[str]:
+        def recursive_extract(categories: List[BreadCrumb]) -> List[str]:
             """Рекурсивно извлекает названия категорий"""
             names = []
             for item in categories:
-                if 'categoryListName' in item:
-                    names.append(item['categoryListName'])
-                if 'categories' in item and item['categories']:
-                    names.extend(recursive_extract(item['categories']))
+                if item.categoryListName is not None:
+                    names.append(item.categoryListName)
+                if item.categories:
+                    names.extend(recursive_extract(item.categories))
             return names
 
         # Извлекаем и сохраняем категории
-        values['categories'] = recursive_extract(breadcrumbs)
-        return values
+        self.categories = recursive_extract(self.breadCrumbs)
+        return self
 
 
 class ProductListing(BaseModel):
@@ -95,4 +95,18 @@ class ProductListing(BaseModel):
 
 
 class ProductData(BaseModel):
-    product: Product
+    # ответ api /product/<id>. product == None - товара нет
+    product: Optional[Product] = None
+
+
+class ListingPageProps(BaseModel):
+    listing: ProductListing
+
+
+class ListingProps(BaseModel):
+    pageProps: ListingPageProps
+
+
+class ListingPage(BaseModel):
+    # __NEXT_DATA__ страницы категории: из всего документа валидируется только props.pageProps.listing
+    props: ListingProps
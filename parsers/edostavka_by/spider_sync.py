@@ -1,100 +1,94 @@
 from parsers.network_traffic import RequestSniffer
+from parsers.concurrency import ordered_map
+from parsers.pagination import fetch_pages
+from parsers.price_record import PriceRecord
+from parsers.http_cache import HttpCache
+from parsers.data_dir import data_path
+from parsers.throttle import Throttle
+from parsers.session_store import AUTH_ERROR_STATUSES
+from parsers.transport import HttpTransport
 import parsers.edostavka_by.schemas as schemas
-import requests
 from typing import Dict
 from bs4 import BeautifulSoup
-import pickle
-import os
-import json
-from pathlib import Path
+from parsers.next_data import validate_next_data
+from parsers.validation import validate_json
 from typing import Iterator
 
 
-class CategoriesIterationState:
-
-    def __init__(self):
-        self._state_file_path = self._get_state_file_path()
-        self.state = self._read_state_from_file()
-
-    def _get_state_file_path(self) -> Path:
-        module_dir = Path(__file__).parent  # Получаем абсолютный путь к директории текущего модуля
-        return module_dir / "state.pickle"
-
-    def _read_state_from_file(self) -> dict:
-        if not os.path.exists(self._state_file_path):
-            return {"i": 0, "j": 0}
-        else:
-            print('Parser will continue to execute using the "state.pickle" file')
-            input('Press Enter to continue... ')
-            with open(self._state_file_path, 'rb') as f:
-                return pickle.load(f)
-
-    def write_state_2_file(self) -> bool:
-        with open(self._state_file_path, 'wb') as f:
-            pickle.dump(self.state, f)
-            return True
-
-    def delete_state_file(self) -> None:
-        os.remove(self._state_file_path)
-
-
-class Spider(CategoriesIterationState):
+class Spider:
 
     _host = "https://edostavka.by"
     _api = "https://api2.edostavka.by/api/v2"
-
-    def __init__(self):
+    # время жизни ответов в кеше (см. parsers.http_cache.HttpCache). Листинги с ценами не кешируются
+    HTTP_CACHE_RULES = [
+        (r'^https://edostavka\.by/categories$', 24 * 3600),
+        (r'/api/v2/product/\d+$', 0),  # детали товара - всегда условный запрос (цена внутри документа)
+    ]
+    # заголовки запросов к api (задаются один раз для всех запросов)
+    API_HEADERS = {
+        'Accept': 'application/json',
+        'Accept-Language': 'ru-RU,ru;q=0.8,en-US;q=0.5,en;q=0.3',
+        'Content-Type': 'application/json',
+        'User-Agent': 'SiteEdostavka/1.0.0',
+        'Web-User-Agent': 'SiteEdostavka/1.0.0'
+    }
+
+    def __init__(self, details_concurrency: int = 8, pages_concurrency: int = 4, http_cache: bool = True):
+        """
+        details_concurrency - сколько запросов деталей товара выполняется одновременно (1 - последовательно)
+        pages_concurrency - сколько страниц листинга категории запрашивается одновременно
+        http_cache - кешировать ответы на диске (edostavka_by/http_cache в каталоге данных parsers.data_dir)
+        """
         print("Running <Spider edostavka.by>")
 
-        super().__init__()
+        self.details_concurrency = details_concurrency
+        self.listing_prices = 0  # сколько цен взято из листингов (режим обновления цен)
+        self.pages_concurrency = pages_concurrency
         self._sniffer = RequestSniffer(headless=True)
-        try:
-            print("Intercept cookies & headers -> start")
 
-            self._session = self._get_request_session()
-
-            print("Intercept cookies & headers -> done")
+        concurrency = max(details_concurrency, pages_concurrency)
+        cache = HttpCache(data_path("edostavka_by", "http_cache"), rules=self.HTTP_CACHE_RULES) if http_cache else None
+        # ограничение скорости запросов к хостам источника и повторы при 429 / 5xx
+        throttle = Throttle(max_concurrency=concurrency)
+        try:
+            # сайт: заголовки и cookies браузера (сохраняются между запусками, см. parsers.session_store)
+            self.transport = HttpTransport(self._host, capture=self._get_headers_cookies, concurrency=concurrency,
+                                            cache=cache, throttle=throttle)
         except Exception as _ex:
             print("Intercept cookies & headers -> error!")
             raise _ex
+        # api: постоянные заголовки приложения, токен (apiToken) берётся из cookies сайта
+        self._api_transport = HttpTransport(self._api, headers=self.API_HEADERS, concurrency=concurrency,
+                                            cache=cache, throttle=throttle)
 
     def _get_headers_cookies(self) -> Dict:
 
-        request_details = self._sniffer.fetch_request_details(url=f'{self._host}/')
-
-        request_details = [i for i in request_details if i['url'] == f'{self._host}/']
-        if not request_details:
+        # нужен только запрос главной страницы и cookie apiToken (токен для api2.edostavka.by)
+        entry = self._sniffer.capture_request(url=f'{self._host}/',
+                                              predicate=lambda request: request['url'] == f'{self._host}/',
+                                              required_cookies=('apiToken',))
+        if not entry:
             raise ValueError('<request_details> is empty')
-        headers = request_details[0]['request_headers']
-        cookies = {x['name']: x['value'] for x in request_details[0]['cookies']}
-        self._sniffer = None
-        return {'headers': headers, 'cookies': cookies}
-
-    def _get_request_session(self) -> requests.Session:
-        session = requests.Session()
-        headers_cookies_dict = self._get_headers_cookies()
-        session.headers.update(headers_cookies_dict['headers'])
-        session.cookies.update(headers_cookies_dict['cookies'])
-        return session
-
-    def _get_html_response(self, url, host=True) -> str:
-        response = self._session.get(self._host + url if host else url)
+        return {'headers': entry['request_headers'], 'cookies': entry['cookies']}
+
+    def _get_html_response(self, url, host=True, raw=False) -> str | bytes:
+        # raw=True - тело ответа в байтах, без декодирования в str
+        response = self.transport.get(self._host + url if host else url)
         if response.status_code != 200:
             raise ValueError(f'for url > {url} status_code == {response.status_code}')
-        return response.text
-
-    def _get_json_response(self, endpoint) -> dict:
-        headers = {
-            'Accept': 'application/json',
-            'Accept-Encoding': 'gzip, deflate, br, zstd',
-            'Accept-Language': 'ru-RU,ru;q=0.8,en-US;q=0.5,en;q=0.3',
-            'apiToken': self._session.cookies.get('apiToken', None),
-            'Content-Type': 'application/json',
-            'User-Agent': 'SiteEdostavka/1.0.0',
-            'Web-User-Agent': 'SiteEdostavka/1.0.0'
-        }
-        response = requests.get(url=self._api + endpoint, headers=headers)
-        return response.json()
+        return response.content if raw else response.text
+
+    def _get_json_response(self, endpoint, raw=False) -> dict | bytes:
+        # raw=True - тело ответа в байтах (для валидации моделью прямо из json, см. parsers.validation)
+        session = self.transport.session
+        response = self._api_transport.get(self._api + endpoint,
+                                           headers={'apiToken': session.cookies.get('apiToken', None)})
+        if response.status_code in AUTH_ERROR_STATUSES:
+            # токен устарел - перехватываем cookies сайта заново и повторяем запрос с новым токеном
+            self.transport.refresh(session)
+            response = self._api_transport.get(self._api + endpoint,
+                                               headers={'apiToken': self.transport.cookies.get('apiToken', None)})
+        return response.content if raw else response.json()
 
     def get_categories(self) -> list[dict]:
         categories = []
@@ -121,36 +115,39 @@ class Spider(CategoriesIterationState):
         # example <categories>: [{category, subcategories[]}, {...} ]
         return categories
 
-    def _extract_page_props(self, url) -> dict:
-        html: str = self._get_html_response(url)
-        soup = BeautifulSoup(html, 'html.parser')
-        script_tag: soup = soup.find('script', id='__NEXT_DATA__')
-        json_data: str = script_tag.string
-        data: json = json.loads(json_data)
-        return data
-
-    def collect_products(self, url, pagination=None, products=None) -> list:
-        if products is None:
-            products = []
-
-        json_data: dict = self._extract_page_props(url + pagination if pagination else url)
-        json_data_listing = json_data["props"]["pageProps"]["listing"]
-        product_listing = schemas.ProductListing(**json_data_listing)
-        products.extend(product_listing.products)
-        # The base case of recursion
-        if product_listing.pageNumber >= product_listing.pageAmount:
-            # product_listing.products = products
-            return products
-        pagination = f"?page={str(product_listing.pageNumber + 1)}"
-        return self.collect_products(url, pagination, products)
+    def collect_products(self, url) -> Iterator[schemas.Product]:
+        """Товары листинга субкатегории <url>, страница за страницей (parsers.pagination.fetch_pages)"""
+        def fetch_page(page: int) -> schemas.ProductListing:
+            document = self._get_html_response(url if page == 1 else f"{url}?page={page}", raw=True)
+            # из __NEXT_DATA__ валидируется только props.pageProps.listing, прямо из байтов
+            return validate_next_data(document, schemas.ListingPage).props.pageProps.listing
+
+        # число страниц (pageAmount) известно из первой страницы, остальные запрашиваются параллельно
+        count = 0
+        for product_listing in fetch_pages(fetch_page, last_page=lambda listing: listing.pageAmount,
+                                           max_workers=self.pages_concurrency):
+            count += len(product_listing.products)
+            yield from product_listing.products
+        print(f"Collect products on {self._host}{url} -> done, {count} products")
 
     def get_product_details(self, product_id: int) -> schemas.Product or None:
-        json_response = self._get_json_response(f"/product/{str(product_id)}")
-        if json_response.get('product', None):
-            product_details = schemas.Product(**json_response['product'])
-            return product_details
-
-    def crawl(self) -> Iterator[schemas.Product]:
+        document = self._get_json_response(f"/product/{str(product_id)}", raw=True)
+        return validate_json(schemas.ProductData, document).product
+
+    @staticmethod
+    def listing_price_record(item: schemas.Product, known_articles) -> PriceRecord | None:
+        # цена известного товара из листинга. None - товар новый (нужны детали)
+        article = str(item.productId)
+        if article not in known_articles:
+            return None
+        return PriceRecord(article=article, price=float(item.price.discountedPrice))
+
+    @staticmethod
+    def product_key(product: schemas.Product) -> str:
+        return str(product.productId)
+
+    def list_shards(self) -> list[str]:
+        """Единицы работы обхода (см. parsers.work_queue): url субкатегорий"""
         #Собраем все категории с сайта. Список списков, где главная категория со списком субкатегорий
         try:
             print(f"Get all categories on {self._host}/categories -> start")
@@ -160,48 +157,50 @@ class Spider(CategoriesIterationState):
         except Exception as _ex:
             print("Get all categories on {self._host} -> error!")
             raise _ex
-
-        try:
-            start_i = self.state['i']  # загружаем состояние обхода списка категорий из файла pickle
-        except Exception as _ex:
-            start_i = 0
-        # Итерируемся по главным категориям
-        for i in range(start_i, len(categories)):
-            self.state['i'] = i
-            self.write_state_2_file()  # # записываем состояние обхода списка категорий в файл pickle
-            category = categories[i]
-
+        return [subcategory['url'] for category in categories for subcategory in category['subcategories']]
+
+    def crawl_shard(self, shard: str, known_articles=None, checkpoint=None) -> Iterator[schemas.Product | PriceRecord]:
+        """
+        Товары одной субкатегории <shard> (url), аргументы - см. parsers.crawl_runner. Детали товаров первой
+        страницы листинга запрашиваются, пока следующие страницы ещё загружаются. Ошибка запроса листинга
+        пробрасывается наружу (товары предыдущих страниц к этому моменту уже отданы)
+        """
+        def fetch_product(item: schemas.Product) -> schemas.Product | PriceRecord:
+            if known_articles is not None:
+                price_record = self.listing_price_record(item, known_articles)
+                if price_record:
+                    return price_record
+            return self.get_product_details(int(item.productId))
+
+        print(f"Collect products  on {self._host}{shard} -> start")
+        product_listing = self.collect_products(shard)
+        if checkpoint is not None:
+            product_listing = (item for item in product_listing if not checkpoint.is_done(item.productId))
+
+        # детали товаров запрашиваются параллельно, порядок товаров сохраняется как в листинге
+        products_details = ordered_map(fetch_product,
+                                       product_listing,
+                                       max_workers=self.details_concurrency,
+                                       return_exceptions=True)
+        for schemas_product_details in products_details:
+            if isinstance(schemas_product_details, Exception):
+                print(schemas_product_details)
+                continue
+            if schemas_product_details is None:  # в ответе нет товара
+                continue
+            if isinstance(schemas_product_details, PriceRecord):
+                self.listing_prices += 1
+            yield schemas_product_details
+
+    def crawl(self, known_articles=None, checkpoint=None) -> Iterator[schemas.Product | PriceRecord]:
+        """Обход всех субкатегорий по очереди (аргументы - как у crawl_shard)"""
+        # Итерируемся по главным категориям и их субкатегориям
+        for shard in self.list_shards():
             try:
-                start_j = self.state['j']
+                yield from self.crawl_shard(shard, known_articles=known_articles, checkpoint=checkpoint)
             except Exception as _ex:
-                start_j = 0
-
-            # Итерируемся по субкатегориям главной категории categories[i]
-            for j in range(start_j, len(category['subcategories'])):
-                self.state['j'] = j
-                subcategory = category['subcategories'][j]
-                try:
-                    print(f"Collect products  on {self._host}{subcategory['url']} -> start")
-                    product_listing = self.collect_products(subcategory['url'])
-                    print(f"Collect products -> done")
-                except Exception as _ex:
-                    print(f"Collect products on {self._host}{subcategory['url']} -> error!")
-                    continue
-
-                ###
-                for schemas_product in product_listing:
-                    try:
-                        schemas_product_details = self.get_product_details(int(schemas_product.productId))
-                        yield schemas_product_details
-                    except Exception as _ex:
-                        print(_ex)
-                        continue
-
-            self.state['j'] = 0
-        try:
-            os.remove(self._state_file_path)
-        except Exception as _ex:
-            print(_ex)
+                print(f"Collect products on {self._host}{shard} -> error!")
+                continue
 
 # if __name__ == "__main__": # example
 # spider = Spider()
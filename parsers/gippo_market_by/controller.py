@@ -1,62 +1,68 @@
 from parsers.gippo_market_by.spider_sync import Spider
-from database.session import get_session_factory
 from parsers.service import CategoryService
+from parsers import crawl_runner
 from datetime import datetime as dt
+from parsers.data_dir import data_path
 
 
-def main():
-    spider = Spider()
-    session_factory = get_session_factory('catalog')
-    service_data = CategoryService(session_factory=session_factory, source_name='gippo-market.by')
-    for product in spider.crawl():
-        product_id = service_data.articles.get(str(product.id), None)
-        if not product_id:
-            # manufacturer
-            manufacturer_id = service_data.get_manufactory_id(trademark=product.manufacturer.trademark,
-                                                              full_name=product.manufacturer.name,
-                                                              country=product.manufacturer.country)
-
-            # product
-            product_id = service_data.get_product_id(manufacturer_id=manufacturer_id,
-                                                     name=product.name.strip(),
-                                                     article=str(product.id),
-                                                     barcode=product.barcode.strip() if product.barcode else None,
-                                                     description=product.description.strip() if product.description else None,
-                                                     unit=product.unit,
-                                                     composition=None,
-                                                     storage_info=product.storage_info)
-            # categories / product_category
-            categories_id_list = []
-            for i, category in enumerate(product.categories):
-                parent_name = category.parent_title
-                try:
-                    category_id = service_data.get_category_id(category_name=category.title, parent_name=parent_name)
-                except AttributeError:
-                    # в некоторых ответах источника содержится некорректные данные родителя категории. для таких случаев
-                    # будем использовать предыдущий элемент
-                    parent_name = product.categories[i - 1].title if i != 0 else None
-                    category_id = service_data.get_category_id(category_name=category.title, parent_name=parent_name)
-                categories_id_list.append(category_id)
-            # relationship product-category
-            service_data.save_product_category_relations(product_id=product_id, categories_id=categories_id_list)
-
-            # properties
-            for property in product.properties:
-                property_id = service_data.get_property_id(name=property.name,
-                                                           group=property.group
-                                                           )
-                property_values_list = [property.value]
-                # relationship product-property
-                service_data.save_product_property_values_relations(product_id=product_id,
-                                                                    property_id=property_id,
-                                                                    values=property_values_list)
-
-            # product_images
-            service_data.save_product_images_relations(product_id=product_id,
-                                                       image_urls_list=product.images)
-        #
-        if product.price:
-            service_data.save_product_price(product_id=product_id,
-                                            price=float(product.price),
-                                            date_time=str(dt.now().replace(microsecond=0)))
+SOURCE_NAME = 'gippo-market.by'
 
+
+def save_product(service_data: CategoryService, product):
+    price = float(product.price) if product.price else None
+    date_time = str(dt.now().replace(microsecond=0))
+    product_id = service_data.articles.get(str(product.id), None)
+    if product_id:
+        service_data.save_product_price(product_id=product_id, price=price, date_time=date_time)
+        return
+
+    with service_data.product_writer() as writer:
+        # manufacturer
+        manufacturer_id = writer.get_manufactory_id(trademark=product.manufacturer.trademark,
+                                                    full_name=product.manufacturer.name,
+                                                    country=product.manufacturer.country)
+
+        # product
+        product_id = writer.get_product_id(manufacturer_id=manufacturer_id,
+                                           name=product.name.strip(),
+                                           article=str(product.id),
+                                           barcode=product.barcode.strip() if product.barcode else None,
+                                           description=product.description.strip() if product.description else None,
+                                           unit=product.unit,
+                                           composition=None,
+                                           storage_info=product.storage_info)
+        # categories / product_category
+        # полный путь каждой категории от корня заполняется в парсере (Spider.set_category_paths)
+        categories_id_list = writer.get_category_ids([category.path for category in product.categories])
+        # relationship product-category
+        writer.save_product_category_relations(product_id=product_id, categories_id=categories_id_list)
+
+        # properties
+        for property in product.properties:
+            property_id = writer.get_property_id(name=property.name,
+                                                 group=property.group
+                                                 )
+            property_values_list = [property.value]
+            # relationship product-property
+            writer.save_product_property_values_relations(product_id=product_id,
+                                                          property_id=property_id,
+                                                          values=property_values_list)
+
+        # product_images
+        writer.save_product_images_relations(product_id=product_id,
+                                             image_urls_list=product.images)
+        # price
+        writer.save_product_price(product_id=product_id, price=price, date_time=date_time)
+
+
+def enqueue_shards(work_queue: str, reset: bool = True) -> int:
+    # координатор распределённого обхода (см. parsers.crawl_runner.enqueue_shards)
+    return crawl_runner.enqueue_shards(SOURCE_NAME, Spider(), work_queue, reset=reset)
+
+
+def main(price_change_only: bool = False, price_refresh: bool = False,
+         work_queue: str | None = None):
+    # аргументы обхода - см. parsers.crawl_runner.run_crawl
+    crawl_runner.run_crawl(SOURCE_NAME, Spider(), save_product,
+                           checkpoint_path=data_path("gippo_market_by", "checkpoint.sqlite"),
+                           price_change_only=price_change_only, price_refresh=price_refresh, work_queue=work_queue)
@@ -1,10 +1,13 @@
-from typing import List, Optional, Union
-from pydantic import BaseModel, Field, model_validator
+from typing import Dict, List, Optional, Union
+from pydantic import BaseModel, ConfigDict, Field, model_validator
 
 
 class Property(BaseModel):
+    # сырое свойство может хранить название под ключом, равным своему <code> (см. set_group)
+    model_config = ConfigDict(extra='allow')
+
     code: str
-    value: Union[str, int, float, None]
+    value: Union[str, int, float, None] = None
     name: str | None = Field(default=None, alias="name")
     group: Optional[str] = None
     """
@@ -13,6 +16,11 @@ class Property(BaseModel):
     """
     @model_validator(mode="after")
     def set_group(self):
+        if not self.name:
+            self.name = (self.model_extra or {}).get(self.code, None)
+        if self.model_extra:
+            # остальные лишние ключи (type, ...) в модель не попадают, как и раньше
+            self.model_extra.clear()
         if self.group is None:
             if self.code in ["fats", "proteins", "energy", "energyJ", "carbohydrates"]:
                 self.group = "Пищевая ценность"
@@ -30,7 +38,8 @@ class Manufacturer(BaseModel):
 class Breadcrumb(BaseModel):
     title: Optional[str] = None
     slug: Optional[str] = None
-    parent_title: str | None = Field(default=None, exclude=True)  # это поле пустое и не парсится из входных данных
+    # полный путь категории от корня (названия), не парсится из входных данных - заполняется в Spider.set_category_paths
+    path: tuple[str, ...] | None = Field(default=None, exclude=True)
 
 
 class Proposal(BaseModel):
@@ -41,101 +50,87 @@ class Market(BaseModel):
     proposal: Proposal
 
 
+class ProductMarket(BaseModel):
+    proposal: Optional[Proposal] = None
+
+
 class ResponseModel(BaseModel):
     markets: List[Market]
 
 
+# коды свойств, которые вынесены в Product.manufacturer (код: поле Manufacturer)
+MANUFACTURER_PROPERTY_CODES = {'brandText': 'trademark', 'nameCountry': 'country', 'nameManufacturer': 'name'}
+# коды свойств, которые не попадают в Product.properties: единицы измерения уже вынесены в Product.unit, ГМО и
+# импортёр не нужны
+SKIPPED_PROPERTY_CODES = {'short_name_uom', 'containsGMO', 'nameImporter'}
+
+
 class Product(BaseModel):
     id: str
     slug: str
     name: str = Field(..., alias="title")
     barcode: str | None
     description: str | None
-    storage_info: str | None
+    storage_info: str | None = None
     unit: str | None = Field(..., alias="short_name_uom")
     images: List[str] | None
-    properties: List[Property]
-    manufacturer: Optional[Manufacturer]
+    # сырые данные - словарь {key: {code, type, name, value}, ...}, после валидации - список свойств
+    properties: Dict[str, Property] | List[Property] = Field(union_mode="left_to_right")
+    manufacturer: Optional[Manufacturer] = None
     categories: List[Breadcrumb] = Field(None, alias="breadcrumbs")
-    price: str | float | None
+    price: str | float | None = None
+    markets: List[ProductMarket] = Field(default=[], exclude=True)
 
-    @model_validator(mode="before")
-    @classmethod
-    def transform_properties(cls, values: dict):  # values — это сырые данные, переданные в  Product, Product(-> **data)
+    @model_validator(mode="after")
+    def transform_properties(self):
         """
-        Этот декоратор позволяет функции предобработать сырые данные до того, как они
-        будут провалидированы и собраны в модель. В данном случае мы преобразуем запутанный словарь по ключу <properties>
-        в понятный и легкочитаемый список. Т.е при валидации сырые данные будут соответствовать properties: List[Property]
-        Так же выдёргиваем определённые значения из properties и помещаем их с отдельными ключами
+        Запутанный словарь <properties> преобразуется в понятный и легкочитаемый список properties: List[Property].
+        Так же выдёргиваем определённые значения из properties и помещаем их в отдельные поля.
+        Валидатор выполняется после валидации полей (mode="after"): свойства уже разобраны в модели Property, поэтому
+        модель можно валидировать прямо из байтов ответа (model_validate_json) без промежуточного dict
         """
-        props = values.get("properties")
-
-        # если properties нет или это не dict, просто возвращаем как есть
+        props = self.properties
+        # если properties уже список, оставляем как есть
         if not isinstance(props, dict):
-            return values
+            return self
 
         properties_list = []
-        # вычленяем всё, что связано с производителем и выносим в отдельный ключ
+        # вычленяем всё, что связано с производителем и выносим в отдельное поле
         manufacturer = {'trademark': None, 'country': None, 'name': None}
-        values['storage_info'] = None  # -> Product.storage_info
+        self.storage_info = None
         for prop in props.values():
-            if prop.get("code") == 'short_name_uom':
-                # параметр "Единицы измерения" уже вынесен как отдельный аттрибут Product.unit, поэтому не включаем его
+            if prop.code in SKIPPED_PROPERTY_CODES:
                 continue
-            # Значения, связанные с производителем не включаем в properties_list, а выносим в отдельный словарь
-            if prop.get("code") == 'brandText':
-                manufacturer['trademark'] = prop.get("value")
-                continue
-            if prop.get("code") == 'nameCountry':
-                manufacturer['country'] = prop.get("value")
-                continue
-            if prop.get("code") == 'nameManufacturer':
-                manufacturer['name'] = prop.get("value")
-                continue
-            # Игнорируем параметр с ГМО, он не нужен
-            if prop.get("code") == "containsGMO":
+            if prop.code in MANUFACTURER_PROPERTY_CODES:
+                manufacturer[MANUFACTURER_PROPERTY_CODES[prop.code]] = prop.value
                 continue
             # Выносим отдельно условия храненя
-            if prop.get("code") == "conditionsText":
-                values['storage_info'] = f"{prop.get('name') or ''}: {prop.get('value') or ''}"
-                # if  values['storage_info'] == "" -> values['storage_info'] = None
-                if not values['storage_info']:
-                    values['storage_info'] = None
-                continue
-            # Игнорируем параметр импортёра
-            if prop.get("code") == 'nameImporter':
+            if prop.code == "conditionsText":
+                self.storage_info = f"{prop.name or ''}: {prop.value or ''}"
                 continue
-
-            properties_list.append({
-                "code": prop.get("code"),
-                "type": prop.get("type"),
-                "name": prop.get("name") or prop.get(prop.get("code")),
-                "value": str(prop.get("value")),
-            })
-
-        values["properties"] = properties_list
-        values['manufacturer'] = manufacturer
-        values['price'] = None
-        for market in values.get('markets', []):
-            proposal = market.get('proposal', None)
-            if proposal:
-                values['price'] = proposal.get('price', None)
+            prop.value = str(prop.value)
+            properties_list.append(prop)
+
+        self.properties = properties_list
+        self.manufacturer = Manufacturer(**manufacturer)
+        self.price = None
+        for market in self.markets:
+            if market.proposal:
+                self.price = market.proposal.price
                 break
-
-        return values
+        return self
 
     def add_main_category(self, category_title: str, category_slug: str) -> Optional[Breadcrumb]:
         """Ответ с деталями продукта приходит с не всегда полным списком категорий. Данный метод добавляет во внешнем
             методе парсера главную категорию (текущую по итерации) в список Product.categories"""
         if self.categories is None:
-            self.categories = [Breadcrumb(title=category_title, slug=category_slug, parent_title=None)]
+            self.categories = [Breadcrumb(title=category_title, slug=category_slug)]
             return
         titles_list = [i.title for i in self.categories]
         if category_title not in titles_list:
             new_category = Breadcrumb(
                 title=category_title,
-                slug=category_slug,
-                parent_title=None
+                slug=category_slug
             )
             self.categories.append(new_category)
         return
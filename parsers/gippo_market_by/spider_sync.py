@@ -1,102 +1,102 @@
 from parsers.network_traffic import RequestSniffer
-import requests
-from typing import Dict, List
-from .schemas import Product
-import pickle
-import os
-from pathlib import Path
+from parsers.pagination import fetch_pages
+from parsers.http_cache import HttpCache
+from parsers.data_dir import data_path
+from parsers.throttle import Throttle
+from parsers.transport import HttpTransport
+from urllib.parse import urlparse, parse_qs
+from typing import Dict, Iterator, List
+from .schemas import Product, ResponseModel
+from parsers.price_record import PriceRecord
+from parsers.validation import validate_json
+from pydantic import ValidationError
 
 
-class CategoriesIterationState:
-
-    def __init__(self):
-        self._state_file_path = self._get_state_file_path()
-        self.state = self._read_state_from_file()
-
-    def _get_state_file_path(self) -> Path:
-        module_dir = Path(__file__).parent  # Получаем абсолютный путь к директории текущего модуля
-        return module_dir / "state.pickle"
-
-    def _read_state_from_file(self) -> dict:
-        if not os.path.exists(self._state_file_path):
-            return {"i": 0}
-        else:
-            print('Parser will continue to execute using the "state.pickle" file')
-            input('Press Enter to continue... ')
-            with open(self._state_file_path, 'rb') as f:
-                return pickle.load(f)
-
-    def write_state_2_file(self) -> bool:
-        with open(self._state_file_path, 'wb') as f:
-            pickle.dump(self.state, f)
-            return True
-
-    def delete_state_file(self) -> None:
-        os.remove(self._state_file_path)
-
-
-class Spider(CategoriesIterationState):
+class Spider:
 
     _host = "https://gippo-market.by"
     _api = "https://app.willesden.by/api/guest/shop"
-
-    def __init__(self):
+    # время жизни ответов в кеше (см. parsers.http_cache.HttpCache). Листинги с ценами не кешируются
+    HTTP_CACHE_RULES = [
+        (r'/api/guest/shop/categories$', 24 * 3600),
+        (r'/api/guest/shop/products/[^/?]+\?', 0),  # детали товара - всегда условный запрос (цена внутри документа)
+    ]
+
+    def __init__(self, pages_concurrency: int = 4, http_cache: bool = True):
+        """
+        pages_concurrency - сколько страниц листинга категории запрашивается одновременно
+        http_cache - кешировать ответы на диске (gippo_market_by/http_cache в каталоге данных parsers.data_dir)
+        """
         print("Running <Spider gippo-market.by>")
 
-        super().__init__()
+        self.pages_concurrency = pages_concurrency
+        self.listing_prices = 0  # сколько цен взято из листингов (режим обновления цен)
+        # дерево категорий (см. load_categories)
+        self._main_categories = None
+        self._categories_article_hash = None
+        self._categories_slug_hash = None
         self._sniffer = RequestSniffer(headless=True)
+        cache = HttpCache(data_path("gippo_market_by", "http_cache"), rules=self.HTTP_CACHE_RULES) if http_cache else None
         try:
-            print("Intercept cookies & headers -> start")
-
-            self._session = self._get_request_session()
-
-            print("Intercept cookies & headers -> done")
+            # заголовки и cookies браузера сохраняются между запусками (см. parsers.session_store), запросы идут
+            # через дисковый кеш и ограничитель скорости (повторы при 429 / 5xx)
+            self.transport = HttpTransport(self._host, capture=self._get_headers_cookies,
+                                            concurrency=pages_concurrency, cache=cache,
+                                            throttle=Throttle(max_concurrency=pages_concurrency))
         except Exception as _ex:
             print("Intercept cookies & headers -> error!")
             raise _ex
 
-    def _get_headers(self) -> Dict:
-
-        request_details = self._sniffer.fetch_request_details(url=f'{self._host}/')
-        headers = {}
-        for item in request_details:
-            if item['request_headers'].get('baggage', None):
-                headers = item['request_headers']
-
-        return headers
+    def _get_headers_cookies(self) -> Dict:
 
-    def _get_request_session(self) -> requests.Session:
-        session = requests.Session()
-        headers_dict = self._get_headers()
-        session.headers.update(headers_dict)
-        return session
+        # нужен только первый запрос к api с заголовком baggage
+        entry = self._sniffer.capture_request(url=f'{self._host}/',
+                                              predicate=lambda request: bool(request['request_headers'].get('baggage')))
+        if not entry:
+            raise ValueError('<request_details> does not contain a request with "baggage" header')
+        # api источника работает без cookies, нужны только заголовки
+        return {'headers': entry['request_headers'], 'cookies': []}
 
-    def _get_json_response(self, url, host=True) -> dict or list:
-        response = self._session.get(self._api + url if host else url)
+    def _get_json_response(self, url, host=True, raw=False) -> dict or list or bytes:
+        # raw=True - тело ответа в байтах (для валидации моделью прямо из json, см. parsers.validation)
+        response = self.transport.get(self._api + url if host else url)
         if response.status_code != 200:
             raise ValueError(f'for url > {url} status_code == {response.status_code}')
-        return response.json()
+        return response.content if raw else response.json()
 
     def get_categories(self) -> List[Dict]:
         r = self._get_json_response('/categories')
         return r
 
-    def collect_products(self, slug, url=None, products=None):
-        if not url:
-            url = self._api + "/products?page=1"
-        if not products:
-            products = []
-        response: dict = self._get_json_response(url=f"{url}&filter[categories][slug]={slug}&market_id=73", host=False)
-        [products.append(item_) for item_ in response['data']]
-        url = response['links']['next']
-        if not url:
-            return products
-        return self. collect_products(slug=slug, url=url, products=products)
-
-    def get_product_details(self, product_id, category_id):
+    def collect_products(self, slug) -> Iterator[dict]:
+        """
+        Товары листинга категории <slug>, страница за страницей (parsers.pagination.fetch_pages). Число страниц
+        берётся из meta.last_page, без него страницы читаются последовательно по ссылке links.next
+        """
+        def fetch_page(page: int) -> dict:
+            return self._get_json_response(url=f"/products?page={page}&filter[categories][slug]={slug}&market_id=73")
+
+        def last_page(response: dict) -> int | None:
+            return (response.get('meta') or {}).get('last_page', None)
+
+        def next_page(response: dict) -> int | None:
+            # номер следующей страницы из ссылки links.next
+            url = (response.get('links') or {}).get('next', None)
+            if not url:
+                return None
+            return int(parse_qs(urlparse(url).query)['page'][0])
+
+        count = 0
+        for response in fetch_pages(fetch_page, last_page=last_page, next_page=next_page,
+                                    max_workers=self.pages_concurrency):
+            count += len(response['data'])
+            yield from response['data']
+        print(f"Collect products {slug} -> done, {count} products")
+
+    def get_product_details(self, product_id, category_id) -> Product:
         url = f"/products/{product_id}?category_id={category_id}&market_id=73"
-        response: dict = self._get_json_response(url=url, host=True)
-        return response
+        document: bytes = self._get_json_response(url=url, host=True, raw=True)
+        return validate_json(Product, document)
 
     @staticmethod
     def cut_categories(categories) -> List[dict]:
@@ -112,65 +112,112 @@ class Spider(CategoriesIterationState):
                 main_categories.append(category_item)
         return main_categories
 
-    def crawl(self):
+    @staticmethod
+    def category_path(category_id, categories_article_hash: dict) -> tuple:
+        # Поднимается по parent_id до корня. Корневая категория "Все" (slug: vse) в путь не входит
+        path = []
+        while category_id in categories_article_hash:
+            category = categories_article_hash[category_id]
+            if not category['parent_id'] and category['slug'] == "vse":
+                break
+            path.append(category['name'])
+            category_id = category['parent_id']
+        return tuple(reversed(path))
+
+    def set_category_paths(self, product: Product, category_item: dict,
+                           categories_article_hash: dict, categories_slug_hash: dict):
+        previous_path = ()
+        for category in product.categories:
+            category_id = categories_slug_hash.get(category.slug, None)
+            if category.title is None:  # Если в документе нет поля - это главная категория текущей итерации
+                category.title = category_item['title']
+                category.path = (category.title,)
+            elif category_id is not None:
+                # путь родителя берём из дерева категорий источника
+                category.path = self.category_path(category_id, categories_article_hash)[:-1] + (category.title,)
+            else:
+                # категории нет в дереве источника - родителем считаем предыдущий элемент хлебных крошек
+                category.path = previous_path + (category.title,)
+            previous_path = category.path
+
+    @staticmethod
+    def listing_price_record(product_item: dict, known_articles) -> PriceRecord | None:
+        # цена известного товара из ответа листинга. None - товар новый или цены в листинге нет (нужны детали)
+        article = str(product_item.get('id'))
+        if article not in known_articles:
+            return None
+        try:
+            markets = ResponseModel(**product_item).markets
+        except ValidationError:
+            return None
+        if not markets:
+            return None
+        return PriceRecord(article=article, price=markets[0].proposal.price)
+
+    @staticmethod
+    def product_key(product: Product) -> str:
+        return str(product.id)
+
+    def load_categories(self) -> List[dict]:
+        """
+        Загружает дерево категорий источника (один раз на процесс). Возвращает главные категории, по которым идёт
+        обход и запрос товаров
+        """
         try:
             print(f"Get all categories on {self._host} -> start")
             categories: List[dict] = self.get_categories()
             main_categories: List[dict] = self.cut_categories(categories)  # По этим категориям происходит итерация и запрос на получение товаров
             # Тут ключи - id категорий, значение - словаь объектов категории
-            categories_article_hash: dict = {i['id']: {'name': i['title'], 'slug': i['slug'], 'parent_id': i['parent_id']}
-                                     for i in categories}  # {id: {name: v, slug: v, parent_id:v}, id: {...}, ...}
-            categories_slug_hash: dict = {i['slug']: i['id'] for i in categories}
-
+            # {id: {name: v, slug: v, parent_id:v}, id: {...}, ...}
+            self._categories_article_hash = {i['id']: {'name': i['title'], 'slug': i['slug'],
+                                                       'parent_id': i['parent_id']} for i in categories}
+            self._categories_slug_hash = {i['slug']: i['id'] for i in categories}
+            self._main_categories = {i['slug']: i for i in main_categories}
         except Exception as _ex:
             print(f"Get all categories -> error! {_ex}")
             raise _ex
+        return main_categories
 
-        try:
-            start_i = self.state['i']  # загружаем состояние обхода списка категорий из файла pickle
-        except Exception as _ex:
-            start_i = 0
-
-        for i in range(start_i, len(main_categories)):
-            self.state['i'] = i
-            self.write_state_2_file()  # # записываем состояние обхода списка категорий в файл pickle
-            category_item = main_categories[i]
-            category_id = category_item['id']
-
-            print(f"Collect products {category_item['title']} -> start")
-            products = self.collect_products(category_item['slug'])
-            print(f"Collect products -> done")
-
-            for product_item in products:
-                try:
-                    product_details = self.get_product_details(product_item['id'], category_id)
-                    schemas_product_details = Product(**product_details)
-                    # Добавляем в schemas_product_details.categories главную родительскую категорию первого уровня
-                    # если её там нет
-                    schemas_product_details.add_main_category(category_title=category_item['title'],
-                                                              category_slug=category_item['slug'])
-                    # Добавляем значения в parent_name (имя родительской категории). На текущий момент этот аттрибут none
-                    #
-                    for j in range(len(schemas_product_details.categories)):
-                        if schemas_product_details.categories[j].title is None:  # Если в документе нет поля
-                            schemas_product_details.categories[j].title = category_item['title']
-                            continue
-                        try:
-                            category_article = categories_slug_hash[schemas_product_details.categories[j].slug]
-                        except KeyError:
-                            continue
-                        parent_article = categories_article_hash[category_article]['parent_id']
-                        parent_name = categories_article_hash[parent_article]['name']
-                        if parent_name == 'Все':
-                            parent_name = None
-                        schemas_product_details.categories[j].parent_title = parent_name
-
-                    yield schemas_product_details
-                except Exception as _ex:
-                    print(_ex)
+    def list_shards(self) -> list[str]:
+        """Единицы работы обхода (см. parsers.work_queue): slug главных категорий"""
+        return [category_item['slug'] for category_item in self.load_categories()]
+
+    def crawl_shard(self, shard: str, known_articles=None, checkpoint=None):
+        """Товары одной главной категории <shard> (slug), аргументы - см. parsers.crawl_runner"""
+        if self._main_categories is None:
+            self.load_categories()
+        category_item = self._main_categories[shard]
+        category_id = category_item['id']
+
+        print(f"Collect products {category_item['title']} -> start")
+        # листинг читается постранично: детали товаров запрашиваются, пока следующие страницы ещё загружаются
+        products = self.collect_products(category_item['slug'])
+
+        for product_item in products:
+            if checkpoint is not None and checkpoint.is_done(product_item['id']):
+                continue
+            if known_articles is not None:
+                price_record = self.listing_price_record(product_item, known_articles)
+                if price_record:
+                    self.listing_prices += 1
+                    yield price_record
                     continue
-        try:
-            os.remove(self._state_file_path)
-        except Exception as _ex:
-            print(_ex)
+            try:
+                schemas_product_details = self.get_product_details(product_item['id'], category_id)
+                # Добавляем в schemas_product_details.categories главную родительскую категорию первого уровня
+                # если её там нет
+                schemas_product_details.add_main_category(category_title=category_item['title'],
+                                                          category_slug=category_item['slug'])
+                # Заполняем полный путь (от корня) для каждой категории товара
+                self.set_category_paths(schemas_product_details, category_item,
+                                        self._categories_article_hash, self._categories_slug_hash)
+
+                yield schemas_product_details
+            except Exception as _ex:
+                print(_ex)
+                continue
 
+    def crawl(self, known_articles=None, checkpoint=None):
+        """Обход всех главных категорий по очереди (аргументы - как у crawl_shard)"""
+        for shard in self.list_shards():
+            yield from self.crawl_shard(shard, known_articles=known_articles, checkpoint=checkpoint)
@@ -1,4 +1,5 @@
-from pydantic import BaseModel, model_validator, Field
+from pydantic import BaseModel, ConfigDict, model_validator, field_validator, computed_field, Field
+from collections.abc import Mapping
 import json
 from typing import List, Optional, Union
 
@@ -12,9 +13,75 @@ class Category(BaseModel):
     path: str
 
 
+class CategoryPaths(Mapping):
+    """
+    Неизменяемая таблица: id категории -> полный путь (кортеж названий от корня до самой категории).
+    Строится один раз на всё дерево (build), дальше - только поиск по словарю. Объект передаётся в другие процессы
+    через pickle вместе с Categories
+    """
+
+    def __init__(self, paths: dict):
+        self._paths = dict(paths)
+
+    def __getitem__(self, category_id) -> tuple[str, ...]:
+        return self._paths[category_id]
+
+    def __iter__(self):
+        return iter(self._paths)
+
+    def __len__(self):
+        return len(self._paths)
+
+    def __reduce__(self):
+        return CategoryPaths, (self._paths,)
+
+    @classmethod
+    def build(cls, categories: list) -> 'CategoryPaths':
+        """
+        categories - плоский список Category. Категория без родителя (parentId пустой) - корень дерева.
+        Категории, цепочку родителей которых нельзя восстановить (родителя нет в списке или цепочка зациклена),
+        в таблицу не попадают
+        """
+        by_id = {category.id: category for category in categories}
+        paths = {}
+        broken = set()
+        for category in categories:
+            # поднимаемся к корню, пока не встретим категорию с уже известным путём
+            chain = []
+            chain_ids = set()
+            current = category
+            prefix = ()
+            while True:
+                if current.id in paths:
+                    prefix = paths[current.id]
+                    break
+                if current.id in broken or current.id in chain_ids:
+                    prefix = None
+                    break
+                chain.append(current)
+                chain_ids.add(current.id)
+                if not current.parentId:
+                    break
+                current = by_id.get(current.parentId)
+                if current is None:
+                    prefix = None
+                    break
+            if prefix is None:
+                broken.update(item.id for item in chain)
+                continue
+            for item in reversed(chain):
+                prefix = prefix + (item.name,)
+                paths[item.id] = prefix
+        return cls(paths)
+
+
 class Categories(BaseModel):
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
     categories: List[Category]
     cash_id: dict | None = Field(default=None, exclude=True)  # это поле пустое и не парсится из входных данных
+    # id категории -> путь от корня (см. CategoryPaths), не парсится из входных данных
+    paths: CategoryPaths | None = Field(default=None, exclude=True)
 
     @model_validator(mode="before")
     @classmethod
@@ -80,11 +147,12 @@ class Categories(BaseModel):
     @model_validator(mode="after")
     def __fill_parent_names(self):
         """
-        Заполняет parent_name для каждой категории на основе parentId
+        Заполняет кеш индексов категорий и таблицу полных путей категорий (paths) - один раз на всё дерево
         """
         # cоздаем словарь, где ключ - id категории, значение - объект Category. Что то вроде кеша для быстрого поиска
         categories_dict = {self.categories[i].id: i for i in range(len(self.categories))}
         self.cash_id = categories_dict  # ключ - id категории, значение - индекс категории в списке categories
+        self.paths = CategoryPaths.build(self.categories)
 
         return self
 
@@ -92,16 +160,9 @@ class Categories(BaseModel):
         index = self.cash_id[id_]
         return self.categories[index]
 
-    def get_parents(self, parent_id, parents_list=None):
-        # Этот метод по parent_id подтягивает список всех родителей категории
-        if not parents_list:
-            parents_list = []
-        index = self.cash_id[parent_id]
-        parent = self.categories[index]
-        parents_list.append(parent.name)
-        if parent.parentId:
-            return self.get_parents(parent.parentId, parents_list)
-        return parents_list
+    def get_parents(self, parent_id) -> list[str]:
+        # Этот метод по parent_id подтягивает список всех родителей категории (от ближайшего к корню)
+        return list(reversed(self.paths[parent_id]))
 
 
 class StoreProduct(BaseModel):
@@ -125,7 +186,14 @@ class Property(BaseModel):
     group: Optional[str]
 
 
+FILE_STORAGE_HOST = "https://io.activecloud.com/static-green-market"
+
+
 class Product(BaseModel):
+    """
+    Поля, которых нет в сыром ответе в готовом виде, собираются валидаторами полей (images из files, brand из
+    объекта бренда) и вычисляемым полем properties. Модель можно валидировать прямо из байтов ответа (model_validate_json)
+    """
     id: int | str = Field(default=None, alias="id")
     article: str = Field(default=None, alias="vendorCode")
     slug: str
@@ -133,66 +201,49 @@ class Product(BaseModel):
     unit: str | None = Field(..., alias="quantityLabel")
     barcode: str | None = Field(default=None, alias="gtin")
     storage_info: str | None = Field(default=None, alias="storageConditions")
-    composition: str | None
+    composition: str | None = Field(default=None, validation_alias="description")
     # description: str | None = None
     manufacturer_name: str | None = Field(default=None, alias="producer")
     manufacturer_country: str | None = Field(default=None, alias="producingCountry")
     manufacturer_trademark: str | None = Field(..., alias="brand")
     prices: StoreProduct | None = Field(alias="storeProduct")
-    images: List
-    properties: List[Property]
+    images: List = Field(default=[], validation_alias="files")
+    volume: Union[str, int, float, None] = Field(default=None, exclude=True)
+    energy_cost: Union[str, int, float, None] = Field(default=None, alias="energyCost", exclude=True)
     categoriesIds: List[int]
     categories_: None | List = Field(default=[], exclude=True)
 
-
-    @model_validator(mode="before")
+    @field_validator("images", mode="before")
     @classmethod
-    def preparing_data(cls, incoming_data: dict):  # values — это сырые данные, переданные в  Product, Product(-> **data)
-        """
-        Подготавливает сырые данные для валидации.
-        """
-
-        # Создаём отдельный ключ <properties> в входящем агументе, заполняем его данными
-        incoming_data['properties'] = []
-        volume = incoming_data.get('volume', None)
-        if volume:
-            incoming_data['properties'].append(
-                {'name': 'Количество',
-                 'value': volume,
-                 'group': 'Основные характеристики'}
-            )
-        ###
-        energy_cost = incoming_data.get('energyCost', None)
-        if energy_cost:
-            incoming_data['properties'].append({'name': "Пищевая ценность",
-                                                "value": energy_cost,
-                                                "group": "Пищевая ценность"})
-        ####
-        files = incoming_data.get('files')
-        incoming_data['images'] = []
-        if files:
-            file_storage_host = "https://io.activecloud.com/static-green-market"
-            for filename in files:
-                filename = filename.get('filename')
-                if filename:
-                    incoming_data['images'].append(f"{file_storage_host}/{'1400x1400-'}{filename}")
-        ###
-        if incoming_data.get('brand'):
-            incoming_data['brand'] = incoming_data['brand'].get('title')
-        incoming_data['composition'] = incoming_data.get('description', None)
-
-        return incoming_data
+    def build_image_urls(cls, files):
+        # files: [{'filename': str}, ...] -> полные url изображений
+        images = []
+        for file in files or []:
+            filename = file.get('filename')
+            if filename:
+                images.append(f"{FILE_STORAGE_HOST}/{'1400x1400-'}{filename}")
+        return images
+
+    @field_validator("manufacturer_trademark", mode="before")
+    @classmethod
+    def extract_brand_title(cls, brand):
+        if brand:
+            return brand.get('title')
+        return brand
+
+    @computed_field
+    @property
+    def properties(self) -> List[Property]:
+        # свойства товара, которые есть в ответе отдельными полями
+        properties = []
+        if self.volume:
+            properties.append(Property(name='Количество', value=self.volume, group='Основные характеристики'))
+        if self.energy_cost:
+            properties.append(Property(name="Пищевая ценность", value=self.energy_cost, group="Пищевая ценность"))
+        return properties
 
     def set_categories(self, categories_obj):
-        result = []
-        for category_id in self.categoriesIds:
-            try:
-                category_item = categories_obj.get_item_by_id(category_id)
-                patents_list = categories_obj.get_parents(category_item.parentId)
-                product_categories: list = [category_item.name] + patents_list
-                product_categories.reverse()
-                result.append(product_categories)
-            except KeyError:
-                continue
-        self.categories_ = result
+        # categories_obj.paths - готовые пути категорий от корня (см. CategoryPaths), категории не из дерева пропускаются
+        paths = categories_obj.paths
+        self.categories_ = [paths[category_id] for category_id in self.categoriesIds if category_id in paths]
         return self
@@ -1,10 +1,16 @@
-import requests
-from bs4 import BeautifulSoup
+from parsers.next_data import extract_next_data
 from parsers.network_traffic import RequestSniffer
-from typing import Dict, List
-import json
+from parsers.pagination import fetch_pages, page_count
+from parsers.http_cache import HttpCache
+from parsers.data_dir import data_path
+from parsers.throttle import Throttle
+from parsers.transport import HttpTransport
+from typing import Dict, Iterator
 from parsers.green_dostavka_by.schemas import Categories
-from parsers.green_dostavka_by.schemas import Product
+from parsers.green_dostavka_by.schemas import Product, StoreProduct
+from parsers.price_record import PriceRecord
+from parsers.validation import validate_json
+from pydantic import ValidationError
 
 
 class Spider():
@@ -12,98 +18,143 @@ class Spider():
     _host = "https://green-dostavka.by"
     _api = None
     STOREID = "21"  # CONSTANTA
-
-    def __init__(self):
+    # время жизни ответов в кеше (см. parsers.http_cache.HttpCache). Листинги с ценами не кешируются
+    HTTP_CACHE_RULES = [
+        (r'^https://green-dostavka\.by/catalog/$', 24 * 3600),
+        (r'/api/v1/products/[^/?]+\?', 0),  # детали товара - всегда условный запрос (цена внутри документа)
+    ]
+
+    def __init__(self, pages_concurrency: int = 4, http_cache: bool = True):
+        """
+        pages_concurrency - сколько страниц листинга категории запрашивается одновременно
+        http_cache - кешировать ответы на диске (green_dostavka_by/http_cache в каталоге данных parsers.data_dir)
+        """
         print("Running <Spider green-dostavka.by>")
-
-        # super().__init__()
+        self.pages_concurrency = pages_concurrency
+        self.listing_prices = 0  # сколько цен взято из листингов (режим обновления цен)
+        self._categories = None  # дерево категорий (см. list_shards)
         self._sniffer = RequestSniffer(headless=True)
+        cache = HttpCache(data_path("green_dostavka_by", "http_cache"), rules=self.HTTP_CACHE_RULES) if http_cache else None
         try:
-            print("Intercept cookies & headers -> start")
-
-            self._session = self._get_request_session()
-
-            print("Intercept cookies & headers -> done")
+            # заголовки и cookies браузера сохраняются между запусками (см. parsers.session_store), запросы идут
+            # через дисковый кеш и ограничитель скорости (повторы при 429 / 5xx)
+            self.transport = HttpTransport(self._host, capture=self._get_headers_cookies,
+                                            concurrency=pages_concurrency, cache=cache,
+                                            throttle=Throttle(max_concurrency=pages_concurrency))
         except Exception as _ex:
             print("Intercept cookies & headers -> error!")
             raise _ex
 
     def _get_headers_cookies(self) -> Dict:
 
-        request_details = self._sniffer.fetch_request_details(url=f'{self._host}/')
-
-        request_details = [i for i in request_details if i['url'] == f'{self._host}/']
-        if not request_details:
+        # нужен только запрос главной страницы
+        entry = self._sniffer.capture_request(url=f'{self._host}/',
+                                              predicate=lambda request: request['url'] == f'{self._host}/')
+        if not entry:
             raise ValueError('<request_details> is empty')
-        headers = request_details[0]['request_headers']
-        cookies = {x['name']: x['value'] for x in request_details[0]['cookies']}
-        self._sniffer = None
-
-        return {'headers': headers, 'cookies': cookies}
+        return {'headers': entry['request_headers'], 'cookies': entry['cookies']}
 
-    def _get_request_session(self) -> requests.Session:
-        session = requests.Session()
-        headers_cookies_dict = self._get_headers_cookies()
-        session.headers.update(headers_cookies_dict['headers'])
-        session.cookies.update(headers_cookies_dict['cookies'])
-        return session
-
-    def get_response(self, url, host=True, json_=False) -> str or dict:
-        response = self._session.get(self._host + url if host else url)
+    def get_response(self, url, host=True, json_=False, raw=False) -> str or dict or bytes:
+        # raw=True - тело ответа в байтах, без декодирования в str
+        response = self.transport.get(self._host + url if host else url)
         if response.status_code != 200:
             raise ValueError(f'for url > {url} status_code == {response.status_code}')
         if json_:
             return response.json()
+        if raw:
+            return response.content
         return response.text
 
     def get_categories_schema(self):
-        text_ = self.get_response(url="/catalog/")
-        # json вшит прямо в текст документа. парсим его и сериализуем как json
-        soup = BeautifulSoup(text_, 'html.parser')
-        data_text = soup.find('script', id='__NEXT_DATA__').text
-        data_json = json.loads(data_text)
+        document = self.get_response(url="/catalog/", raw=True)
+        # json вшит прямо в текст документа (<script id="__NEXT_DATA__">), вырезаем его без разбора html
+        data_json = extract_next_data(document)
         categories = Categories(**data_json)
         return categories
 
-    def collect_products_by_category(self, categoryId:int , skip=0, data=None) -> List:
-        if not data:
-            data = []
+    def collect_products_by_category(self, categoryId: int) -> Iterator[dict]:
+        """Товары листинга категории <categoryId>, по LIMIT штук на страницу (parsers.pagination.fetch_pages)"""
         LIMIT = 100  # CONSTANTA
-        end_point = f"/api/v1/products?storeId={self.STOREID}&categoryId={str(categoryId)}&limit={str(LIMIT)}&skip={str(skip)}"
-        resp: dict = self.get_response(url=end_point, json_=True)
-        resp_count = resp.get('count', 0)
-        data.extend(resp.get('items', []))
-        if resp_count < LIMIT + skip:
-            return data
-        else:
-            return self.collect_products_by_category(categoryId, skip+100, data)
-
-    def get_product_details(self, product_slug):
-        end_point = f"/api/v1/products/{product_slug}?storeId={self.STOREID}"
-        resp: dict = self.get_response(url=end_point, json_=True)
-        return resp
 
-    def crawl(self):
-        categories = self.get_categories_schema()
+        def fetch_page(page: int) -> dict:
+            skip = (page - 1) * LIMIT
+            end_point = f"/api/v1/products?storeId={self.STOREID}&categoryId={str(categoryId)}&limit={str(LIMIT)}&skip={str(skip)}"
+            return self.get_response(url=end_point, json_=True)
+
+        # общее число товаров (count) известно из первого ответа, остальные страницы запрашиваются параллельно
+        count = 0
+        for resp in fetch_pages(fetch_page, last_page=lambda resp: page_count(resp.get('count', 0), LIMIT),
+                                max_workers=self.pages_concurrency):
+            items = resp.get('items', [])
+            count += len(items)
+            yield from items
+        print(f"Collect products {categoryId} -> done, {count} products")
+
+    def get_product_details(self, product_slug) -> Product:
+        end_point = f"/api/v1/products/{product_slug}?storeId={self.STOREID}"
+        document: bytes = self.get_response(url=end_point, raw=True)
+        return validate_json(Product, document)
+
+    @staticmethod
+    def listing_price_record(item: dict, known_articles) -> PriceRecord | None:
+        # цена известного товара из ответа листинга. None - товар новый или цены в листинге нет (нужны детали)
+        article = item.get('vendorCode', None)
+        if not article or str(article) not in known_articles:
+            return None
+        store_product = item.get('storeProduct', None)
+        if not store_product:
+            return None
+        try:
+            prices = StoreProduct(**store_product)
+        except ValidationError:
+            return None
+        if prices.priceWithSale is None:
+            return None
+        return PriceRecord(article=str(article), price=prices.priceWithSale)
+
+    @staticmethod
+    def product_key(product: Product) -> str | None:
+        # vendorCode. Товар без артикула в журнал не попадает
+        return str(product.article) if product.article else None
+
+    def list_shards(self) -> list[str]:
+        """Единицы работы обхода (см. parsers.work_queue): id корневых категорий"""
         print(f"Get all categories on {self._host} -> start")
-
-        for category_item in categories.categories:
-            if category_item.parentId:
-                continue
-            if category_item.productsViewType != "NORMAL":
+        self._categories = self.get_categories_schema()
+        return [str(category_item.id) for category_item in self._categories.categories
+                if not category_item.parentId and category_item.productsViewType == "NORMAL"]
+
+    def crawl_shard(self, shard: str, known_articles=None, checkpoint=None):
+        """Товары одной корневой категории <shard> (id), аргументы - см. parsers.crawl_runner"""
+        if self._categories is None:
+            self._categories = self.get_categories_schema()
+        categories = self._categories
+        category_item = next(item for item in categories.categories if str(item.id) == str(shard))
+
+        print(f"Collect products on {category_item.name}")
+        # листинг читается постранично: детали товаров запрашиваются, пока следующие страницы ещё загружаются
+        products = self.collect_products_by_category(category_item.id)
+        for item in products:
+            if checkpoint is not None and checkpoint.is_done(item.get('vendorCode', None)):
                 continue
-            print(f"Collect products on {category_item.name}")
-            products = self.collect_products_by_category(category_item.id)
-            print(f"Collect products done")
-            for item in products:
-                product_slug = item.get('slug', None)
-                if not product_slug:
-                    continue
-                try:
-                    product_details = self.get_product_details(product_slug)
-                    product_schema = Product(**product_details)
-                    product_schema.set_categories(categories)  # product_schema.categories - двухмерный список
-                    yield product_schema
-                except Exception as ex:
-                    print(ex)
+            if known_articles is not None:
+                price_record = self.listing_price_record(item, known_articles)
+                if price_record:
+                    self.listing_prices += 1
+                    yield price_record
                     continue
+            product_slug = item.get('slug', None)
+            if not product_slug:
+                continue
+            try:
+                product_schema = self.get_product_details(product_slug)
+                product_schema.set_categories(categories)  # product_schema.categories - двухмерный список
+                yield product_schema
+            except Exception as ex:
+                print(ex)
+                continue
+
+    def crawl(self, known_articles=None, checkpoint=None):
+        """Обход всех корневых категорий по очереди (аргументы - как у crawl_shard)"""
+        for shard in self.list_shards():
+            yield from self.crawl_shard(shard, known_articles=known_articles, checkpoint=checkpoint)
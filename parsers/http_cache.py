@@ -0,0 +1,157 @@
+import requests
+from requests.structures import CaseInsensitiveDict
+from pathlib import Path
+from threading import Lock
+import hashlib
+import gzip
+import json
+import os
+import re
+import tempfile
+import time
+
+
+class HttpCache:
+    """
+    Дисковый кеш ответов для GET запросов пауков. Тело ответа хранится сжатым (gzip) в <directory>,
+    ключ - sha256 от url. Рядом лежит json с метаданными (время сохранения, ETag, Last-Modified, кодировка).
+
+    Время жизни записи задаётся правилами rules = [(регулярное выражение для url, ttl в секундах), ...],
+    срабатывает первое совпавшее правило:
+        ttl > 0     - в течение ttl ответ отдаётся с диска без запроса
+        ttl == 0    - запрос выполняется всегда, но условный (If-None-Match / If-Modified-Since): если сервер ответил
+                      304, тело берётся с диска
+        ttl is None - url не кешируется (например, листинги с ценами)
+    url без подходящего правила получает <default_ttl>.
+    Безопасен для вызова из нескольких потоков (запись файлов атомарная, счётчики под блокировкой).
+    """
+
+    def __init__(self, directory: Path | str, rules: list[tuple[str, float | None]] | None = None,
+                 default_ttl: float | None = None):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.rules = [(re.compile(pattern), ttl) for pattern, ttl in (rules or [])]
+        self.default_ttl = default_ttl
+        self._lock = Lock()
+        self.hits = 0         # ответ отдан с диска без запроса
+        self.revalidated = 0  # сервер ответил 304, ответ отдан с диска
+        self.misses = 0       # ответ загружен полностью
+        self.bypass = 0       # url не кешируется
+
+    def ttl_for(self, url: str) -> float | None:
+        for pattern, ttl in self.rules:
+            if pattern.search(url):
+                return ttl
+        return self.default_ttl
+
+    def _paths(self, url: str) -> tuple[Path, Path]:
+        key = hashlib.sha256(url.encode('utf-8')).hexdigest()
+        directory = self.directory / key[:2]
+        return directory / f"{key}.json", directory / f"{key}.gz"
+
+    def _count(self, counter: str):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def _read(self, url: str) -> tuple[dict, bytes] | None:
+        meta_path, body_path = self._paths(url)
+        try:
+            with open(meta_path, 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+            with gzip.open(body_path, 'rb') as f:
+                body = f.read()
+        except (OSError, ValueError, EOFError):
+            return None
+        if meta.get('url') != url:
+            return None
+        return meta, body
+
+    @staticmethod
+    def _write_atomic(path: Path, data: bytes):
+        # файл пишется во временный и переименовывается: другой поток никогда не увидит половину файла
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=path.parent, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+
+    def _write(self, url: str, response: requests.Response):
+        meta_path, body_path = self._paths(url)
+        meta = {
+            'url': url,
+            'stored_at': time.time(),
+            'etag': response.headers.get('ETag', None),
+            'last_modified': response.headers.get('Last-Modified', None),
+            'content_type': response.headers.get('Content-Type', None),
+            'encoding': response.encoding,
+        }
+        self._write_atomic(body_path, gzip.compress(response.content))
+        self._write_atomic(meta_path, json.dumps(meta).encode('utf-8'))
+
+    def _touch(self, url: str, meta: dict):
+        meta_path, _ = self._paths(url)
+        meta['stored_at'] = time.time()
+        self._write_atomic(meta_path, json.dumps(meta).encode('utf-8'))
+
+    @staticmethod
+    def _to_response(url: str, meta: dict, body: bytes) -> requests.Response:
+        response = requests.Response()
+        response.status_code = 200
+        response._content = body
+        response.url = url
+        response.encoding = meta.get('encoding', None)
+        if meta.get('content_type'):
+            response.headers = CaseInsensitiveDict({'Content-Type': meta['content_type']})
+        return response
+
+    def get(self, session, url: str, headers: dict | None = None, **kwargs) -> requests.Response:
+        """
+        GET запрос через кеш. <session> - объект с методом get (requests.Session или модуль requests).
+        Возвращает requests.Response (для ответа с диска - собранный из сохранённых данных, status_code=200).
+        """
+        ttl = self.ttl_for(url)
+        if ttl is None:
+            self._count('bypass')
+            return session.get(url, headers=headers, **kwargs)
+
+        cached = self._read(url)
+        if cached:
+            meta, body = cached
+            if ttl > 0 and time.time() - meta['stored_at'] < ttl:
+                self._count('hits')
+                return self._to_response(url, meta, body)
+            # запись устарела - условный запрос
+            headers = dict(headers or {})
+            if meta.get('etag'):
+                headers['If-None-Match'] = meta['etag']
+            if meta.get('last_modified'):
+                headers['If-Modified-Since'] = meta['last_modified']
+
+        response = session.get(url, headers=headers, **kwargs)
+        if response.status_code == 304 and cached:
+            self._count('revalidated')
+            self._touch(url, meta)
+            return self._to_response(url, meta, body)
+
+        self._count('misses')
+        if response.status_code == 200:
+            self._write(url, response)
+        return response
+
+    def report(self) -> str:
+        return (f"hits={self.hits}, revalidated={self.revalidated}, misses={self.misses}, "
+                f"not cached={self.bypass}")
+
+
+def http_get(session, url: str, cache: HttpCache | None = None, throttle=None, headers: dict | None = None,
+             **kwargs) -> requests.Response:
+    # GET через кеш, если он включён. Запросы в сеть (мимо кеша) идут через ограничитель parsers.throttle.Throttle
+    if throttle is not None:
+        session = throttle.bind(session)
+    if cache is None:
+        return session.get(url, headers=headers, **kwargs)
+    return cache.get(session, url, headers=headers, **kwargs)
@@ -1,5 +1,6 @@
 from playwright.sync_api import sync_playwright
-from typing import List, Dict
+from typing import List, Dict, Callable, Iterable
+import time
 
 
 class RequestSniffer:
@@ -17,6 +18,9 @@ class RequestSniffer:
                 'cookies': [{k:v, ...}]
     """
 
+    # типы ресурсов, которые в режиме capture_request не загружаются (они не нужны для получения заголовков и cookies)
+    HEAVY_RESOURCE_TYPES = ("image", "media", "font", "stylesheet", "texttrack", "manifest")
+
     def __init__(self, headless: bool = True):  # do/dont display browser
         self.headless = headless
 
@@ -76,3 +80,78 @@ class RequestSniffer:
                 page.remove_listener("response", handle_response)
                 browser.close()
         return traffic_data
+
+    def capture_request(self, url: str, predicate: Callable[[Dict], bool], required_cookies: Iterable[str] = (),
+                        block_resource_types: Iterable[str] = HEAVY_RESOURCE_TYPES, read_body: bool = False,
+                        timeout: int = 10000) -> Dict | None:
+        """
+        Targeted mode: returns the first request for which predicate(entry) is True, where
+        entry = {'url': str, 'method': str, 'request_headers': {k:v, ...}, 'resource_type': str}.
+        Requests of <block_resource_types> are aborted, response bodies are read only if <read_body>.
+        Returns as soon as the request is captured and the context has all <required_cookies>
+        (after <timeout> ms - with the cookies available at that moment), without waiting for networkidle.
+        return {... entry, 'status': int, 'response_headers': {k:v, ...}, ['response_body': str,]
+                'cookies': [{k:v, ...}]} or None if no request matched
+        """
+        blocked = set(block_resource_types)
+        required_cookies = set(required_cookies)
+        matched = []
+
+        with sync_playwright() as p:
+            browser = p.chromium.launch(headless=self.headless)
+            context = browser.new_context()
+
+            def handle_route(route):
+                if route.request.resource_type in blocked:
+                    route.abort()
+                else:
+                    route.continue_()
+
+            def handle_request(request):
+                if matched:
+                    return
+                entry = {
+                    'url': request.url,
+                    'method': request.method,
+                    'request_headers': dict(request.headers),
+                    'resource_type': request.resource_type,
+                }
+                if predicate(entry):
+                    matched.append((request, entry))
+
+            def has_required_cookies() -> bool:
+                if not required_cookies:
+                    return True
+                return required_cookies <= {cookie['name'] for cookie in context.cookies()}
+
+            try:
+                if blocked:
+                    context.route("**/*", handle_route)
+                page = context.new_page()
+                page.on("request", handle_request)
+
+                deadline = time.monotonic() + timeout / 1000
+                try:
+                    page.goto(url.rstrip('/'), wait_until="commit", timeout=timeout)
+                except Exception as e:
+                    print(f"Navigation error: {e}")
+                # ждём нужный запрос и cookies, но не дольше timeout
+                while time.monotonic() < deadline and not (matched and has_required_cookies()):
+                    page.wait_for_timeout(100)
+
+                if not matched:
+                    return None
+                request, entry = matched[0]
+                response = request.response()
+                if response:
+                    entry['status'] = response.status
+                    entry['response_headers'] = dict(response.headers)
+                    if read_body:
+                        try:
+                            entry['response_body'] = response.text()
+                        except Exception as e:
+                            entry['response_body'] = f"[Error getting response body: {e}]"
+                entry['cookies'] = context.cookies()
+                return entry
+            finally:
+                browser.close()
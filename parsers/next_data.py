@@ -0,0 +1,70 @@
+from bs4 import BeautifulSoup
+from parsers.validation import validate_json, validate_python
+from pydantic import ValidationError
+import json
+
+
+NEXT_DATA_MARKERS = (b'id="__NEXT_DATA__"', b"id='__NEXT_DATA__'", b'id=__NEXT_DATA__')
+
+
+def slice_next_data(document: bytes) -> bytes | None:
+    """
+    Текст json из <script id="__NEXT_DATA__"> без разбора html: ищем атрибут id, конец открывающего тега и
+    закрывающий </script>. Next.js экранирует '<' внутри json (\\u003c), поэтому '</script' внутри данных
+    не встречается. None - тег не найден
+    """
+    for marker in NEXT_DATA_MARKERS:
+        position = document.find(marker)
+        while position != -1:
+            tag_start = document.rfind(b'<', 0, position)
+            # атрибут должен стоять внутри открывающего тега <script ...>
+            if document.startswith(b'<script', tag_start) and b'>' not in document[tag_start:position]:
+                payload_start = document.find(b'>', position) + 1
+                payload_end = document.find(b'</script', payload_start)
+                if payload_start and payload_end != -1:
+                    return document[payload_start:payload_end]
+                return None
+            position = document.find(marker, position + len(marker))
+    return None
+
+
+def extract_next_data(document: bytes | str) -> dict:
+    """
+    Данные страницы Next.js (json из <script id="__NEXT_DATA__">). Сначала - быстрый поиск тега по байтам
+    (slice_next_data), полный разбор BeautifulSoup - только если быстрый путь не сработал.
+    document - тело ответа (response.content; str тоже принимается)
+    """
+    raw = document.encode('utf-8') if isinstance(document, str) else document
+    payload = slice_next_data(raw)
+    if payload is not None:
+        try:
+            return json.loads(payload)
+        except ValueError:
+            pass
+    return parse_next_data(raw)
+
+
+def parse_next_data(document: bytes | str) -> dict:
+    # медленный путь: полный разбор html
+    soup = BeautifulSoup(document, 'html.parser')
+    script_tag = soup.find('script', id='__NEXT_DATA__')
+    if script_tag is None:
+        raise ValueError('__NEXT_DATA__ script not found')
+    return json.loads(script_tag.string)
+
+
+def validate_next_data(document: bytes | str, type_):
+    """
+    __NEXT_DATA__ сразу в модель <type_> (parsers.validation): вырезанный json валидируется из байтов, без dict
+    всего документа. Полный разбор html и валидация dict - только если тег не найден или срез не является json.
+    Данные, которые не подходят под модель (ValidationError), пробрасываются сразу: полный разбор дал бы тот же json
+    """
+    raw = document.encode('utf-8') if isinstance(document, str) else document
+    payload = slice_next_data(raw)
+    if payload is not None:
+        try:
+            return validate_json(type_, payload)
+        except ValidationError as _ex:
+            if not any(error['type'] == 'json_invalid' for error in _ex.errors()):
+                raise
+    return validate_python(type_, parse_next_data(raw))
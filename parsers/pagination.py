@@ -0,0 +1,35 @@
+from parsers.concurrency import ordered_map
+from typing import Callable, Iterator
+
+
+def fetch_pages(fetch_page: Callable, last_page: Callable, next_page: Callable | None = None,
+                first_page: int = 1, max_workers: int = 4) -> Iterator:
+    """
+    Обход постраничного листинга без рекурсии. Ответы отдаются лениво и в порядке страниц: первая страница - сразу
+    после ответа, в памяти - только страницы, которые уже запрошены, но ещё не обработаны потребителем.
+        fetch_page(page) -> ответ страницы с номером <page>
+        last_page(first_response) -> номер последней страницы или None, если первый ответ его не содержит.
+                                     Когда номер известен, оставшиеся страницы запрашиваются параллельно
+                                     (не больше <max_workers> запросов одновременно)
+        next_page(response) -> номер следующей страницы или None. Используется, если last_page вернул None:
+                               страницы запрашиваются последовательно, пока есть следующая
+    """
+    response = fetch_page(first_page)
+    yield response
+
+    last = last_page(response)
+    if last is not None:
+        yield from ordered_map(fetch_page, range(first_page + 1, last + 1), max_workers=max_workers)
+        return
+
+    while next_page is not None:
+        page = next_page(response)
+        if page is None:
+            return
+        response = fetch_page(page)
+        yield response
+
+
+def page_count(total: int, limit: int) -> int:
+    # сколько страниц по <limit> элементов нужно для <total> элементов (минимум одна)
+    return max(1, -(-total // limit))
@@ -0,0 +1,130 @@
+from typing import Callable, Iterable
+import queue
+import threading
+import time
+
+
+class PipelineStats:
+    """Счётчики работы конвейера. Время ожидания - в секундах"""
+
+    def __init__(self):
+        self.produced = 0         # сколько элементов отдал паук
+        self.consumed = 0         # сколько элементов обработал writer
+        self.batches = 0          # сколько пачек передано в writer
+        self.producer_wait = 0.0  # сколько паук простоял на заполненной очереди (backpressure)
+        self.consumer_wait = 0.0  # сколько writer простоял на пустой очереди
+        self.max_queue_depth = 0
+        self._depth_sum = 0
+        self._depth_samples = 0
+
+    def add_depth_sample(self, depth: int):
+        self.max_queue_depth = max(self.max_queue_depth, depth)
+        self._depth_sum += depth
+        self._depth_samples += 1
+
+    @property
+    def avg_queue_depth(self) -> float:
+        return self._depth_sum / self._depth_samples if self._depth_samples else 0.0
+
+    def __str__(self):
+        return (f"produced={self.produced} consumed={self.consumed} batches={self.batches} "
+                f"queue_depth(avg={self.avg_queue_depth:.1f}, max={self.max_queue_depth}) "
+                f"wait(producer={self.producer_wait:.1f}s, consumer={self.consumer_wait:.1f}s)")
+
+
+class _EndOfStream:
+    # маркер конца очереди. <error> - исключение, которым упал поток паука
+    def __init__(self, error: BaseException | None = None):
+        self.error = error
+
+
+class IngestionPipeline:
+    """
+    Конвейер producer/consumer между spider.crawl() и записью в базу.
+    Генератор паука выполняется в отдельном потоке и складывает элементы в ограниченную очередь <maxsize>. Когда
+    очередь заполнена, поток паука ждёт (backpressure). Текущий поток забирает из очереди всё, что там накопилось
+    (не больше <batch_size>), и передаёт пачку в <handler>. Таким образом сетевые запросы и запись в базу идут
+    одновременно, а не по очереди.
+        pipeline = IngestionPipeline(spider.crawl(), handler=save_batch)
+        stats = pipeline.run()
+    """
+
+    def __init__(self, producer: Iterable, handler: Callable[[list], None],
+                 maxsize: int = 500, batch_size: int = 100, report_every: float = 60.0):
+        self._producer = producer
+        self._handler = handler
+        self._queue = queue.Queue(maxsize=maxsize)
+        self._stop = threading.Event()
+        self.batch_size = batch_size
+        self.report_every = report_every
+        self.stats = PipelineStats()
+
+    def _put(self, item) -> bool:
+        # put с таймаутом, чтобы поток паука мог завершиться, если writer упал
+        start = time.monotonic()
+        try:
+            while not self._stop.is_set():
+                try:
+                    self._queue.put(item, timeout=0.5)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+        finally:
+            self.stats.producer_wait += time.monotonic() - start
+
+    def _produce(self):
+        iterator = iter(self._producer)
+        error = None
+        try:
+            for item in iterator:
+                if not self._put(item):
+                    break
+                self.stats.produced += 1
+        except Exception as _ex:
+            error = _ex
+        finally:
+            # генератор закрываем в том же потоке, в котором он выполнялся
+            close = getattr(iterator, 'close', None)
+            if close:
+                close()
+        self._put(_EndOfStream(error))
+
+    def _get_batch(self) -> list:
+        start = time.monotonic()
+        batch = [self._queue.get()]
+        self.stats.consumer_wait += time.monotonic() - start
+
+        self.stats.add_depth_sample(self._queue.qsize() + 1)
+        # забираем всё, что уже лежит в очереди, не дожидаясь новых элементов
+        while len(batch) < self.batch_size and not isinstance(batch[-1], _EndOfStream):
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def run(self) -> PipelineStats:
+        thread = threading.Thread(target=self._produce, name='pipeline-producer', daemon=True)
+        thread.start()
+        last_report = time.monotonic()
+        try:
+            while True:
+                batch = self._get_batch()
+                end = batch.pop() if isinstance(batch[-1], _EndOfStream) else None
+                if batch:
+                    self._handler(batch)
+                    self.stats.consumed += len(batch)
+                    self.stats.batches += 1
+                if time.monotonic() - last_report >= self.report_every:
+                    print(f"Pipeline -> {self.stats}")
+                    last_report = time.monotonic()
+                if end:
+                    if end.error:
+                        raise end.error
+                    break
+        finally:
+            self._stop.set()
+            thread.join(timeout=5)
+            print(f"Pipeline -> done {self.stats}")
+        return self.stats
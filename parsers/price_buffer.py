@@ -0,0 +1,138 @@
+from database.crud.catalog import CatalogCRUD
+from parsers.data_dir import data_path
+from datetime import datetime as dt
+from pathlib import Path
+import json
+import time
+
+
+class PriceBuffer:
+    """
+    Буфер для записи цен. Строки таблицы prices копятся в памяти и записываются в базу пачкой
+    (один multi-row insert и один коммит) когда:
+        - в буфере накопилось <max_size> строк
+        - с момента последней записи прошло <max_age> секунд
+        - вызван flush() / close() (в конце обхода)
+    Если записать остаток не удалось, новые строки и отложенные обновления last_seen сохраняются в json файл
+    (каталог unsaved_prices в каталоге данных parsers.data_dir), путь к которому выводится в консоль.
+
+    change_only=True - режим хранения только изменений цены. Строка цены описывает интервал: date_time - когда цена
+    появилась, last_seen - когда её видели последний раз. Если цена товара не изменилась с прошлой записи, новая
+    строка не создаётся, а у последней строки обновляется last_seen. Пропуск в наблюдениях (товара не было на сайте)
+    виден как разрыв между last_seen одной строки и date_time следующей.
+    Последние известные цены загружаются при старте через remember().
+
+    call_after_flush(callback) - callback вызывается, когда всё, что сейчас лежит в буфере, записано в базу
+    (например, отметка товаров в журнале обхода parsers.checkpoint.CrawlCheckpoint).
+    """
+
+    def __init__(self, session_factory, max_size: int = 5000, max_age: float = 60.0, change_only: bool = False):
+        self._session_factory = session_factory
+        self.max_size = max_size
+        self.max_age = max_age
+        self.change_only = change_only
+        self._rows = []
+        self._last_flush = time.monotonic()
+        self.written = 0  # сколько строк записано в базу за время жизни буфера
+        self.touched = 0  # сколько раз цена не изменилась (только last_seen)
+
+        # change_only
+        self._last_prices = {}  # product_id: (price, price_row_id, price_row_date_time)
+        self._pending = {}      # product_id: строка из self._rows, которая ещё не записана в базу
+        self._touch = {}        # (price_row_id, price_row_date_time): last_seen
+
+        self._after_flush = []  # callbacks до следующей записи в базу
+
+    def __len__(self):
+        return len(self._rows) + len(self._touch)
+
+    @staticmethod
+    def _normalize(price) -> float:
+        # цены из базы приходят как Decimal, из парсеров - как float
+        return round(float(price), 2)
+
+    def remember(self, product_id: int, price, row_id: int, date_time):
+        """Запоминает последнюю записанную в базу цену товара"""
+        self._last_prices[product_id] = (self._normalize(price), row_id, date_time)
+
+    def add(self, product_id: int, price: float, date_time: str):
+        if self.change_only:
+            price_norm = self._normalize(price)
+            pending = self._pending.get(product_id, None)
+            if pending and self._normalize(pending['price']) == price_norm:
+                pending['last_seen'] = date_time
+                self.touched += 1
+                return
+            last = self._last_prices.get(product_id, None)
+            if not pending and last and last[0] == price_norm:
+                self._touch[(last[1], last[2])] = date_time
+                self.touched += 1
+                self._flush_if_needed()
+                return
+
+        row = {'product_id': product_id, 'price': price, 'date_time': date_time, 'last_seen': date_time}
+        self._rows.append(row)
+        if self.change_only:
+            self._pending[product_id] = row
+        self._flush_if_needed()
+
+    def call_after_flush(self, callback):
+        if not len(self):
+            callback()
+            return
+        self._after_flush.append(callback)
+
+    def _flush_if_needed(self):
+        if len(self) >= self.max_size or time.monotonic() - self._last_flush >= self.max_age:
+            self.flush()
+
+    def flush(self) -> int:
+        rows, touch = self._rows, self._touch
+        if rows or touch:
+            with self._session_factory() as session:
+                catalog_db = CatalogCRUD(session, autocommit=False)
+                inserted = catalog_db.save_product_prices(rows, returning=self.change_only)
+                catalog_db.touch_product_prices([{'id': row_id, 'date_time': date_time, 'last_seen': last_seen}
+                                                 for (row_id, date_time), last_seen in touch.items()])
+                session.commit()
+            # очищаем буфер только после успешного коммита
+            for row, (row_id, date_time) in zip(rows, inserted or []):
+                self.remember(row['product_id'], row['price'], row_id, date_time)
+            self._rows, self._touch, self._pending = [], {}, {}
+            self.written += len(rows)
+        self._last_flush = time.monotonic()
+        callbacks, self._after_flush = self._after_flush, []
+        for callback in callbacks:
+            callback()
+        return len(rows)
+
+    def close(self):
+        """Записывает остаток буфера. Вызывается в конце обхода (в том числе при падении)"""
+        try:
+            self.flush()
+        except Exception:
+            self.dump_pending()
+            raise
+        if self.change_only:
+            print(f"Prices saved -> {self.written} (unchanged -> {self.touched})")
+        else:
+            print(f"Prices saved -> {self.written}")
+
+    def dump_pending(self, directory: Path | None = None) -> Path | None:
+        """
+        Сохраняет не записанное в базу содержимое буфера в json файл:
+            {'rows': [{product_id, price, date_time, last_seen}, ...] - новые строки таблицы prices,
+             'touch': [{id, date_time, last_seen}, ...] - обновления last_seen существующих строк (change_only)}
+        """
+        if not len(self):
+            return None
+        directory = Path(directory) if directory else data_path("unsaved_prices")
+        directory.mkdir(parents=True, exist_ok=True)
+        file_path = directory / f"unsaved_prices_{dt.now():%Y%m%d_%H%M%S}.json"
+        touch = [{'id': row_id, 'date_time': date_time, 'last_seen': last_seen}
+                 for (row_id, date_time), last_seen in self._touch.items()]
+        with open(file_path, 'w', encoding='utf-8') as f:
+            json.dump({'rows': self._rows, 'touch': touch}, f, ensure_ascii=False, default=str)
+        print(f"Prices were not saved -> {len(self._rows)} rows and {len(touch)} last_seen updates "
+              f"dumped to {file_path}")
+        return file_path
@@ -0,0 +1,10 @@
+from pydantic import BaseModel
+
+
+class PriceRecord(BaseModel):
+    """
+    Облегчённая запись товара для режима обновления цен (price_refresh). Паук отдаёт её вместо полной схемы товара,
+    если артикул уже есть в базе, а цена есть в ответе листинга - запрос деталей товара не выполняется.
+    """
+    article: str
+    price: float | None = None
@@ -1,15 +1,34 @@
 from database.crud.catalog import CatalogCRUD
-from parsers.cache import Cache
+from parsers.cache import Cache, CategoryTree
+from parsers.price_buffer import PriceBuffer
 from slugify import slugify
+from contextlib import contextmanager
 import hashlib
+import sys
+import time
+try:
+    import resource
+except ImportError:
+    resource = None
 
 
 class CategoryService(Cache):
-    def __init__(self, session_factory, source_name: str):
+    def __init__(self, session_factory, source_name: str, preload_articles: bool = True,
+                 price_change_only: bool = False):
+        """
+        preload_articles=False - не загружать при старте все артикулы источника. Запись идёт через upsert по
+        уникальным индексам, поэтому дубликатов не будет и без кеша (режим для нескольких параллельных процессов)
+        price_change_only=True - писать новую строку цены только если цена изменилась (см. PriceBuffer)
+        """
         super().__init__()
         self.__session_factory = session_factory  # фабрика сессий
+        # цены пишутся в базу пачками
+        self.price_buffer = PriceBuffer(session_factory, change_only=price_change_only)
 
         # Заполняем кеши из базы данных. Каждое аттрибут Cache это: ключ-имя из таблицы, значение айди из таблицы
+        # Из базы читаются только пары (ключ, id), порциями через серверный курсор
+        print("Cache warm-up -> start")
+        start_time = time.perf_counter()
         with session_factory() as session:
             catalog_db = CatalogCRUD(session)
 
@@ -23,22 +42,57 @@ class CategoryService(Cache):
                 self.source_id = catalog_db.save_new_source(source_name)
 
             # categories
-            for item in catalog_db.get_all_categories(source_id=self.source_id):
-                self.categories.setdefault(item.name, item.id)
+            # дерево категорий источника: ключ - полный путь от корня (см. CategoryTree)
+            self.categories = CategoryTree.from_rows(catalog_db.iter_category_nodes(source_id=self.source_id))
 
             # manufacturers
-            for item in catalog_db.get_all_manufacturers(source_id=self.source_id):
-                # преобразуем записи из бд в строковый хеш (торговое имя + полное имя)
-                self.manufacturers.setdefault(self.string_hash((item.trademark or "") + (item.full_name or "")), item.id)
+            # хеш (торговое имя + полное имя) хранится в колонке name_hash. Для старых записей без хеша считаем его
+            # один раз и сохраняем в базу
+            for name_hash, manufactory_id in catalog_db.iter_manufacturer_hashes(source_id=self.source_id):
+                self.manufacturers.setdefault(name_hash, manufactory_id)
+            self._save_missing_manufacturer_hashes(catalog_db)
 
             # articles
             # self.articles = {article: id, article: id, ...}
-            for item in catalog_db.get_articles_and_ids_by_source(source_id=self.source_id):
-                self.articles.setdefault(item[1], item[0])
+            if preload_articles:
+                for article, product_id in catalog_db.iter_article_keys(source_id=self.source_id):
+                    self.articles.setdefault(article, product_id)
 
             # properties
-            for item in catalog_db.get_all_properties():
-                self.properties.setdefault(item.name, item.id)
+            for name, property_id in catalog_db.iter_property_keys():
+                self.properties.setdefault(name, property_id)
+
+            # последние цены товаров (только для режима записи изменений цены)
+            if price_change_only:
+                for product_id, price, price_id, date_time in catalog_db.iter_last_prices(source_id=self.source_id):
+                    self.price_buffer.remember(product_id, price, price_id, date_time)
+
+        peak_rss = self.peak_rss_mb()
+        print(f"Cache warm-up -> done in {time.perf_counter() - start_time:.1f}s "
+              f"(categories={len(self.categories)}, manufacturers={len(self.manufacturers)}, "
+              f"articles={len(self.articles)}, properties={len(self.properties)}, "
+              f"peak RSS={f'{peak_rss:.0f} MB' if peak_rss else 'n/a'})")
+
+    def _save_missing_manufacturer_hashes(self, catalog_db: CatalogCRUD):
+        rows = {}
+        for manufactory_id, trademark, full_name in catalog_db.get_manufacturers_without_hash(self.source_id):
+            name_hash = self.string_hash((trademark or "") + (full_name or ""))
+            # дубликаты (хеш уже занят другой записью) оставляем без хеша: в кеш всё равно попадает только один id
+            if name_hash in self.manufacturers or name_hash in rows:
+                continue
+            rows[name_hash] = manufactory_id
+        catalog_db.save_manufacturer_hashes([{'id': manufactory_id, 'name_hash': name_hash}
+                                             for name_hash, manufactory_id in rows.items()])
+        self.manufacturers.update(rows)
+
+    @staticmethod
+    def peak_rss_mb() -> float | None:
+        # пиковое потребление памяти процессом. Модуля resource нет в Windows
+        if resource is None:
+            return None
+        peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Linux отдаёт значение в килобайтах, macOS - в байтах
+        return peak_rss / (1024 * 1024) if sys.platform == 'darwin' else peak_rss / 1024
 
     @staticmethod
     def string_hash(string):
@@ -57,100 +111,138 @@ class CategoryService(Cache):
 
         return string
 
-    def get_product_id(self, manufacturer_id, name, description, composition, storage_info, unit, article, barcode):
-        if self.articles.get(article, None):
-            return self.articles[article]
-
+    @contextmanager
+    def product_writer(self):
+        """
+        Unit of work для записи товара. Все записи (товар, производитель, категории, свойства, изображения, цена)
+        делаются в одной сессии и фиксируются одним коммитом при выходе из блока with.
+        При исключении транзакция откатывается, а кеш сервиса остаётся без изменений.
+            with service.product_writer() as writer:
+                product_id = writer.get_product_id(...)
+                writer.save_product_images_relations(product_id, [...])
+        """
         with self.__session_factory() as session:
-            catalog_db = CatalogCRUD(session)
-            product_id = catalog_db.save_new_product(
-                manufacturer_id=manufacturer_id,
-                name=name,
-                barcode=barcode,
-                source_id=self.source_id,
-                description=description,
-                composition=composition,
-                storage_info=storage_info,
-                unit=unit,
-                source_article=article
-            )
+            writer = ProductWriter(self, session)
+            try:
+                yield writer
+                session.commit()
+            except Exception:
+                session.rollback()
+                raise
+        # новые записи попадают в кеш только после успешного коммита
+        for cache_name, values in vars(writer.staged).items():
+            getattr(self, cache_name).update(values)
+        for product_id, price, price_id, date_time in writer.staged_prices:
+            self.price_buffer.remember(product_id, price, price_id, date_time)
+
+    def save_product_price(self, product_id: int, price: float, date_time: str):
+        if not price:
+            return
+        self.price_buffer.add(product_id=product_id, price=price, date_time=date_time)
+
+    def close(self):
+        # записываем в базу всё, что осталось в буферах
+        self.price_buffer.close()
+
+
+class ProductWriter:
+    """
+    Объект, который отдаёт CategoryService.product_writer(). Все записи товара идут через него в одной общей сессии:
+    вместо коммита на каждую запись делается flush, id новых строк приходят из RETURNING.
+    Новые записи складываются в <staged> и переносятся в кеш сервиса после коммита.
+    """
+
+    def __init__(self, service: CategoryService, session):
+        self._service = service
+        self._catalog_db = CatalogCRUD(session, autocommit=False)
+        self.staged = Cache()
+        self.staged_prices = []  # [(product_id, price, price_id, date_time), ...]
+
+    def _cached(self, cache_name: str, key):
+        # сначала ищем в кеше сервиса, затем среди записей, сделанных в текущей транзакции
+        return getattr(self._service, cache_name).get(key, None) or getattr(self.staged, cache_name).get(key, None)
+
+    def get_product_id(self, manufacturer_id, name, description, composition, storage_info, unit, article, barcode):
+        product_id = self._cached('articles', article)
+        if product_id:
+            return product_id
+
+        product_id = self._catalog_db.upsert_products([{
+            'manufacturer_id': manufacturer_id,
+            'name': name,
+            'barcode': barcode,
+            'source_id': self._service.source_id,
+            'description': description,
+            'composition': composition,
+            'storage_info': storage_info,
+            'unit': unit,
+            'source_article': article
+        }])[article]
+        self.staged.articles.setdefault(article, product_id)
         return product_id
 
-    def get_category_id(self, category_name, parent_name):
-        if self.categories.get(category_name, None):
-            return self.categories[category_name]
+    def get_category_ids(self, paths: list) -> list[int]:
+        """
+        paths = [[root_name, ..., category_name], ...] - цепочки категорий (хлебные крошки) от корня к листу
+        return [category_id, ...] - id всех категорий всех цепочек без повторов (от корня к листу)
+        Недостающие категории создаются одним upsert на каждый уровень дерева: родитель должен получить id раньше детей
+        """
+        paths = [tuple(path) for path in paths if path]
+        nodes = list(dict.fromkeys(node for path in paths for node in CategoryTree.prefixes(path)))
 
-        with self.__session_factory() as session:
-            catalog_db = CatalogCRUD(session)
+        missing = [node for node in nodes if not self._cached('categories', node)]
+        for level in sorted({len(node) for node in missing}):
+            level_nodes = [node for node in missing if len(node) == level]
+            rows = [{'name': node[-1],
+                     'parent_id': self._cached('categories', node[:-1]) if level > 1 else None,
+                     'source_id': self._service.source_id} for node in level_nodes]
+            ids = self._catalog_db.upsert_categories(rows)
+            for node, row in zip(level_nodes, rows):
+                self.staged.categories.setdefault(node, ids[(row['name'], row['parent_id'])])
 
-            if not parent_name:
-                category_id = catalog_db.save_new_category(name=category_name,
-                                                           parent_id=None,
-                                                           parent_name=None,
-                                                           source_id=self.source_id)
-                self.categories.setdefault(category_name, category_id)  # put to cache
-                return category_id
-            else:
-                # Если айди родителя содержится в кеше
-                parent_id = self.categories.get(parent_name, None)
-                if parent_id:
-                    category_id = catalog_db.save_new_category(name=category_name,
-                                                               parent_id=parent_id,
-                                                               source_id=self.source_id)
-                else:
-                    category_id = catalog_db.save_new_category(name=category_name,
-                                                               parent_name=parent_name,
-                                                               source_id=self.source_id)
-        self.categories.setdefault(category_name, category_id)  # put to cache
-        return category_id
+        return list(dict.fromkeys(self._cached('categories', node) for node in nodes))
 
     def get_manufactory_id(self, trademark, full_name, country):
-        manufactory_hash = self.string_hash((trademark or "") + (full_name or ""))
-        if self.manufacturers.get(manufactory_hash, None):
-            return self.manufacturers[manufactory_hash]
-
-        with self.__session_factory() as session:
-            catalog_db = CatalogCRUD(session)
-            manufactory_id = catalog_db.save_new_manufactory(trademark=trademark, full_name=full_name,
-                                                             country=country, source_id=self.source_id)
-        self.manufacturers.setdefault(manufactory_hash, manufactory_id)
+        manufactory_hash = self._service.string_hash((trademark or "") + (full_name or ""))
+        manufactory_id = self._cached('manufacturers', manufactory_hash)
+        if manufactory_id:
+            return manufactory_id
+
+        manufactory_id = self._catalog_db.upsert_manufacturers([{'trademark': trademark,
+                                                                 'full_name': full_name,
+                                                                 'country': country,
+                                                                 'name_hash': manufactory_hash,
+                                                                 'source_id': self._service.source_id}
+                                                                ])[manufactory_hash]
+        self.staged.manufacturers.setdefault(manufactory_hash, manufactory_id)
         return manufactory_id
 
     def get_property_id(self, name, group=None):
-        if self.properties.get(name, None):
-            return self.properties[name]
+        property_id = self._cached('properties', name)
+        if property_id:
+            return property_id
 
-        with self.__session_factory() as session:
-            catalog_db = CatalogCRUD(session)
-            property_id = catalog_db.save_new_property(name, group)
-        self.properties.setdefault(name, property_id)
+        property_id = self._catalog_db.upsert_properties([{'name': name, 'group': group}])[name]
+        self.staged.properties.setdefault(name, property_id)
         return property_id
 
-    def save_product_category_relations(self, product_id: int, categories_id: list[id]):
-        with self.__session_factory() as session:
-            catalog_db = CatalogCRUD(session)
-            catalog_db.save_product_category_relations(product_id, categories_id)
+    def save_product_category_relations(self, product_id: int, categories_id: list[int]):
+        self._catalog_db.save_product_category_relations(product_id, categories_id)
 
     def save_product_property_values_relations(self, product_id: int, property_id: int, values: list):
-        with self.__session_factory() as session:
-            catalog_db = CatalogCRUD(session)
-            catalog_db.save_product_property_values_relations(product_id=product_id,
-                                                              property_id=property_id,
-                                                              values=values)
+        self._catalog_db.save_product_property_values_relations(product_id=product_id,
+                                                                property_id=property_id,
+                                                                values=values)
 
     def save_product_images_relations(self, product_id: int, image_urls_list: list):
         if not image_urls_list:
             return
-        with self.__session_factory() as session:
-            catalog_db = CatalogCRUD(session)
-            catalog_db.save_product_images_relations(product_id=product_id,
-                                                     images=image_urls_list)
+        self._catalog_db.save_product_images_relations(product_id=product_id, images=image_urls_list)
 
     def save_product_price(self, product_id: int, price: float, date_time: str):
         if not price:
             return
-        with self.__session_factory() as session:
-            catalog_db = CatalogCRUD(session)
-            catalog_db.save_product_price_datetime_relations(product_id=product_id,
-                                                             price=price,
-                                                             date_time=date_time)
+        price_id = self._catalog_db.save_product_price_datetime_relations(product_id=product_id,
+                                                                          price=price,
+                                                                          date_time=date_time)
+        self.staged_prices.append((product_id, price, price_id, date_time))
@@ -0,0 +1,86 @@
+import requests
+from parsers.data_dir import data_path
+from pathlib import Path
+from typing import Callable
+from urllib.parse import urlparse
+import json
+import os
+import tempfile
+import time
+
+
+# ответы, после которых сохранённые заголовки и cookies считаются недействительными (авторизация / анти-бот)
+AUTH_ERROR_STATUSES = (401, 403)
+
+
+class SessionStore:
+    """
+    Хранилище заголовков и cookies, перехваченных браузером (parsers.network_traffic.RequestSniffer).
+    Для каждого хоста - отдельный json файл в <directory>:
+        {'saved_at': float, 'headers': {k: v, ...}, 'cookies': [{'name': str, 'value': str, 'expires': float}, ...]}
+    Запись считается устаревшей, если ей больше <max_age> секунд или истёк срок хотя бы одной cookie.
+    Браузер запускается только когда действительной записи нет или сервер отклонил сохранённую
+    (см. AUTH_ERROR_STATUSES).
+    """
+
+    def __init__(self, directory: Path | str | None = None, max_age: float = 12 * 3600):
+        # по умолчанию - вне дерева исходников (parsers.data_dir): в файлах cookies и токены доступа
+        self.directory = Path(directory) if directory else data_path("sessions")
+        self.max_age = max_age
+
+    def _path(self, host: str) -> Path:
+        return self.directory / f"{urlparse(host).netloc or host}.json"
+
+    def is_expired(self, bootstrap: dict) -> bool:
+        now = time.time()
+        if now - bootstrap.get('saved_at', 0) >= self.max_age:
+            return True
+        # expires == -1 - сессионная cookie без срока
+        return any(0 < cookie.get('expires', -1) < now for cookie in bootstrap.get('cookies', []))
+
+    def load(self, host: str) -> dict | None:
+        try:
+            with open(self._path(host), 'r', encoding='utf-8') as f:
+                bootstrap = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if self.is_expired(bootstrap):
+            return None
+        return bootstrap
+
+    def save(self, host: str, headers: dict, cookies: list[dict]) -> dict:
+        bootstrap = {'saved_at': time.time(), 'headers': headers, 'cookies': cookies}
+        path = self._path(host)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # пишем во временный файл и переименовываем: параллельный процесс не прочитает половину файла
+        fd, tmp_path = tempfile.mkstemp(dir=path.parent, suffix='.tmp')
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(bootstrap, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+        return bootstrap
+
+    def invalidate(self, host: str):
+        try:
+            os.remove(self._path(host))
+        except FileNotFoundError:
+            pass
+
+    def new_session(self, host: str, capture: Callable[[], dict], refresh: bool = False) -> requests.Session:
+        """
+        requests.Session с заголовками и cookies для <host>. Сохранённая запись используется, пока она действительна,
+        иначе вызывается capture() -> {'headers': {...}, 'cookies': [...]} (запуск браузера) и результат сохраняется.
+        refresh=True - не использовать сохранённую запись (сервер её отклонил)
+        """
+        bootstrap = None if refresh else self.load(host)
+        if bootstrap is None:
+            print(f"Intercept cookies & headers {host} -> start")
+            captured = capture()
+            bootstrap = self.save(host, headers=captured['headers'], cookies=captured.get('cookies', []))
+            print(f"Intercept cookies & headers -> done")
+        else:
+            print(f"Intercept cookies & headers {host} -> loaded from {self._path(host)}")
+
+        session = requests.Session()
+        session.headers.update(bootstrap['headers'])
+        session.cookies.update({cookie['name']: cookie['value'] for cookie in bootstrap['cookies']})
+        return session
@@ -0,0 +1,164 @@
+import requests
+from email.utils import parsedate_to_datetime
+from datetime import datetime, timezone
+from threading import Condition, Lock
+from typing import Callable
+from urllib.parse import urlparse
+import random
+import time
+
+
+class HostThrottle:
+    """
+    Ограничение запросов к одному хосту:
+        - token bucket: не больше <rate> запросов в секунду (запас - одна секунда запросов)
+        - лимит одновременных запросов <concurrency> (не больше <max_concurrency>)
+    Оба параметра подстраиваются по ответам (AIMD): после здорового ответа растут понемногу, после 429 / 5xx /
+    медленного ответа / ошибки соединения уменьшаются вдвое. Retry-After останавливает выдачу запросов к хосту
+    на указанное время. Так скорость сама находит максимум, который выдерживает источник.
+    """
+
+    def __init__(self, rate: float = 4.0, min_rate: float = 0.2, max_rate: float = 50.0, rate_step: float = 0.5,
+                 concurrency: float = 2, max_concurrency: int = 8):
+        self.rate = rate
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.rate_step = rate_step
+        self.concurrency = min(float(concurrency), max_concurrency)
+        self.max_concurrency = max_concurrency
+        self._cond = Condition()
+        self._tokens = 1.0
+        self._updated = time.monotonic()
+        self._active = 0
+        self._blocked_until = 0.0
+
+    def _refill(self, now: float):
+        self._tokens = min(max(1.0, self.rate), self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self):
+        """Ждёт свободный слот и токен. После запроса обязательно вызвать release()"""
+        with self._cond:
+            while True:
+                now = time.monotonic()
+                self._refill(now)
+                if self._active >= int(self.concurrency):
+                    self._cond.wait()  # освободит release()
+                    continue
+                if now < self._blocked_until or self._tokens < 1:
+                    self._cond.wait(timeout=max(self._blocked_until - now, (1 - self._tokens) / self.rate))
+                    continue
+                self._tokens -= 1
+                self._active += 1
+                return
+
+    def release(self, healthy: bool, retry_after: float | None = None):
+        with self._cond:
+            self._active -= 1
+            if healthy:
+                self.rate = min(self.max_rate, self.rate + self.rate_step)
+                self.concurrency = min(self.max_concurrency, self.concurrency + 1 / self.concurrency)
+            else:
+                self.rate = max(self.min_rate, self.rate / 2)
+                self.concurrency = max(1.0, self.concurrency / 2)
+                self._tokens = min(self._tokens, 0.0)
+            if retry_after:
+                self._blocked_until = max(self._blocked_until, time.monotonic() + retry_after)
+            self._cond.notify_all()
+
+
+class Throttle:
+    """
+    Общий слой ограничения запросов для пауков: HostThrottle на каждый хост и повторы с экспоненциальной задержкой
+    (со случайным разбросом). Повторяются ответы <RETRY_STATUSES> и ошибки requests (соединение, таймаут, обрыв
+    ответа), не больше <retries> раз. Ответ медленнее <slow_response> секунд считается признаком перегрузки источника.
+        throttle = Throttle(max_concurrency=8)
+        response = throttle.call(url, lambda: session.get(url))
+    """
+    RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+    def __init__(self, retries: int = 4, backoff: float = 1.0, max_backoff: float = 60.0, slow_response: float = 5.0,
+                 **host_options):
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.slow_response = slow_response
+        self._host_options = host_options  # аргументы HostThrottle
+        self._hosts = {}
+        self._lock = Lock()
+        self.retried = 0  # сколько запросов было повторено
+
+    def for_host(self, url: str) -> HostThrottle:
+        host = urlparse(url).netloc
+        with self._lock:
+            if host not in self._hosts:
+                self._hosts[host] = HostThrottle(**self._host_options)
+            return self._hosts[host]
+
+    @staticmethod
+    def retry_after(response: requests.Response) -> float | None:
+        # Retry-After: <секунды> или <HTTP дата>
+        value = response.headers.get('Retry-After', None)
+        if not value:
+            return None
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            pass
+        try:
+            return max(0.0, (parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds())
+        except (TypeError, ValueError):
+            return None
+
+    def _sleep_before_retry(self, attempt: int):
+        delay = min(self.max_backoff, self.backoff * 2 ** attempt)
+        time.sleep(random.uniform(delay / 2, delay))
+        with self._lock:
+            self.retried += 1
+
+    def call(self, url: str, send: Callable[[], requests.Response]) -> requests.Response:
+        """Выполняет send() (запрос к <url>) с ограничением скорости и повторами"""
+        host = self.for_host(url)
+        for attempt in range(self.retries + 1):
+            host.acquire()
+            start = time.monotonic()
+            response = None
+            healthy, retry_after = False, None
+            try:
+                response = send()
+                retry = response.status_code in self.RETRY_STATUSES
+                healthy = not retry and time.monotonic() - start < self.slow_response
+                retry_after = self.retry_after(response) if retry else None
+            except requests.RequestException:
+                # ошибки соединения, таймауты, оборванный ответ и т.п. - повторяются
+                if attempt == self.retries:
+                    raise
+            finally:
+                # слот возвращается при любом исходе send(): утёкший слот навсегда занимает место в лимите
+                # одновременных запросов хоста, и acquire() остальных потоков ждёт без таймаута
+                host.release(healthy=healthy, retry_after=retry_after)
+            if response is not None:
+                if not retry or attempt == self.retries:
+                    return response
+                # ответ 429 / 5xx не нужен: соединение возвращается в пул сразу, а не после паузы перед повтором
+                response.close()
+            self._sleep_before_retry(attempt)
+
+    def bind(self, session) -> '_ThrottledSession':
+        """Обёртка над <session> (объект с методом get), которая выполняет get через call()"""
+        return _ThrottledSession(self, session)
+
+    def report(self) -> str:
+        hosts = ", ".join(f"{host}: {item.rate:.1f} req/s x {int(item.concurrency)}"
+                          for host, item in self._hosts.items())
+        return f"{hosts or 'no requests'} (retried={self.retried})"
+
+
+class _ThrottledSession:
+
+    def __init__(self, throttle: Throttle, session):
+        self._throttle = throttle
+        self._session = session
+
+    def get(self, url: str, **kwargs) -> requests.Response:
+        return self._throttle.call(url, lambda: self._session.get(url, **kwargs))
@@ -0,0 +1,84 @@
+import requests
+from requests.adapters import HTTPAdapter
+from requests.utils import DEFAULT_ACCEPT_ENCODING
+from parsers.http_cache import HttpCache, http_get
+from parsers.session_store import SessionStore, AUTH_ERROR_STATUSES
+from parsers.throttle import Throttle
+from threading import Lock
+from typing import Callable
+
+
+DEFAULT_TIMEOUT = (5.0, 30.0)  # (подключение, чтение) в секундах
+
+
+class HttpTransport:
+    """
+    Сетевой слой паука. Держит одну requests.Session с пулом постоянных (keep-alive) соединений размером
+    <concurrency>, поэтому параллельные запросы не открывают новое TCP + TLS соединение на каждый запрос.
+    Каждый запрос выполняется с таймаутами подключения и чтения <timeout> и проходит через:
+        - cache         - дисковый кеш ответов (parsers.http_cache.HttpCache)
+        - throttle      - ограничение скорости и повторы (parsers.throttle.Throttle)
+        - session_store - сохранённые заголовки и cookies (parsers.session_store.SessionStore). Если задан <capture>,
+                          то при ответе 401/403 сессия перехватывается заново и запрос повторяется один раз
+    Accept-Encoding выставляется один раз - только те сжатия, которые умеет распаковывать клиент
+    (браузерный заголовок может содержать br / zstd, для которых не установлены декодеры).
+    """
+
+    def __init__(self, host: str, capture: Callable[[], dict] | None = None, headers: dict | None = None,
+                 concurrency: int = 8, timeout: tuple[float, float] = DEFAULT_TIMEOUT,
+                 cache: HttpCache | None = None, throttle: Throttle | None = None,
+                 session_store: SessionStore | None = None):
+        self.host = host
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.cache = cache
+        self.throttle = throttle
+        self._capture = capture
+        self._headers = headers or {}
+        self._session_store = (session_store or SessionStore()) if capture else None
+        self._lock = Lock()
+        self.session = self._new_session()
+
+    def _new_session(self, refresh: bool = False) -> requests.Session:
+        if self._capture:
+            session = self._session_store.new_session(self.host, capture=self._capture, refresh=refresh)
+        else:
+            session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=self.concurrency)
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        session.headers.update(self._headers)
+        session.headers['Accept-Encoding'] = DEFAULT_ACCEPT_ENCODING
+        return session
+
+    @property
+    def cookies(self):
+        return self.session.cookies
+
+    def refresh(self, failed_session: requests.Session):
+        """
+        Перехватывает заголовки и cookies заново. Если несколько потоков получили отказ одновременно,
+        браузер запускает только первый из них
+        """
+        with self._lock:
+            if self.session is failed_session:
+                # старую сессию не закрываем: ею могут пользоваться запросы в других потоках
+                self.session = self._new_session(refresh=True)
+
+    def get(self, url: str, headers: dict | None = None) -> requests.Response:
+        session = self.session
+        response = http_get(session, url, cache=self.cache, throttle=self.throttle, headers=headers,
+                            timeout=self.timeout)
+        if self._capture and response.status_code in AUTH_ERROR_STATUSES:
+            self.refresh(session)
+            response = http_get(self.session, url, cache=self.cache, throttle=self.throttle, headers=headers,
+                                timeout=self.timeout)
+        return response
+
+    def report(self) -> str:
+        report = []
+        if self.cache:
+            report.append(f"cache: {self.cache.report()}")
+        if self.throttle:
+            report.append(f"throttle: {self.throttle.report()}")
+        return "; ".join(report) or "-"
@@ -0,0 +1,24 @@
+from pydantic import TypeAdapter
+from functools import cache
+from typing import Any
+
+
+"""
+Валидация ответов источников прямо из байтов: json разбирает pydantic-core (validate_json), поэтому не строится
+промежуточный dict всего документа (response.json()) и нет второго прохода по нему при создании модели (Model(**data)).
+Схема валидации (TypeAdapter) строится один раз на тип и переиспользуется всеми потоками.
+"""
+
+
+@cache
+def type_adapter(type_: Any) -> TypeAdapter:
+    return TypeAdapter(type_)
+
+
+def validate_json(type_: Any, document: bytes | str):
+    """document (тело ответа, response.content) -> объект type_ (модель pydantic, list[модель], ...)"""
+    return type_adapter(type_).validate_json(document)
+
+
+def validate_python(type_: Any, data):
+    return type_adapter(type_).validate_python(data)
@@ -0,0 +1,318 @@
+from abc import ABC, abstractmethod
+from database.crud.work_queue import WorkQueueCRUD
+from database.session import get_session_factory
+from parsers.data_dir import data_path
+from pathlib import Path
+from threading import Event, Lock, Thread
+from typing import Callable, Iterable, Iterator
+import os
+import socket
+import sqlite3
+import time
+
+
+class Lease:
+    """Шард <shard> очереди <queue>, арендованный воркером <worker> (attempts - номер попытки)"""
+
+    def __init__(self, queue: str, shard: str, worker: str, attempts: int):
+        self.queue = queue
+        self.shard = shard
+        self.worker = worker
+        self.attempts = attempts
+
+    @property
+    def key(self) -> tuple:
+        return self.queue, self.shard
+
+    def __repr__(self):
+        return f"<Lease {self.queue}:{self.shard} worker={self.worker} attempt={self.attempts}>"
+
+
+class ShardDone:
+    # маркер в потоке товаров паука: все товары шарда <lease> уже отданы (см. crawl_leased_shards)
+    def __init__(self, lease: Lease):
+        self.lease = lease
+
+
+def default_worker_id() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+class WorkQueue(ABC):
+    """
+    Очередь шардов для распределённого обхода источника. Координатор кладёт в очередь категории источника (put),
+    воркеры (процессы на одной или нескольких машинах) арендуют их по одной (lease), обходят и подтверждают (ack).
+        - аренда действует <lease_time> секунд. Пока шард в работе, фоновый поток продлевает аренду, поэтому
+          истекает она только у упавшего / зависшего воркера - тогда шард получит другой воркер
+        - fail() возвращает шард в очередь. После <max_attempts> попыток шард помечается failed
+    Хранилище задаётся наследником: SqliteWorkQueue (один файл, воркеры на одной машине) или
+    PostgresWorkQueue (таблица work_queue, воркеры на разных машинах). Наследник реализует методы _put, _clear,
+    _lease, _extend, _finish и stats (абстрактные: неполный наследник не создаётся).
+    """
+
+    def __init__(self, lease_time: float = 600.0, max_attempts: int = 3):
+        self.lease_time = lease_time
+        self.max_attempts = max_attempts
+        self._held = {}  # (queue, shard): Lease - аренды этого процесса, которые продлевает фоновый поток
+        self._held_lock = Lock()
+        self._stop = Event()
+        self._heartbeat = None
+
+    def put(self, queue: str, shards: Iterable[str], reset: bool = False) -> int:
+        """
+        Добавляет шарды, которых ещё нет в очереди. reset=True - начать обход заново (очередь очищается).
+        Возвращает число добавленных шардов
+        """
+        if reset:
+            self._clear(queue)
+        return self._put(queue, [str(shard) for shard in shards])
+
+    def lease(self, queue: str, worker: str | None = None) -> Lease | None:
+        """Следующий свободный шард (или шард с истёкшей арендой). None - свободных шардов нет"""
+        worker = worker or default_worker_id()
+        row = self._lease(queue, worker)
+        if row is None:
+            return None
+        lease = Lease(queue, row[0], worker, row[1])
+        with self._held_lock:
+            self._held[lease.key] = lease
+        self._start_heartbeat()
+        return lease
+
+    def ack(self, lease: Lease) -> bool:
+        """Шард обойдён. False - аренда была потеряна (истекла), шард мог получить другой воркер"""
+        self._release(lease)
+        done = self._finish(lease, 'done')
+        if not done:
+            print(f"Work queue -> lease lost {lease}")
+        return done
+
+    def fail(self, lease: Lease, error: str | None = None) -> bool:
+        self._release(lease)
+        status = 'failed' if lease.attempts >= self.max_attempts else 'pending'
+        return self._finish(lease, status, error)
+
+    def leases(self, queue: str, worker: str | None = None, poll: float = 10.0) -> Iterator[Lease]:
+        """
+        Арендует шарды по одному, пока очередь не опустеет. Если свободных шардов нет, но другие воркеры ещё
+        держат аренды, ждёт <poll> секунд: аренда упавшего воркера истечёт и шард вернётся в работу.
+        Собственные неподтверждённые аренды (товары ещё пишутся в базу) не ждёт
+        """
+        while True:
+            lease = self.lease(queue, worker)
+            if lease is not None:
+                yield lease
+                continue
+            stats = self.stats(queue)
+            with self._held_lock:
+                own = sum(1 for key in self._held if key[0] == queue)  # ещё не подтверждены этим процессом
+            if not stats.get('pending', 0) and not stats.get('expired', 0) and stats.get('leased', 0) <= own:
+                return
+            time.sleep(poll)
+
+    def _release(self, lease: Lease):
+        with self._held_lock:
+            self._held.pop(lease.key, None)
+
+    def _start_heartbeat(self):
+        if self._heartbeat is None:
+            self._heartbeat = Thread(target=self._extend_leases, name='work-queue-heartbeat', daemon=True)
+            self._heartbeat.start()
+
+    def _extend_leases(self):
+        # продлеваем аренды втрое чаще, чем они истекают
+        while not self._stop.wait(self.lease_time / 3):
+            with self._held_lock:
+                leases = list(self._held.values())
+            for lease in leases:
+                try:
+                    if not self._extend(lease):
+                        print(f"Work queue -> lease lost {lease}")
+                        self._release(lease)
+                except Exception as _ex:
+                    print(f"Work queue -> extend lease error! {_ex}")
+
+    def close(self):
+        self._stop.set()
+
+    @abstractmethod
+    def _put(self, queue: str, shards: list[str]) -> int:
+        raise NotImplementedError
+
+    @abstractmethod
+    def _clear(self, queue: str):
+        raise NotImplementedError
+
+    @abstractmethod
+    def _lease(self, queue: str, worker: str) -> tuple | None:
+        # -> (shard, attempts) | None
+        raise NotImplementedError
+
+    @abstractmethod
+    def _extend(self, lease: Lease) -> bool:
+        raise NotImplementedError
+
+    @abstractmethod
+    def _finish(self, lease: Lease, status: str, error: str | None = None) -> bool:
+        raise NotImplementedError
+
+    @abstractmethod
+    def stats(self, queue: str) -> dict:
+        # -> {'pending': int, 'leased': int, 'expired': int, 'done': int, 'failed': int} (только ненулевые)
+        raise NotImplementedError
+
+
+class SqliteWorkQueue(WorkQueue):
+    """
+    Очередь в файле SQLite (WAL). Воркеры - процессы на одной машине. Аренда выполняется в транзакции
+    BEGIN IMMEDIATE: файл блокируется на запись, поэтому два процесса не получат один шард.
+    """
+
+    def __init__(self, path: Path | str, lease_time: float = 600.0, max_attempts: int = 3):
+        super().__init__(lease_time=lease_time, max_attempts=max_attempts)
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS work_queue ("
+                           "queue TEXT NOT NULL, shard TEXT NOT NULL, "
+                           "id INTEGER NOT NULL, status TEXT NOT NULL DEFAULT 'pending', worker TEXT, "
+                           "leased_until REAL, attempts INTEGER NOT NULL DEFAULT 0, error TEXT, "
+                           "PRIMARY KEY (queue, shard))")
+
+    def _transaction(self, statements: Callable[[sqlite3.Connection], object]):
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                result = statements(self._conn)
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+            return result
+
+    def _put(self, queue: str, shards: list[str]) -> int:
+        def statements(conn):
+            # id сохраняет порядок шардов: аренда выдаёт их в том порядке, в котором их положил координатор
+            next_id = conn.execute("SELECT coalesce(max(id), 0) + 1 FROM work_queue WHERE queue = ?",
+                                   (queue,)).fetchone()[0]
+            before = conn.total_changes
+            conn.executemany("INSERT OR IGNORE INTO work_queue (queue, shard, id) VALUES (?, ?, ?)",
+                             [(queue, shard, next_id + i) for i, shard in enumerate(shards)])
+            return conn.total_changes - before
+        return self._transaction(statements)
+
+    def _clear(self, queue: str):
+        self._transaction(lambda conn: conn.execute("DELETE FROM work_queue WHERE queue = ?", (queue,)))
+
+    def _lease(self, queue: str, worker: str) -> tuple | None:
+        def statements(conn):
+            now = time.time()
+            conn.execute("UPDATE work_queue SET status = 'failed', worker = NULL, error = 'lease expired' "
+                         "WHERE queue = ? AND status = 'leased' AND leased_until < ? AND attempts >= ?",
+                         (queue, now, self.max_attempts))
+            row = conn.execute("SELECT shard, attempts FROM work_queue "
+                               "WHERE queue = ? AND attempts < ? "
+                               "AND (status = 'pending' OR (status = 'leased' AND leased_until < ?)) "
+                               "ORDER BY id LIMIT 1", (queue, self.max_attempts, now)).fetchone()
+            if row is None:
+                return None
+            conn.execute("UPDATE work_queue SET status = 'leased', worker = ?, leased_until = ?, attempts = ? "
+                         "WHERE queue = ? AND shard = ?", (worker, now + self.lease_time, row[1] + 1, queue, row[0]))
+            return row[0], row[1] + 1
+        return self._transaction(statements)
+
+    def _extend(self, lease: Lease) -> bool:
+        return self._transaction(lambda conn: conn.execute(
+            "UPDATE work_queue SET leased_until = ? WHERE queue = ? AND shard = ? AND worker = ? AND status = 'leased'",
+            (time.time() + self.lease_time, lease.queue, lease.shard, lease.worker)
+        ).rowcount > 0)
+
+    def _finish(self, lease: Lease, status: str, error: str | None = None) -> bool:
+        return self._transaction(lambda conn: conn.execute(
+            "UPDATE work_queue SET status = ?, leased_until = NULL, error = ?, worker = ? "
+            "WHERE queue = ? AND shard = ? AND worker = ? AND status = 'leased'",
+            (status, error, lease.worker if status == 'done' else None, lease.queue, lease.shard, lease.worker)
+        ).rowcount > 0)
+
+    def stats(self, queue: str) -> dict:
+        with self._lock:
+            rows = self._conn.execute("SELECT CASE WHEN status = 'leased' AND leased_until < ? THEN 'expired' "
+                                      "ELSE status END AS state, count(*) FROM work_queue WHERE queue = ? "
+                                      "GROUP BY state", (time.time(), queue)).fetchall()
+        return dict(rows)
+
+    def close(self):
+        super().close()
+        self._conn.close()
+
+
+class PostgresWorkQueue(WorkQueue):
+    """
+    Очередь в таблице work_queue базы данных (database.models.work_queue). Воркеры могут работать на разных машинах:
+    шард арендуется запросом SELECT ... FOR UPDATE SKIP LOCKED (database.crud.work_queue.WorkQueueCRUD).
+    <session_factory> - фабрика сессий database.session.get_session_factory
+    """
+
+    def __init__(self, session_factory, lease_time: float = 600.0, max_attempts: int = 3):
+        super().__init__(lease_time=lease_time, max_attempts=max_attempts)
+        self._session_factory = session_factory
+
+    def _execute(self, method: str, *args, **kwargs):
+        with self._session_factory() as session:
+            result = getattr(WorkQueueCRUD(session), method)(*args, **kwargs)
+            session.commit()
+        return result
+
+    def _put(self, queue: str, shards: list[str]) -> int:
+        return self._execute('put', queue, shards)
+
+    def _clear(self, queue: str):
+        self._execute('clear', queue)
+
+    def _lease(self, queue: str, worker: str) -> tuple | None:
+        self._execute('expire_exhausted', queue, self.max_attempts)
+        row = self._execute('lease', queue, worker, self.lease_time, self.max_attempts)
+        return tuple(row) if row else None
+
+    def _extend(self, lease: Lease) -> bool:
+        return self._execute('extend', lease.queue, lease.shard, lease.worker, self.lease_time)
+
+    def _finish(self, lease: Lease, status: str, error: str | None = None) -> bool:
+        return self._execute('finish', lease.queue, lease.shard, lease.worker, status, error)
+
+    def stats(self, queue: str) -> dict:
+        return self._execute('count_by_status', queue)
+
+
+def crawl_leased_shards(work_queue: WorkQueue, queue: str, crawl_shard: Callable[[str], Iterable],
+                        worker: str | None = None) -> Iterator:
+    """
+    Генератор для parsers.pipeline.IngestionPipeline в режиме воркера: товары арендованных шардов
+    (crawl_shard(shard) - метод паука), после всех товаров шарда - маркер ShardDone. Обработчик подтверждает шард
+    (ack), когда товары до маркера записаны в базу. Шард, обход которого упал, возвращается в очередь (fail)
+    """
+    for lease in work_queue.leases(queue, worker):
+        print(f"Shard {lease.shard} -> start (attempt {lease.attempts})")
+        try:
+            yield from crawl_shard(lease.shard)
+        except Exception as _ex:
+            print(f"Shard {lease.shard} -> error! {_ex}")
+            work_queue.fail(lease, error=repr(_ex))
+            continue
+        yield ShardDone(lease)
+    print(f"Work queue {queue} -> empty {work_queue.stats(queue)}")
+
+
+def open_work_queue(backend: str, lease_time: float = 600.0, max_attempts: int = 3) -> WorkQueue:
+    """
+    Очередь по строке настройки (строка, а не объект, передаётся в дочерние процессы run.py):
+        'postgres'           - таблица work_queue в схеме catalog (воркеры на нескольких машинах)
+        'sqlite' | <путь>    - файл SQLite (по умолчанию work_queue.sqlite в parsers.data_dir, воркеры на одной машине)
+    """
+    if backend == 'postgres':
+        return PostgresWorkQueue(get_session_factory('catalog'), lease_time=lease_time, max_attempts=max_attempts)
+    path = data_path("work_queue.sqlite") if backend == 'sqlite' else Path(backend)
+    return SqliteWorkQueue(path, lease_time=lease_time, max_attempts=max_attempts)
@@ -1,10 +1,33 @@
-from parsers.edostavka_by.controller import main as edostavka_by_run
-from parsers.gippo_market_by.controller import main as gippo_market_by_run
-from parsers.green_dostavka_by.controller import main as green_dostavka_by_run
+import importlib
+import multiprocessing
 import schedule
+import signal
 import time
 
 
+"""
+Каждый источник парсится в отдельном процессе, все источники - одновременно (хосты разные, поэтому общее время
+равно времени самого долгого источника). Процессы создаются через spawn: в дочернем процессе заново создаются
+движок базы данных, пул соединений и браузер.
+    - источник, который работает дольше своего таймаута, останавливается: SIGTERM превращается в дочернем процессе
+      в SystemExit, поэтому контроллер успевает записать буфер цен и закрыть журнал обхода (finally). Через
+      SHUTDOWN_GRACE секунд процесс, который так и не завершился, убивается
+    - упавший процесс (код выхода != 0) перезапускается не больше MAX_RESTARTS раз. Обход продолжается с первого
+      незаписанного товара (журнал обхода parsers.checkpoint.CrawlCheckpoint)
+    - в конце выводится статус и время работы каждого источника
+run_workers - распределённый режим: категории источников раздаются через очередь нескольким воркерам
+(parsers.work_queue), в том числе на разных машинах.
+"""
+SOURCES = {
+    'edostavka.by': 'parsers.edostavka_by.controller',
+    'gippo-market.by': 'parsers.gippo_market_by.controller',
+    'green-dostavka.by': 'parsers.green_dostavka_by.controller',
+}
+SOURCE_TIMEOUT = 6 * 3600  # секунд на один запуск источника
+MAX_RESTARTS = 2
+SHUTDOWN_GRACE = 120  # секунд на корректное завершение источника после SIGTERM
+
+
 def timer_decorator(func):
     def wrapper(*args, **kwargs):
         start_time = time.time()
@@ -15,28 +38,128 @@ def timer_decorator(func):
         minutes = int(total_seconds // 60)
         seconds = int(total_seconds % 60)
 
-        print(f"Время выполнения {func.__name__}: {minutes:02d}:{seconds:02d}")
+        print(f"Время выполнения {func.__module__}.{func.__name__}: {minutes:02d}:{seconds:02d}")
         return result
 
     return wrapper
 
 
+def _exit_on_sigterm(signum, frame):
+    # повторный SIGTERM не должен прервать уже начатое завершение (запись буфера цен)
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+    print(f"Signal {signum} -> shutting down")
+    raise SystemExit(128 + signum)
+
+
+def run_source(module_name: str, main_kwargs: dict, function: str = 'main'):
+    # точка входа дочернего процесса: модуль контроллера импортируется уже в нём.
+    # Действие SIGTERM по умолчанию завершает процесс сразу, без finally - буферизованные цены были бы потеряны
+    signal.signal(signal.SIGTERM, _exit_on_sigterm)
+    controller = importlib.import_module(module_name)
+    timer_decorator(getattr(controller, function))(**main_kwargs)
+
+
+def format_duration(total_seconds: float) -> str:
+    hours, rest = divmod(int(total_seconds), 3600)
+    return f"{hours:02d}:{rest // 60:02d}:{rest % 60:02d}"
+
+
+def run_sources(sources: dict = None, timeouts: dict = None, default_timeout: float = SOURCE_TIMEOUT,
+                max_restarts: int = MAX_RESTARTS, function: str = 'main', shutdown_grace: float = SHUTDOWN_GRACE,
+                **main_kwargs) -> dict:
+    """
+    Запускает controller.main (или другую функцию контроллера <function>) каждого источника в отдельном процессе
+    и ждёт завершения всех.
+    sources = {source_name: module_name}, timeouts = {source_name: seconds} (иначе default_timeout),
+    main_kwargs передаются в каждый controller.main (например, price_refresh=True).
+    Источник, остановленный по таймауту, завершается не дольше <shutdown_grace> секунд, остальные источники в это
+    время проверяются как обычно.
+    return {source_name: {'status': 'ok' | 'failed' | 'timeout', 'attempts': int, 'duration': float}, ...}
+    """
+    sources = sources or SOURCES
+    timeouts = timeouts or {}
+    context = multiprocessing.get_context('spawn')
+    jobs = {name: {'module': module_name, 'process': None, 'attempts': 0, 'status': 'running',
+                   'first_start': None, 'attempt_start': None, 'kill_at': None, 'duration': 0.0}
+            for name, module_name in sources.items()}
+
+    def start(name: str):
+        job = jobs[name]
+        job['attempts'] += 1
+        job['process'] = context.Process(target=run_source, args=(job['module'], main_kwargs, function),
+                                         name=name)
+        job['process'].start()
+        job['attempt_start'] = time.monotonic()
+        job['kill_at'] = None
+        job['first_start'] = job['first_start'] or job['attempt_start']
+        print(f"Source {name} -> started (attempt {job['attempts']}, pid {job['process'].pid})")
+
+    def finish(name: str, status: str):
+        job = jobs[name]
+        job['process'] = None
+        job['status'] = status
+        job['duration'] = time.monotonic() - job['first_start']
+        print(f"Source {name} -> {status} in {format_duration(job['duration'])}")
+
+    for name in jobs:
+        start(name)
+
+    while any(job['process'] is not None for job in jobs.values()):
+        for name, job in jobs.items():
+            process = job['process']
+            if process is None:
+                continue
+            process.join(timeout=1)
+            if process.is_alive():
+                if job['kill_at'] is not None:
+                    # источник завершается после SIGTERM: ждать его здесь нельзя, остальные источники остались бы
+                    # без проверки. Срок проверяется на следующих проходах цикла
+                    if time.monotonic() >= job['kill_at']:
+                        print(f"Source {name} -> did not stop in {shutdown_grace}s after SIGTERM, killing")
+                        process.kill()
+                        process.join()
+                        finish(name, 'timeout')
+                elif time.monotonic() - job['attempt_start'] > timeouts.get(name, default_timeout):
+                    process.terminate()
+                    job['kill_at'] = time.monotonic() + shutdown_grace
+                continue
+            if job['kill_at'] is not None:
+                # завершился сам после SIGTERM (код выхода 128 + SIGTERM) - не перезапускаем
+                finish(name, 'timeout')
+            elif process.exitcode == 0:
+                finish(name, 'ok')
+            elif job['attempts'] <= max_restarts:
+                print(f"Source {name} -> crashed (exit code {process.exitcode}), restarting")
+                start(name)
+            else:
+                finish(name, 'failed')
+
+    print("Scraping report:")
+    for name, job in jobs.items():
+        print(f"    {name:<20} {job['status']:<8} attempts={job['attempts']}  {format_duration(job['duration'])}")
+    return {name: {'status': job['status'], 'attempts': job['attempts'], 'duration': job['duration']}
+            for name, job in jobs.items()}
+
+
+def run_workers(work_queue: str = 'postgres', workers: int = 2, sources: dict = None, coordinator: bool = True,
+                reset: bool = True, **main_kwargs) -> dict:
+    """
+    Распределённый обход (см. parsers.work_queue): координатор кладёт категории каждого источника в очередь
+    <work_queue>, затем <workers> процессов-воркеров на источник арендуют категории и обходят их.
+    На других машинах запускаются только воркеры: run_workers('postgres', coordinator=False).
+    Упавший воркер перезапускается, а его категории после истечения аренды получает другой воркер.
+    """
+    sources = sources or SOURCES
+    if coordinator:
+        run_sources(sources, function='enqueue_shards', work_queue=work_queue, reset=reset)
+    worker_sources = {f"{name}#{i}": module_name for name, module_name in sources.items()
+                      for i in range(1, workers + 1)}
+    return run_sources(worker_sources, work_queue=work_queue, **main_kwargs)
+
+
 def start_scrapping():
     try:
-        decorated_func = timer_decorator(edostavka_by_run)()
-        decorated_func()
-    except Exception as ex:
-        print(ex)
-    #
-    try:
-        decorated_func = timer_decorator(gippo_market_by_run)
-        decorated_func()
-    except Exception as ex:
-        print(ex)
-    try:
-        decorated_func = timer_decorator(green_dostavka_by_run)
-        decorated_func()
-
+        run_sources()
     except Exception as ex:
         print(ex)
 
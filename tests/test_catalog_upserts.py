@@ -0,0 +1,43 @@
+from database.crud.catalog import CatalogCRUD
+from sqlalchemy.dialects import postgresql
+from unittest import mock
+import unittest
+
+
+def conflict_target(stmt) -> tuple[str, dict]:
+    # текст ON CONFLICT (...) и параметры, которые в нём встречаются
+    compiled = stmt.compile(dialect=postgresql.dialect())
+    sql = str(compiled)
+    target = sql[sql.index("ON CONFLICT"):sql.index(" DO ", sql.index("ON CONFLICT"))]
+    used = {name: value for name, value in compiled.params.items() if f"%({name})s" in target}
+    return target, used
+
+
+class ConflictTargetTest(unittest.TestCase):
+    """
+    Цель ON CONFLICT с выражением должна совпадать с выражением уникального индекса буквально: параметр
+    (coalesce(parent_id, $1)) ломает upsert, когда подготовленный запрос переходит на generic план
+    """
+
+    def setUp(self):
+        self.session = mock.MagicMock()
+        self.crud = CatalogCRUD(self.session)
+
+    def executed(self):
+        return self.session.execute.call_args[0][0]
+
+    def test_categories_conflict_target_has_no_params(self):
+        self.crud.upsert_categories([{'source_id': 1, 'name': 'Молоко', 'parent_id': None}])
+        target, used = conflict_target(self.executed())
+        self.assertEqual(used, {})
+        self.assertIn("coalesce(parent_id, 0)", target)
+
+    def test_property_values_conflict_target_has_no_params(self):
+        self.crud.save_product_property_values_relations(product_id=1, property_id=2, values=['3.2%', None])
+        target, used = conflict_target(self.executed())
+        self.assertEqual(used, {})
+        self.assertIn("md5(coalesce(value, ''))", target)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,57 @@
+from parsers.checkpoint import CrawlCheckpoint
+from pathlib import Path
+import sqlite3
+import tempfile
+import unittest
+
+
+class CrawlCheckpointTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = Path(self.tmp.name) / "checkpoint.sqlite"
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def interrupted_run(self, started_at: str | None = None):
+        checkpoint = CrawlCheckpoint(self.path)
+        checkpoint.mark_done(['1', '2'])
+        checkpoint.close()
+        if started_at:
+            with sqlite3.connect(self.path) as conn:
+                conn.execute("UPDATE runs SET started_at = ?", (started_at,))
+            conn.close()
+
+    def test_resumes_recent_unfinished_run(self):
+        self.interrupted_run()
+        checkpoint = CrawlCheckpoint(self.path)
+        self.assertTrue(checkpoint.resumed)
+        self.assertTrue(checkpoint.is_done('1'))
+        checkpoint.close()
+
+    def test_starts_new_run_instead_of_stale_one(self):
+        self.interrupted_run(started_at='2000-01-01 00:00:00')
+        checkpoint = CrawlCheckpoint(self.path, max_age=3600)
+        self.assertFalse(checkpoint.resumed)
+        self.assertFalse(checkpoint.is_done('1'))
+        checkpoint.close()
+
+    def test_no_max_age_resumes_any_run(self):
+        self.interrupted_run(started_at='2000-01-01 00:00:00')
+        checkpoint = CrawlCheckpoint(self.path, max_age=None)
+        self.assertTrue(checkpoint.is_done('2'))
+        checkpoint.close()
+
+    def test_finished_run_is_not_resumed(self):
+        checkpoint = CrawlCheckpoint(self.path)
+        checkpoint.mark_done(['1'])
+        checkpoint.finish()
+        checkpoint.close()
+        checkpoint = CrawlCheckpoint(self.path)
+        self.assertFalse(checkpoint.is_done('1'))
+        checkpoint.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
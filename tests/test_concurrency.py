@@ -0,0 +1,25 @@
+from parsers.concurrency import ordered_map
+import unittest
+
+
+def failing_input(count: int):
+    # как листинг, у которого запрос страницы после <count> товаров упал
+    yield from range(count)
+    raise ConnectionError('page request failed')
+
+
+class OrderedMapTest(unittest.TestCase):
+
+    def test_keeps_order(self):
+        self.assertEqual(list(ordered_map(lambda x: x * 2, range(50), max_workers=4)), [x * 2 for x in range(50)])
+
+    def test_input_error_after_started_calls(self):
+        results = []
+        with self.assertRaises(ConnectionError):
+            for result in ordered_map(lambda x: x, failing_input(5), max_workers=4, window=8):
+                results.append(result)
+        self.assertEqual(results, list(range(5)))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,80 @@
+from parsers import crawl_runner
+from parsers.price_record import PriceRecord
+from parsers.work_queue import Lease, ShardDone
+from unittest import mock
+import unittest
+
+
+class FakePriceBuffer:
+    # как PriceBuffer: отложенные вызовы выполняются только после записи цен (flush)
+    def __init__(self):
+        self.callbacks = []
+
+    def call_after_flush(self, callback):
+        self.callbacks.append(callback)
+
+    def flush(self):
+        callbacks, self.callbacks = self.callbacks, []
+        for callback in callbacks:
+            callback()
+
+
+class SaveProductsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.service_data = mock.Mock(price_buffer=FakePriceBuffer())
+        self.saved = []
+        self.checkpoint = mock.Mock()
+        self.work_queue = mock.Mock()
+
+    def save_products(self, products):
+        crawl_runner.save_products(self.service_data, products,
+                                   save_product=lambda service_data, product: self.saved.append(product),
+                                   product_key=lambda product: product.article,
+                                   checkpoint=self.checkpoint, work_queue=self.work_queue)
+
+    def test_price_record_writes_price_of_known_product(self):
+        self.service_data.articles = {'1': 10}
+        self.save_products([PriceRecord(article='1', price=1.5), PriceRecord(article='2', price=2.0)])
+        self.assertEqual(self.saved, [])
+        self.service_data.save_product_price.assert_called_once()
+        self.assertEqual(self.service_data.save_product_price.call_args.kwargs['product_id'], 10)
+
+        self.service_data.price_buffer.flush()
+        self.checkpoint.mark_done.assert_called_once_with(['1', '2'])
+
+    def test_marks_and_acks_only_after_flush(self):
+        lease = mock.Mock(spec=Lease)
+        products = [mock.Mock(article='1'), mock.Mock(article='2'), ShardDone(lease)]
+        self.save_products(products)
+        self.assertEqual(self.saved, products[:2])
+        self.checkpoint.mark_done.assert_not_called()
+        self.work_queue.ack.assert_not_called()
+
+        self.service_data.price_buffer.flush()
+        self.checkpoint.mark_done.assert_called_once_with(['1', '2'])
+        self.work_queue.ack.assert_called_once_with(lease)
+
+
+class RunCrawlTest(unittest.TestCase):
+
+    def run_crawl(self, **kwargs):
+        with mock.patch.object(crawl_runner, 'get_session_factory'), \
+                mock.patch.object(crawl_runner, 'CategoryService') as service, \
+                mock.patch.object(crawl_runner, 'open_work_queue'), \
+                mock.patch.object(crawl_runner, 'crawl_leased_shards'), \
+                mock.patch.object(crawl_runner, 'CrawlCheckpoint'), \
+                mock.patch.object(crawl_runner, 'IngestionPipeline'):
+            crawl_runner.run_crawl('source', mock.Mock(), save_product=mock.Mock(), checkpoint_path='checkpoint',
+                                   **kwargs)
+        return service.call_args.kwargs
+
+    def test_worker_does_not_preload_articles(self):
+        self.assertFalse(self.run_crawl(work_queue='sqlite')['preload_articles'])
+        # режиму обновления цен артикулы нужны и в воркере
+        self.assertTrue(self.run_crawl(work_queue='sqlite', price_refresh=True)['preload_articles'])
+        self.assertTrue(self.run_crawl()['preload_articles'])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,29 @@
+from database.engine import get_engine_options
+from unittest import mock
+import os
+import unittest
+
+
+class EngineOptionsTest(unittest.TestCase):
+
+    def test_empty_pool_settings_fall_back_to_defaults(self):
+        with mock.patch.dict('os.environ', {'DB_POOL_SIZE': '', 'DB_POOL_TIMEOUT': ' ', 'DB_MAX_OVERFLOW': '3'}):
+            options = get_engine_options('postgresql+psycopg')
+        self.assertEqual(options['pool_size'], 5)
+        self.assertEqual(options['pool_timeout'], 30)
+        self.assertEqual(options['max_overflow'], 3)
+
+    def test_empty_prepare_threshold_disables_prepares(self):
+        with mock.patch.dict('os.environ', {'DB_PREPARE_THRESHOLD': ''}):
+            options = get_engine_options('postgresql+psycopg')
+        self.assertIsNone(options['connect_args']['prepare_threshold'])
+
+    def test_prepare_threshold_default(self):
+        with mock.patch.dict('os.environ'):
+            os.environ.pop('DB_PREPARE_THRESHOLD', None)
+            options = get_engine_options('postgresql+psycopg')
+        self.assertEqual(options['connect_args']['prepare_threshold'], 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,34 @@
+from parsers import next_data
+from pydantic import BaseModel, ValidationError
+from unittest import mock
+import unittest
+
+
+class Page(BaseModel):
+    page: str
+
+
+def document(payload: str) -> bytes:
+    return f'<html><script id="__NEXT_DATA__" type="application/json">{payload}</script></html>'.encode('utf-8')
+
+
+class ValidateNextDataTest(unittest.TestCase):
+
+    def test_fast_path(self):
+        with mock.patch.object(next_data, 'parse_next_data') as parse:
+            self.assertEqual(next_data.validate_next_data(document('{"page": "/"}'), Page).page, '/')
+        parse.assert_not_called()
+
+    def test_schema_error_does_not_fall_back(self):
+        with mock.patch.object(next_data, 'parse_next_data') as parse, self.assertRaises(ValidationError):
+            next_data.validate_next_data(document('{"other": 1}'), Page)
+        parse.assert_not_called()
+
+    def test_malformed_slice_falls_back(self):
+        with mock.patch.object(next_data, 'parse_next_data', return_value={'page': '/'}) as parse:
+            self.assertEqual(next_data.validate_next_data(document('{"page": '), Page).page, '/')
+        parse.assert_called_once()
+
+
+if __name__ == "__main__":
+    unittest.main()
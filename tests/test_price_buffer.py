@@ -0,0 +1,30 @@
+from parsers.price_buffer import PriceBuffer
+from pathlib import Path
+from unittest import mock
+import json
+import os
+import tempfile
+import unittest
+
+
+class PriceBufferDumpTest(unittest.TestCase):
+
+    def test_dump_keeps_rows_and_last_seen_updates(self):
+        buffer = PriceBuffer(session_factory=mock.Mock(), change_only=True)
+        buffer.remember(1, 2.5, row_id=10, date_time='2026-01-01 00:00:00')
+        buffer.add(1, 2.5, '2026-01-02 00:00:00')  # цена не изменилась - только last_seen
+        buffer.add(2, 3.0, '2026-01-02 00:00:00')  # новая строка
+        self.assertEqual(len(buffer), 2)
+
+        with tempfile.TemporaryDirectory() as tmp, mock.patch.dict(os.environ, {'PARSERS_DATA_DIR': tmp}):
+            file_path = buffer.dump_pending()
+            self.assertEqual(file_path.parent, Path(tmp) / "unsaved_prices")
+            dumped = json.loads(file_path.read_text(encoding='utf-8'))
+
+        self.assertEqual([row['product_id'] for row in dumped['rows']], [2])
+        self.assertEqual(dumped['touch'], [{'id': 10, 'date_time': '2026-01-01 00:00:00',
+                                            'last_seen': '2026-01-02 00:00:00'}])
+
+
+if __name__ == "__main__":
+    unittest.main()
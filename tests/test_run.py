@@ -0,0 +1,48 @@
+from pathlib import Path
+import multiprocessing
+import run
+import tempfile
+import time
+import unittest
+
+
+def main(marker: str):
+    # контроллер-заглушка для дочернего процесса, поведение выбирается по имени источника (имя процесса):
+    #   fast  - завершается за пару секунд
+    #   stuck - работает дольше таймаута и не успевает завершиться после SIGTERM
+    #   иначе - работает дольше таймаута, finally отмечает завершение
+    name = multiprocessing.current_process().name
+    if name == 'fast':
+        time.sleep(2)
+        return
+    try:
+        Path(marker).write_text('started')
+        time.sleep(60)
+    finally:
+        if name == 'stuck':
+            time.sleep(60)
+        Path(marker).write_text('flushed')
+
+
+class RunSourcesTimeoutTest(unittest.TestCase):
+
+    def test_timeout_runs_controller_shutdown(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            marker = Path(tmp) / "marker"
+            report = run.run_sources({'slow': __name__}, timeouts={'slow': 3}, marker=str(marker))
+            self.assertEqual(report['slow']['status'], 'timeout')
+            self.assertEqual(report['slow']['attempts'], 1)
+            self.assertEqual(marker.read_text(), 'flushed')
+
+    def test_shutdown_does_not_block_other_sources(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            report = run.run_sources({'stuck': __name__, 'fast': __name__}, timeouts={'stuck': 1},
+                                     shutdown_grace=8, marker=str(Path(tmp) / "marker"))
+            self.assertEqual(report['stuck']['status'], 'timeout')
+            self.assertEqual(report['fast']['status'], 'ok')
+            # fast завершился, пока stuck ещё ждал истечения shutdown_grace
+            self.assertLess(report['fast']['duration'], report['stuck']['duration'] - 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,64 @@
+from parsers.throttle import Throttle
+import requests
+import unittest
+
+
+class ThrottleSlotTest(unittest.TestCase):
+
+    def setUp(self):
+        # один слот на хост: утёкший слот заблокировал бы следующий acquire()
+        self.throttle = Throttle(retries=1, backoff=0, concurrency=1, max_concurrency=1)
+        self.url = "https://example.com/page"
+
+    def assert_slot_free(self):
+        self.assertEqual(self.throttle.for_host(self.url)._active, 0)
+
+    def test_slot_released_after_requests_error(self):
+        def send():
+            raise requests.exceptions.ChunkedEncodingError("connection broken")
+
+        with self.assertRaises(requests.exceptions.ChunkedEncodingError):
+            self.throttle.call(self.url, send)
+        self.assert_slot_free()
+        self.assertEqual(self.throttle.retried, 1)
+
+    def test_slot_released_after_other_error(self):
+        calls = []
+
+        def send():
+            calls.append(1)
+            raise ValueError("cache hook failed")
+
+        with self.assertRaises(ValueError):
+            self.throttle.call(self.url, send)
+        self.assert_slot_free()
+        self.assertEqual(len(calls), 1)  # не requests - не повторяется
+
+    def test_retry_after_error_then_success(self):
+        response = requests.Response()
+        response.status_code = 200
+        results = [requests.exceptions.ContentDecodingError("bad gzip"), response]
+
+        def send():
+            result = results.pop(0)
+            if isinstance(result, Exception):
+                raise result
+            return result
+
+        self.assertIs(self.throttle.call(self.url, send), response)
+        self.assert_slot_free()
+
+    def test_retried_response_closed(self):
+        busy, ok = requests.Response(), requests.Response()
+        busy.status_code, ok.status_code = 503, 200
+        closed = []
+        busy.close = lambda: closed.append(busy)
+        results = [busy, ok]
+
+        self.assertIs(self.throttle.call(self.url, lambda: results.pop(0)), ok)
+        self.assertEqual(closed, [busy])
+        self.assert_slot_free()
+
+
+if __name__ == "__main__":
+    unittest.main()
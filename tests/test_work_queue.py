@@ -0,0 +1,47 @@
+from parsers.work_queue import WorkQueue, SqliteWorkQueue
+from pathlib import Path
+import tempfile
+import unittest
+
+
+class WorkQueueBackendTest(unittest.TestCase):
+
+    def test_incomplete_backend_fails_on_creation(self):
+        class NoStatsQueue(WorkQueue):
+            def _put(self, queue, shards): return 0
+            def _clear(self, queue): pass
+            def _lease(self, queue, worker): return None
+            def _extend(self, lease): return True
+            def _finish(self, lease, status, error=None): return True
+
+        with self.assertRaises(TypeError):
+            NoStatsQueue()
+
+
+class SqliteWorkQueueTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.queue = SqliteWorkQueue(Path(self.tmp.name) / "work_queue.sqlite", max_attempts=2)
+
+    def tearDown(self):
+        self.queue.close()
+        self.tmp.cleanup()
+
+    def test_lease_ack_and_retry(self):
+        self.assertEqual(self.queue.put('source', ['a', 'b'], reset=True), 2)
+        first = self.queue.lease('source', 'worker-1')
+        second = self.queue.lease('source', 'worker-2')
+        self.assertEqual({first.shard, second.shard}, {'a', 'b'})
+        self.assertIsNone(self.queue.lease('source', 'worker-3'))
+
+        self.assertTrue(self.queue.ack(first))
+        self.queue.fail(second, error='boom')  # первая попытка - шард возвращается в очередь
+        retry = self.queue.lease('source', 'worker-3')
+        self.assertEqual(retry.shard, second.shard)
+        self.queue.fail(retry, error='boom')  # попытки исчерпаны
+        self.assertEqual(self.queue.stats('source'), {'done': 1, 'failed': 1})
+
+
+if __name__ == "__main__":
+    unittest.main()